@@ -1,18 +1,42 @@
 #!/usr/bin/env python3
 import os
+import shlex
 import sys
-from importlib import import_module
 from pathlib import Path
-from pkgutil import iter_modules
+from typing import List, Optional
 
 from aws_cdk import core as cdk
-from brownie import project
 
+from yearn_simulations_infra.cache_volume_stack import CacheVolumeStack
+from yearn_simulations_infra.container_image import stage_image_context
+from yearn_simulations_infra.cron import CronSchedule
+from yearn_simulations_infra.fargate_profiles import (
+    ARCHITECTURES,
+    X86_64,
+    FargateProfile,
+)
+from yearn_simulations_infra.prescaling import Prescaling
+from yearn_simulations_infra.rightsizing import load_profiles
+from yearn_simulations_infra.script_discovery import (
+    discover_scheduled_scripts,
+    discover_scheduled_scripts_with_brownie,
+)
+from yearn_simulations_infra.simulation_cache_stack import SimulationCacheStack
+from yearn_simulations_infra.stack_registry import StackRegistry
+from yearn_simulations_infra.task_launcher_stack import TaskLauncherStack
+from yearn_simulations_infra.task_metrics_stack import TaskMetricsStack
+from yearn_simulations_infra.task_packing import oversized_stacks
+from yearn_simulations_infra.work_queue import WorkQueueScaling
+from yearn_simulations_infra.yearn_scheduled_task import INFRA_RUNTIME_PATH
 from yearn_simulations_infra.yearn_simulations_infra_stack import (
+    HARVEST_BOT_SCHEDULE,
+    SERVICE_RUN_MODE,
+    RpcProxyStack,
     SharedStack,
     YearnHarvestBotInfraStack,
     YearnSimScheduledTasksInfraStack,
     YearnSimulationsInfraStack,
+    script_schedules,
 )
 
 app = cdk.App()
@@ -20,101 +44,416 @@ app = cdk.App()
 
 class ApplicationStack(cdk.Stack):
     def __init__(
-        self, scope: cdk.Construct, construct_id: str, vpc_id: str, path: Path, **kwargs
+        self,
+        scope: cdk.Construct,
+        construct_id: str,
+        vpc_id: str,
+        path: Optional[Path],
+        **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        shared_stack = SharedStack(
-            self,
-            "SharedStack",
-            env=cdk.Environment(
-                account=os.environ.get(
-                    "CDK_DEPLOY_ACCOUNT", os.environ["CDK_DEFAULT_ACCOUNT"]
-                ),
-                region=os.environ.get(
-                    "CDK_DEPLOY_REGION", os.environ["CDK_DEFAULT_REGION"]
-                ),
-            ),
-        )
+        self._scheduled_scripts = None
 
-        YearnSimulationsInfraStack(
-            self,
-            "YearnSimulationsInfraStack",
-            vpc_id=vpc_id,
-            log_group=shared_stack.log_group,
-            container_repo=shared_stack.container_repo,
-            env=cdk.Environment(
-                account=os.environ.get(
-                    "CDK_DEPLOY_ACCOUNT", os.environ["CDK_DEFAULT_ACCOUNT"]
-                ),
-                region=os.environ.get(
-                    "CDK_DEPLOY_REGION", os.environ["CDK_DEFAULT_REGION"]
-                ),
+        env = cdk.Environment(
+            account=os.environ.get(
+                "CDK_DEPLOY_ACCOUNT", os.environ["CDK_DEFAULT_ACCOUNT"]
+            ),
+            region=os.environ.get(
+                "CDK_DEPLOY_REGION", os.environ["CDK_DEFAULT_REGION"]
             ),
         )
 
-        # Add root to sys path so we can import more predictively
-        root_path = Path(".").resolve().root
-        sys.path.insert(0, root_path)
+        # Stacks are only built when they are selected or a selected stack needs
+        # them. `cdk` doesn't tell the app which stacks it was asked for, so
+        # pass the selection as context, e.g.
+        # `cdk deploy -c stacks=YearnHarvestBotInfraStack \
+        #     Production/YearnHarvestBotInfraStack`
+        self.stacks = StackRegistry(self)
 
-        try:
-            brownie_project = project.load(project_path=path)
-            brownie_project.load_config()
+        # Sizes suggested by `rightsizing.py`, keyed by script or service name
+        profiles_path = self.node.try_get_context("taskProfiles")
+        profiles = load_profiles(Path(profiles_path)) if profiles_path else {}
 
-            brownie_project._add_to_main_namespace()
+        # With `-c architecture=ARM64` every task runs on Graviton, unless a
+        # script or a task profile asks for another architecture
+        architecture = str(self.node.try_get_context("architecture") or X86_64).upper()
+        if architecture not in ARCHITECTURES:
+            raise ValueError(
+                f"architecture={architecture} isn't one of {', '.join(ARCHITECTURES)}."
+            )
 
-            script_path = brownie_project._path.joinpath(
-                brownie_project._structure["scripts"]
+        # With `-c buildImage=true` the task image is built from the workspace
+        # on deploy, instead of pulling `latest` from the repository
+        self.stacks.register(
+            "SharedStack",
+            lambda stacks: SharedStack(
+                self,
+                "SharedStack",
+                vpc_id=vpc_id,
+                image_context=(
+                    self._stage_image_context(path)
+                    if self.node.try_get_context("buildImage") in (True, "true")
+                    else None
+                ),
+                container_insights=self._simulator_work_queue() is not None,
+                env=env,
+            ),
+        )
+
+        # With `-c rpcProxy=true` every bot talks to the node through a shared
+        # caching proxy instead of directly
+        self._use_rpc_proxy = self.node.try_get_context("rpcProxy") in (True, "true")
+        if self._use_rpc_proxy:
+            self.stacks.register(
+                "RpcProxyStack",
+                lambda stacks: RpcProxyStack(
+                    self,
+                    "RpcProxyStack",
+                    cluster=stacks.get("SharedStack").cluster,
+                    log_group=stacks.get("SharedStack").log_group,
+                    container_image=stacks.get("SharedStack").container_image,
+                    profile=(
+                        FargateProfile.from_options(
+                            profiles["RpcProxyService"],
+                            default=FargateProfile(architecture=architecture),
+                        )
+                        if "RpcProxyService" in profiles
+                        else None
+                    ),
+                    architecture=architecture,
+                    env=env,
+                ),
             )
 
-            brownie_project_module = import_module("scheduler")
+        # With `-c cacheVolume=true` brownie's caches are kept on EFS between
+        # runs. Bump `-c cacheVersion=...` to start with empty caches.
+        self._use_cache_volume = self.node.try_get_context("cacheVolume") in (
+            True,
+            "true",
+        )
+        if self._use_cache_volume:
+            self.stacks.register(
+                "CacheVolumeStack",
+                lambda stacks: CacheVolumeStack(
+                    self,
+                    "CacheVolumeStack",
+                    vpc=stacks.get("SharedStack").vpc,
+                    version=str(self.node.try_get_context("cacheVersion") or "1"),
+                    env=env,
+                ),
+            )
 
-            # import all script modules so we can be
-            scripts_module = ".".join(script_path.parts[1:])
-            for (_, module_name, _) in iter_modules([script_path]):
-                # import the module and iterate through its attributes
-                import_module(f"{scripts_module}.{module_name}")
+        # With `-c runLeases=true` scheduled tasks are started by a launcher
+        # that keeps runs of a schedule from overlapping
+        self._use_task_launcher = self.node.try_get_context("runLeases") in (
+            True,
+            "true",
+        )
+        if self._use_task_launcher:
+            self.stacks.register(
+                "TaskLauncherStack",
+                lambda stacks: TaskLauncherStack(self, "TaskLauncherStack", env=env),
+            )
 
-            scheduled_scripts = (
-                brownie_project_module.schedule_scripts_storage.scheduled_scripts
+        # With `-c taskMetrics=true` every task reports its cold start phases,
+        # runtime, exit code and peak memory per script, see `task_metrics.py`
+        self._use_task_metrics = self.node.try_get_context("taskMetrics") in (
+            True,
+            "true",
+        )
+        if self._use_task_metrics:
+            self.stacks.register(
+                "TaskMetricsStack",
+                lambda stacks: TaskMetricsStack(
+                    self,
+                    "TaskMetricsStack",
+                    log_group=stacks.get("SharedStack").log_group,
+                    env=env,
+                ),
             )
 
-            YearnSimScheduledTasksInfraStack(
-                self,
-                "YearnSimScheduledTasksInfraStack",
-                vpc_id=vpc_id,
-                log_group=shared_stack.log_group,
-                container_repo=shared_stack.container_repo,
-                scheduled_scripts=scheduled_scripts,
-                env=cdk.Environment(
-                    account=os.environ.get(
-                        "CDK_DEPLOY_ACCOUNT", os.environ["CDK_DEFAULT_ACCOUNT"]
-                    ),
-                    region=os.environ.get(
-                        "CDK_DEPLOY_REGION", os.environ["CDK_DEFAULT_REGION"]
+        # With `-c simulationCache=true` the simulator and the scheduled scripts
+        # share the results of their fork simulations, kept for
+        # `-c simulationCacheTtlHours=...` (24 by default)
+        self._use_simulation_cache = self.node.try_get_context("simulationCache") in (
+            True,
+            "true",
+        )
+        if self._use_simulation_cache:
+            self.stacks.register(
+                "SimulationCacheStack",
+                lambda stacks: SimulationCacheStack(
+                    self,
+                    "SimulationCacheStack",
+                    log_group=stacks.get("SharedStack").log_group,
+                    ttl=cdk.Duration.hours(
+                        int(self.node.try_get_context("simulationCacheTtlHours") or 24)
                     ),
+                    env=env,
                 ),
             )
 
-        finally:
-            sys.path.remove(root_path)
-            brownie_project._remove_from_main_namespace()
+        self.stacks.register(
+            "YearnSimulationsInfraStack",
+            lambda stacks: YearnSimulationsInfraStack(
+                self,
+                "YearnSimulationsInfraStack",
+                cluster=stacks.get("SharedStack").cluster,
+                log_group=stacks.get("SharedStack").log_group,
+                container_repo=stacks.get("SharedStack").container_repo,
+                container_image=(
+                    stacks.get("SharedStack").container_image
+                    if stacks.get("SharedStack").builds_image
+                    else None
+                ),
+                simulator_command=self._command_context("simulatorCommand"),
+                # With `-c archBenchmarkCommand=...` the command gets a task
+                # definition per architecture, see `arch_benchmark.py`
+                arch_benchmark_command=self._command_context("archBenchmarkCommand"),
+                # Container Insights reports the service, `task_metrics.py`
+                # the `SimulatorBot` command
+                simulator_profile=(
+                    FargateProfile.from_options(
+                        profiles.get("SimulatorBotService") or profiles["SimulatorBot"],
+                        default=FargateProfile(
+                            ephemeral_storage=21, architecture=architecture
+                        ),
+                    )
+                    if "SimulatorBotService" in profiles or "SimulatorBot" in profiles
+                    else None
+                ),
+                rpc_proxy=self._rpc_proxy(stacks),
+                cache_volume=self._cache_volume(stacks),
+                work_queue=self._simulator_work_queue(),
+                task_metrics=self._task_metrics(stacks),
+                simulation_cache=self._simulation_cache(stacks),
+                # With `-c simulatorPrescale=true` the simulator is scaled up
+                # ahead of the minutes the scheduled tasks start in, see
+                # `prescaling.py`
+                prescaling=self._simulator_prescaling(),
+                burst_schedules=(
+                    self._burst_schedules(path)
+                    if self._simulator_prescaling()
+                    else None
+                ),
+                architecture=architecture,
+                env=env,
+            ),
+        )
 
-        YearnHarvestBotInfraStack(
-            self,
-            "YearnHarvestBotInfraStack",
-            vpc_id=vpc_id,
-            log_group=shared_stack.log_group,
-            env=cdk.Environment(
-                account=os.environ.get(
-                    "CDK_DEPLOY_ACCOUNT", os.environ["CDK_DEFAULT_ACCOUNT"]
+        harvest_shard_count = int(self.node.try_get_context("harvestShards") or 1)
+        self.stacks.register(
+            "YearnSimScheduledTasksInfraStack",
+            lambda stacks: YearnSimScheduledTasksInfraStack(
+                self,
+                "YearnSimScheduledTasksInfraStack",
+                cluster=stacks.get("SharedStack").cluster,
+                log_group=stacks.get("SharedStack").log_group,
+                container_image=stacks.get("SharedStack").container_image,
+                scheduled_scripts=self._scheduled_task_scripts(path),
+                task_stack_count=int(self.node.try_get_context("scheduledTaskStacks")),
+                profile_overrides=profiles,
+                stagger_schedules=self._stagger_schedules(),
+                batch_workers=(
+                    int(self.node.try_get_context("batchWorkers"))
+                    if self.node.try_get_context("batchWorkers")
+                    else None
                 ),
-                region=os.environ.get(
-                    "CDK_DEPLOY_REGION", os.environ["CDK_DEFAULT_REGION"]
+                service_concurrency=int(
+                    self.node.try_get_context("serviceConcurrency") or 4
                 ),
+                rpc_proxy=self._rpc_proxy(stacks),
+                cache_volume=self._cache_volume(stacks),
+                task_launcher=self._task_launcher(stacks),
+                task_metrics=self._task_metrics(stacks),
+                simulation_cache=self._simulation_cache(stacks),
+                # Scripts depending on the harvest bot wait for every shard
+                harvest_shard_count=harvest_shard_count,
+                architecture=architecture,
+                # Names the stacks of the old one stack per script layout,
+                # until `-c legacyTaskStacksDeleted=true`
+                legacy_task_stacks=self.node.try_get_context("legacyTaskStacksDeleted")
+                not in (True, "true"),
+                env=env,
             ),
         )
 
+        self.stacks.register(
+            "YearnHarvestBotInfraStack",
+            lambda stacks: YearnHarvestBotInfraStack(
+                self,
+                "YearnHarvestBotInfraStack",
+                cluster=stacks.get("SharedStack").cluster,
+                log_group=stacks.get("SharedStack").log_group,
+                rpc_proxy=self._rpc_proxy(stacks),
+                shard_count=harvest_shard_count,
+                task_launcher=self._task_launcher(stacks),
+                overlap=self.node.try_get_context("harvestOverlap") or "skip",
+                # `-c harvestCapacity=spot` runs the bot on Fargate Spot
+                capacity=self.node.try_get_context("harvestCapacity") or "on_demand",
+                task_metrics=self._task_metrics(stacks),
+                architecture=architecture,
+                env=env,
+            ),
+        )
+
+        # These run modules of this package from the task image, which only
+        # has them when it is built from the workspace
+        self._require_built_image(
+            [
+                name
+                for name in (
+                    "rpcProxy",
+                    "cacheVolume",
+                    "taskMetrics",
+                    "simulationCache",
+                    "batchWorkers",
+                )
+                if self.node.try_get_context(name) not in (None, False, "false")
+            ]
+        )
+
+        self.stacks.build(self._selected_stacks())
+
+    def _rpc_proxy(self, stacks: StackRegistry) -> Optional[RpcProxyStack]:
+        if self._use_rpc_proxy:
+            return stacks.get("RpcProxyStack")
+        return None
+
+    def _cache_volume(self, stacks: StackRegistry) -> Optional[CacheVolumeStack]:
+        if self._use_cache_volume:
+            return stacks.get("CacheVolumeStack")
+        return None
+
+    def _task_launcher(self, stacks: StackRegistry) -> Optional[TaskLauncherStack]:
+        if self._use_task_launcher:
+            return stacks.get("TaskLauncherStack")
+        return None
+
+    def _task_metrics(self, stacks: StackRegistry) -> Optional[TaskMetricsStack]:
+        if self._use_task_metrics:
+            return stacks.get("TaskMetricsStack")
+        return None
+
+    def _simulation_cache(
+        self, stacks: StackRegistry
+    ) -> Optional[SimulationCacheStack]:
+        if self._use_simulation_cache:
+            return stacks.get("SimulationCacheStack")
+        return None
+
+    def _simulator_work_queue(self) -> Optional[WorkQueueScaling]:
+        if self.node.try_get_context("simulatorQueue") not in (True, "true"):
+            return None
+        return WorkQueueScaling(
+            # 0 is rejected by validate(), not replaced with the default
+            min_workers=int(
+                self.node.try_get_context("simulatorMinWorkers")
+                if self.node.try_get_context("simulatorMinWorkers") is not None
+                else 1
+            ),
+            max_workers=int(self.node.try_get_context("simulatorMaxWorkers") or 10),
+            target_backlog=int(
+                self.node.try_get_context("simulatorTargetBacklog") or 5
+            ),
+        )
+
+    def _simulator_prescaling(self) -> Optional[Prescaling]:
+        if self.node.try_get_context("simulatorPrescale") not in (True, "true"):
+            return None
+        return Prescaling(
+            lead=int(self.node.try_get_context("simulatorPrescaleLead") or 5),
+            hold=int(self.node.try_get_context("simulatorPrescaleHold") or 15),
+            starts_per_task=int(
+                self.node.try_get_context("simulatorPrescaleStartsPerTask") or 4
+            ),
+            max_tasks=int(self.node.try_get_context("simulatorPrescaleMaxTasks") or 10),
+        )
+
+    def _burst_schedules(self, path: Optional[Path]) -> List[CronSchedule]:
+        """Cron schedules of the scheduled scripts and the harvest bot, as deployed."""
+        schedules = script_schedules(
+            self._discover_scheduled_scripts(path), self._stagger_schedules()
+        )
+        return [*schedules.values(), CronSchedule(**HARVEST_BOT_SCHEDULE)]
+
+    def _stagger_schedules(self) -> bool:
+        return self.node.try_get_context("staggerSchedules") in (True, "true")
+
+    def _selected_stacks(self) -> List[str]:
+        selection = self.node.try_get_context("stacks") or []
+        if isinstance(selection, str):
+            selection = selection.split(",")
+        return [name.strip() for name in selection]
+
+    def _command_context(self, key: str) -> Optional[List[str]]:
+        # e.g. `-c simulatorCommand="brownie run simulator --network mainnet"`
+        command = self.node.try_get_context(key)
+        if isinstance(command, str):
+            command = shlex.split(command)
+        return command or None
+
+    def _stage_image_context(self, path: Optional[Path]) -> Path:
+        self._check_workspace(path)
+        return stage_image_context(
+            path, Path(cdk.Stage.of(self).outdir) / "image-context"
+        )
+
+    def _check_workspace(self, path: Optional[Path]) -> None:
+        if path is None:
+            raise Exception(
+                "Can not find Yearn Simulations workspace. Please specify the workspace environment variable."
+            )
+        if not path.exists() or not path.is_dir():
+            raise Exception(
+                "Can not find Yearn Simulations workspace. Please specify the workspace directory."
+            )
+
+    def _require_built_image(self, features: List[str]) -> None:
+        """
+        `features` run modules of this package from `INFRA_RUNTIME_PATH`, which
+        only the image built with `-c buildImage=true` has. `latest` from the
+        repository doesn't, so fail synth rather than deploy tasks that can't
+        start.
+        """
+        if features and self.node.try_get_context("buildImage") not in (True, "true"):
+            raise ValueError(
+                f"{', '.join(features)} run modules of this package from "
+                f"{INFRA_RUNTIME_PATH} in the task image, which only has them when "
+                "it is built from the workspace. Synth with -c buildImage=true."
+            )
+
+    def _scheduled_task_scripts(self, path: Optional[Path]):
+        scheduled_scripts = self._discover_scheduled_scripts(path)
+        # Their scheduler runs `scheduler_service.py` from the image
+        service_scripts = [
+            scheduled_script.script_name
+            for scheduled_script in scheduled_scripts
+            if scheduled_script.options.get("run_mode") == SERVICE_RUN_MODE
+        ]
+        if service_scripts:
+            self._require_built_image(
+                [f"run_mode={SERVICE_RUN_MODE} ({', '.join(service_scripts)})"]
+            )
+        return scheduled_scripts
+
+    def _discover_scheduled_scripts(self, path: Optional[Path]):
+        # Both the scheduled tasks and the simulator's pre-scaling need them
+        if self._scheduled_scripts is not None:
+            return self._scheduled_scripts
+        self._check_workspace(path)
+
+        # Scheduled scripts are read from the decorator sources by default. Pass
+        # `-c scriptDiscovery=brownie` to import the project the old way instead.
+        if self.node.try_get_context("scriptDiscovery") == "brownie":
+            self._scheduled_scripts = discover_scheduled_scripts_with_brownie(path)
+        else:
+            self._scheduled_scripts = discover_scheduled_scripts(
+                path, manifest_dir=Path(cdk.Stage.of(self).outdir)
+            )
+        return self._scheduled_scripts
+
 
 vpc_id = os.environ.get("CDK_DEPLOY_VPC", None)
 if not vpc_id:
@@ -122,20 +461,15 @@ if not vpc_id:
         "Can not deploy without an existing VPC. Please specify which VPC you want to deploy to using the `CDK_DEPLOY_VPC` environment variable."
     )
 
+# The workspace is only needed when the scheduled tasks stack is built
 yearn_simulations_dir = os.environ.get("YEARN_SIMULATIONS_WORKSPACE")
-if not yearn_simulations_dir:
-    raise Exception(
-        "Can not find Yearn Simulations workspace. Please specify the workspace environment variable."
-    )
-
-path = Path(yearn_simulations_dir)
-if not path.exists() or not path.is_dir():
-    raise Exception(
-        "Can not find Yearn Simulations workspace. Please specify the workspace directory."
-    )
+path = Path(yearn_simulations_dir) if yearn_simulations_dir else None
 
 prod = ApplicationStack(app, "Production", vpc_id, path)
 # staging = ApplicationStack(app, "Staging", staging_vpc_id)
 # dev = ApplicationStack(app, "Dev", dev_vpc_id)
 
-app.synth()
+assembly = app.synth()
+# Scheduled tasks are packed into stacks on estimates, check what came out
+for warning in oversized_stacks(assembly):
+    print(f"[Warning] {warning}", file=sys.stderr)
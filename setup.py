@@ -25,7 +25,16 @@ setuptools.setup(
         "aws-cdk.aws-ecr==1.130.0", 
         "aws-cdk.aws-secretsmanager==1.130.0",
         "aws-cdk.aws-ecs-patterns==1.130.0",
-        "aws-cdk.aws-applicationautoscaling==1.130.0"
+        "aws-cdk.aws-applicationautoscaling==1.130.0",
+        "aws-cdk.aws-events==1.130.0",
+        "aws-cdk.aws-events-targets==1.130.0",
+        "aws-cdk.aws-servicediscovery==1.130.0",
+        "aws-cdk.aws-efs==1.130.0",
+        "aws-cdk.aws-ecr-assets==1.130.0",
+        "aws-cdk.aws-sqs==1.130.0",
+        "aws-cdk.aws-cloudwatch==1.130.0",
+        "aws-cdk.aws-dynamodb==1.130.0",
+        "aws-cdk.aws-lambda==1.130.0"
     ],
 
     python_requires=">=3.6",
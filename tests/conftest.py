@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# The modules of the package import each other by their top-level name, the
+# way the stacks and the task image run them
+sys.path.insert(
+    0, str(Path(__file__).resolve().parent.parent / "yearn_simulations_infra")
+)
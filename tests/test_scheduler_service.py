@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from cron import CronSchedule
+from scheduler_service import FakeClock, Run, ScheduledJob, Scheduler
+
+START = datetime(2022, 1, 3, 12, 0)
+
+
+class StubRun(Run):
+    """A run that goes on until it is finished or killed."""
+
+    def __init__(self, job: ScheduledJob, started_at: datetime) -> None:
+        super().__init__(job, started_at)
+        self.result: Optional[int] = None
+        self.killed = False
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return self.result
+
+    def kill(self) -> None:
+        self.killed = True
+        self.result = -15
+
+
+class Recorder:
+    def __init__(self, finish: bool = False) -> None:
+        self.runs = []
+        # Runs finish by the next tick
+        self.finish = finish
+
+    def __call__(self, job: ScheduledJob, now: datetime) -> StubRun:
+        run = StubRun(job, now)
+        if self.finish:
+            run.result = 0
+        self.runs.append(run)
+        return run
+
+
+def every(minute: str = "*") -> CronSchedule:
+    return CronSchedule(minute=minute)
+
+
+def run_minutes(scheduler: Scheduler, clock: FakeClock, minutes: int) -> None:
+    for _ in range(minutes):
+        clock.sleep(60)
+        scheduler.tick()
+
+
+def test_fake_clock_only_moves_when_slept_on():
+    clock = FakeClock(START)
+
+    assert clock.now() == START
+    clock.sleep(90)
+    assert clock.now() == START + timedelta(seconds=90)
+
+
+def test_jobs_start_on_their_minutes():
+    clock = FakeClock(START)
+    started = Recorder(finish=True)
+    scheduler = Scheduler([ScheduledJob("report", every("*/15"))], started, clock)
+
+    run_minutes(scheduler, clock, 60)
+
+    assert [run.started_at.minute for run in started.runs] == [15, 30, 45, 0]
+
+
+def test_a_job_still_running_is_skipped():
+    clock = FakeClock(START)
+    started = Recorder()
+    scheduler = Scheduler([ScheduledJob("report", every())], started, clock)
+
+    run_minutes(scheduler, clock, 3)
+    assert len(started.runs) == 1
+
+    started.runs[0].result = 0
+    run_minutes(scheduler, clock, 1)
+    assert len(started.runs) == 2
+
+
+def test_no_more_than_max_concurrent_jobs_run():
+    clock = FakeClock(START)
+    started = Recorder()
+    jobs = [ScheduledJob(f"report_{index}", every()) for index in range(5)]
+    scheduler = Scheduler(jobs, started, clock, max_concurrent_jobs=2)
+
+    run_minutes(scheduler, clock, 1)
+
+    assert [run.job.script for run in started.runs] == ["report_0", "report_1"]
+
+
+def test_overdue_runs_are_killed():
+    clock = FakeClock(START)
+    started = Recorder()
+    scheduler = Scheduler(
+        [ScheduledJob("report", every("1"), timeout=120)], started, clock
+    )
+
+    run_minutes(scheduler, clock, 3)
+    assert not started.runs[0].killed
+    run_minutes(scheduler, clock, 1)
+    assert started.runs[0].killed
+    assert scheduler.running == {}
+
+
+def test_missed_minutes_are_caught_up_to_a_limit():
+    clock = FakeClock(START)
+    started = Recorder(finish=True)
+    jobs = [ScheduledJob("early", every("2")), ScheduledJob("late", every("8"))]
+    scheduler = Scheduler(jobs, started, clock)
+
+    # Paused for 10 minutes, only the jobs due in the last 5 are started
+    clock.sleep(600)
+    scheduler.tick()
+
+    assert [run.job.script for run in started.runs] == ["late"]
@@ -0,0 +1,159 @@
+import json
+
+from simulation_cache import (
+    MAX_RESULT_BYTES,
+    CachedResult,
+    InMemoryResultStore,
+    SimulationCache,
+    cache_key,
+    code_hash,
+)
+
+STRATEGY = "0xAbC0000000000000000000000000000000000001"
+CODE_HASH = "0123456789abcdef"
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Simulation:
+    """Counts its runs and takes `seconds` on the clock."""
+
+    def __init__(self, clock: Clock, result=None, seconds: float = 30) -> None:
+        self.clock = clock
+        self.result = {"profit": 1} if result is None else result
+        self.seconds = seconds
+        self.runs = 0
+
+    def __call__(self):
+        self.runs += 1
+        self.clock.now += self.seconds
+        return self.result
+
+
+class FailingStore:
+    def get(self, key):
+        raise RuntimeError("table unavailable")
+
+    def put(self, key, cached):
+        raise RuntimeError("table unavailable")
+
+
+def make_cache(store=None, ttl_seconds=3600):
+    clock = Clock()
+    lines = []
+    cache = SimulationCache(
+        InMemoryResultStore() if store is None else store,
+        ttl_seconds,
+        clock=clock,
+        emit=lines.append,
+    )
+    return cache, clock, lines
+
+
+def lookups(lines):
+    return [json.loads(line) for line in lines]
+
+
+def test_in_memory_store_returns_what_was_put():
+    store = InMemoryResultStore()
+    cached = CachedResult({"profit": 1}, seconds=12, expires_at=2000)
+
+    assert store.get("key") is None
+    store.put("key", cached)
+    assert store.get("key") is cached
+
+
+def test_a_miss_simulates_and_the_next_lookup_hits():
+    cache, clock, lines = make_cache()
+    simulation = Simulation(clock, seconds=30)
+
+    first = cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+    second = cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+
+    assert first == second == {"profit": 1}
+    assert simulation.runs == 1
+    assert lookups(lines) == [
+        {
+            "event": "simulation_cache",
+            "network": "mainnet",
+            "result": "miss",
+            "seconds_saved": 0,
+        },
+        {
+            "event": "simulation_cache",
+            "network": "mainnet",
+            "result": "hit",
+            "seconds_saved": 30,
+        },
+    ]
+
+
+def test_results_are_keyed_by_block_and_code():
+    cache, clock, _ = make_cache()
+    simulation = Simulation(clock)
+
+    cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+    cache.get_or_simulate("mainnet", STRATEGY, 101, CODE_HASH, simulation)
+    cache.get_or_simulate("mainnet", STRATEGY, 100, "fedcba9876543210", simulation)
+    cache.get_or_simulate("fantom", STRATEGY, 100, CODE_HASH, simulation)
+
+    assert simulation.runs == 4
+
+
+def test_expired_results_are_simulated_again():
+    cache, clock, lines = make_cache(ttl_seconds=3600)
+    simulation = Simulation(clock)
+
+    cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+    clock.now += 3600
+    cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+
+    assert simulation.runs == 2
+    assert [line["result"] for line in lookups(lines)] == ["miss", "miss"]
+
+
+def test_results_too_large_for_the_table_are_not_cached():
+    cache, clock, _ = make_cache()
+    simulation = Simulation(clock, result="x" * MAX_RESULT_BYTES)
+
+    cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+    cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+
+    assert simulation.runs == 2
+
+
+def test_a_failing_store_is_a_miss(capsys):
+    cache, clock, lines = make_cache(store=FailingStore())
+    simulation = Simulation(clock)
+
+    result = cache.get_or_simulate("mainnet", STRATEGY, 100, CODE_HASH, simulation)
+
+    assert result == {"profit": 1}
+    assert simulation.runs == 1
+    assert lookups(lines)[0]["result"] == "miss"
+    errors = capsys.readouterr().err
+    assert "Could not read the simulation cache" in errors
+    assert "Could not write the simulation cache" in errors
+
+
+def test_checksummed_and_lowercase_addresses_share_a_key():
+    assert cache_key("mainnet", STRATEGY, 100, CODE_HASH) == cache_key(
+        "mainnet", STRATEGY.lower(), 100, CODE_HASH
+    )
+
+
+def test_code_hash_changes_with_the_code(tmp_path):
+    script = tmp_path / "harvest.py"
+    script.write_text("print('harvest')\n")
+    before = code_hash([tmp_path])
+
+    assert len(before) == 16
+    assert code_hash([script]) == before
+    script.write_text("print('harvest again')\n")
+    assert code_hash([tmp_path]) != before
@@ -0,0 +1,213 @@
+import json
+
+import pytest
+
+from run_leases import PREEMPT, QUEUE, SKIP, InMemoryLeaseStore, lease_id
+from task_launcher import ON_DEMAND_STRATEGY, SPOT, SPOT_INTERRUPTION, Launcher
+
+SPOT_STRATEGY = [{"capacityProvider": "FARGATE_SPOT", "weight": 1}]
+
+
+class FakeEcs:
+    """Records the tasks started and stopped, each started task gets a new ARN."""
+
+    def __init__(self) -> None:
+        self.started = []
+        self.stopped = []
+        self.failures = []
+
+    def run_task(self, **arguments):
+        self.started.append(arguments)
+        if self.failures:
+            return {"tasks": [], "failures": self.failures}
+        return {"tasks": [{"taskArn": f"arn:aws:ecs:task/{len(self.started)}"}]}
+
+    def stop_task(self, cluster, task, reason):
+        self.stopped.append(task)
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def ecs():
+    return FakeEcs()
+
+
+@pytest.fixture
+def metrics():
+    return []
+
+
+@pytest.fixture
+def launcher(clock, ecs, metrics):
+    return Launcher(
+        InMemoryLeaseStore(),
+        ecs,
+        clock=clock,
+        emit=lambda line: metrics.append(json.loads(line)),
+    )
+
+
+def launch(overlap=SKIP, **options):
+    return {
+        "schedule": "harvest_all",
+        "overlap": overlap,
+        "lease_seconds": 600,
+        "run_task": {"cluster": "cluster", "taskDefinition": "task-definition"},
+        **options,
+    }
+
+
+def stopped(task_arn, stop_code="EssentialContainerExited"):
+    return {
+        "detail-type": "ECS Task State Change",
+        "detail": {
+            "taskArn": task_arn,
+            "startedBy": lease_id("harvest_all"),
+            "stopCode": stop_code,
+        },
+    }
+
+
+def counted(metrics, name):
+    return sum(line.get(name, 0) for line in metrics)
+
+
+def test_skip_drops_a_run_due_while_the_last_one_goes(launcher, ecs, metrics):
+    first = launcher.launch(launch())
+
+    assert launcher.launch(launch()) is None
+    assert len(ecs.started) == 1
+    assert counted(metrics, "RunsSkipped") == 1
+
+    launcher.task_stopped(stopped(first))
+    assert launcher.launch(launch()) is not None
+
+
+def test_tasks_are_started_by_their_lease(launcher, ecs):
+    launcher.launch(launch())
+
+    assert ecs.started[0]["startedBy"] == lease_id("harvest_all")
+    assert len(ecs.started[0]["startedBy"]) <= 36
+
+
+def test_queue_starts_the_run_once_the_last_one_stops(launcher, ecs, metrics):
+    first = launcher.launch(launch(QUEUE))
+
+    assert launcher.launch(launch(QUEUE)) is None
+    assert counted(metrics, "RunsQueued") == 1
+    assert len(ecs.started) == 1
+
+    second = launcher.task_stopped(stopped(first))
+    assert second is not None and second != first
+    assert len(ecs.started) == 2
+    # The queued run holds the lease now
+    assert launcher.launch(launch(QUEUE)) is None
+    assert launcher.task_stopped(stopped(second)) is not None
+
+
+def test_queue_keeps_only_the_latest_launch(launcher, ecs):
+    first = launcher.launch(launch(QUEUE))
+    launcher.launch(
+        launch(QUEUE, run_task={"cluster": "cluster", "taskDefinition": "a"})
+    )
+    launcher.launch(
+        launch(QUEUE, run_task={"cluster": "cluster", "taskDefinition": "b"})
+    )
+
+    launcher.task_stopped(stopped(first))
+
+    assert [task["taskDefinition"] for task in ecs.started[1:]] == ["b"]
+
+
+def test_preempt_stops_the_last_run(launcher, ecs, metrics):
+    first = launcher.launch(launch(PREEMPT))
+    second = launcher.launch(launch(PREEMPT))
+
+    assert ecs.stopped == [first]
+    assert second is not None and second != first
+    assert counted(metrics, "RunsPreempted") == 1
+
+    # The preempted task's stop doesn't release the new run's lease
+    assert launcher.task_stopped(stopped(first)) is None
+    assert launcher.launch(launch()) is None
+
+
+def test_an_expired_lease_is_taken_without_a_stopped_event(launcher, clock, ecs):
+    launcher.launch(launch())
+
+    clock.now += 599
+    assert launcher.launch(launch()) is None
+    clock.now += 1
+    assert launcher.launch(launch()) is not None
+    assert len(ecs.started) == 2
+
+
+def test_a_run_failing_to_start_releases_the_lease(launcher, ecs, metrics):
+    ecs.failures = [{"reason": "RESOURCE:MEMORY"}]
+    with pytest.raises(RuntimeError):
+        launcher.launch(launch())
+    assert counted(metrics, "RunsFailedToStart") == 1
+
+    ecs.failures = []
+    assert launcher.launch(launch()) is not None
+
+
+def test_interrupted_spot_runs_are_retried_on_demand(launcher, ecs, metrics):
+    spot = launch(
+        capacity=SPOT,
+        run_task={
+            "cluster": "cluster",
+            "taskDefinition": "task-definition",
+            "capacityProviderStrategy": SPOT_STRATEGY,
+        },
+    )
+    first = launcher.launch(spot)
+
+    retry = launcher.task_stopped(stopped(first, SPOT_INTERRUPTION))
+
+    assert retry is not None and retry != first
+    assert ecs.started[1]["capacityProviderStrategy"] == ON_DEMAND_STRATEGY
+    assert ecs.started[1]["startedBy"] == lease_id("harvest_all")
+    assert counted(metrics, "SpotRetries") == 1
+    # The retry holds the lease, the interrupted task doesn't anymore
+    assert launcher.launch(launch()) is None
+    assert launcher.task_stopped(stopped(first)) is None
+    launcher.task_stopped(stopped(retry))
+    assert launcher.launch(launch()) is not None
+
+
+def test_spot_runs_past_their_deadline_are_not_retried(launcher, clock, ecs, metrics):
+    first = launcher.launch(
+        launch(
+            capacity=SPOT,
+            deadline_seconds=300,
+            fired_at="1970-01-12T13:46:40Z",  # the clock's start
+        )
+    )
+
+    clock.now += 300
+    assert launcher.task_stopped(stopped(first, SPOT_INTERRUPTION)) is None
+
+    assert len(ecs.started) == 1
+    assert counted(metrics, "SpotRetriesPastDeadline") == 1
+    # The lease is released like for any other stopped task
+    assert launcher.launch(launch()) is not None
+
+
+def test_on_demand_runs_are_not_retried(launcher, ecs):
+    first = launcher.launch(launch())
+
+    assert launcher.task_stopped(stopped(first, SPOT_INTERRUPTION)) is None
+    assert len(ecs.started) == 1
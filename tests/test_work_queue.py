@@ -0,0 +1,90 @@
+import pytest
+
+from work_queue import LocalWorkQueue, WorkQueueScaling, main, simulate
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_received_messages_are_hidden_until_their_visibility_timeout():
+    clock = Clock()
+    queue = LocalWorkQueue(visibility_timeout=900, clock=clock)
+    sent = queue.send("simulation")
+
+    received = queue.receive()
+    assert received is sent
+    assert (queue.visible, queue.in_flight) == (0, 1)
+    assert queue.receive() is None
+
+    clock.now += 900
+    assert queue.receive() is sent
+    assert sent.receive_count == 2
+
+
+def test_deleted_messages_are_gone():
+    queue = LocalWorkQueue(clock=Clock())
+    queue.send("simulation")
+    queue.delete(queue.receive())
+
+    assert queue.receive() is None
+    assert (queue.visible, queue.in_flight) == (0, 0)
+
+
+def test_messages_are_received_in_the_order_sent():
+    queue = LocalWorkQueue(clock=Clock())
+    first, second = queue.send("first"), queue.send("second")
+
+    assert [queue.receive(), queue.receive()] == [first, second]
+
+
+def test_workers_scale_in_below_half_the_target():
+    scaling = WorkQueueScaling(min_workers=1, max_workers=8, target_backlog=5)
+
+    assert scaling.adjustment(2.5) == -1
+    assert scaling.adjustment(2.6) == 0
+    assert scaling.adjustment(5) == 1
+    assert scaling.adjustment(10) == 2
+    assert scaling.adjustment(20) == 4
+
+
+def test_the_first_request_starts_a_worker():
+    scaling = WorkQueueScaling(min_workers=1, max_workers=8, target_backlog=5)
+
+    assert scaling.backlog_per_worker(visible=1, in_flight=0, workers=0) == 5
+    assert scaling.next_workers(0, visible=1, in_flight=0) == 1
+
+
+@pytest.mark.parametrize(
+    "scaling",
+    [
+        WorkQueueScaling(min_workers=0),
+        WorkQueueScaling(min_workers=3, max_workers=2),
+        WorkQueueScaling(target_backlog=0),
+        WorkQueueScaling(target_backlog=5, scale_in_below=5),
+    ],
+)
+def test_invalid_scaling_is_rejected(scaling):
+    with pytest.raises(ValueError):
+        scaling.validate()
+
+
+def test_a_steady_load_settles_on_the_workers_it_needs():
+    # 2 requests a minute of 2 minutes each keep 4 workers busy
+    arrivals = {0: 40}
+    for second in range(0, 3600, 30):
+        arrivals[second] = arrivals.get(second, 0) + 1
+
+    result = simulate(arrivals, WorkQueueScaling(max_workers=8, target_backlog=5))
+
+    assert [point["workers"] for point in result["timeline"][-20:]] == [4] * 20
+
+
+def test_the_command_line_replays_a_burst(capsys):
+    # Requests dropped by stopped workers come back after 15 minutes
+    assert main(["--burst", "10@0", "--duration", "2400"]) == 0
+    assert "10 completed, 0 pending" in capsys.readouterr().out
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Compare the price-performance of a simulation on x86_64 and ARM64 Fargate.
+
+Synth with `-c archBenchmarkCommand="brownie run ..."` to add a task
+definition per architecture to `YearnSimulationsInfraStack`. Both run the
+command with the simulator's size and environment. This starts `--runs` tasks
+of each at the same time, waits for them to stop and reports per
+architecture the runtime, the Fargate cost of a run and the runs per dollar:
+
+    python yearn_simulations_infra/arch_benchmark.py --cluster <cluster> \
+        --subnet <subnet> --runs 5
+
+The cluster and the subnets are outputs of the stack. Saved tasks can be
+compared again without running anything:
+
+    python yearn_simulations_infra/arch_benchmark.py --save tasks.json ...
+    python yearn_simulations_infra/arch_benchmark.py tasks.json
+
+Fargate bills from the start of the image pull until the task stops, for a
+minute at least. Prices are on demand Linux in us-east-1, Spot discounts
+both architectures alike.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fargate_profiles import ARM64, X86_64
+from startup_benchmark import phase_durations, read_tasks
+
+# Task definition families of the benchmark tasks
+BENCHMARK_FAMILIES = {
+    X86_64: "YearnArchBenchmarkX8664",
+    ARM64: "YearnArchBenchmarkArm64",
+}
+BENCHMARK_CONTAINER_NAME = "ArchBenchmarkContainer"
+
+# USD per vCPU hour and per GB hour
+FARGATE_PRICES = {
+    X86_64: {"vcpu_hour": 0.04048, "gb_hour": 0.004445},
+    ARM64: {"vcpu_hour": 0.03238, "gb_hour": 0.00356},
+}
+MINIMUM_BILLED_SECONDS = 60
+# Phases Fargate bills for, see `startup_benchmark.py`
+BILLED_PHASES = ("pull", "start", "run")
+
+
+def task_architecture(task: Dict[str, Any]) -> str:
+    for attribute in task.get("attributes", []):
+        if attribute.get("name") == "ecs.cpu-architecture":
+            return attribute["value"].upper()
+    return X86_64
+
+
+def run_cost(task: Dict[str, Any]) -> Optional[float]:
+    """What Fargate bills for a stopped task, in USD."""
+    durations = phase_durations(task)
+    if not all(phase in durations for phase in BILLED_PHASES):
+        return None
+    seconds = max(
+        sum(durations[phase] for phase in BILLED_PHASES), MINIMUM_BILLED_SECONDS
+    )
+    prices = FARGATE_PRICES[task_architecture(task)]
+    vcpus, gigabytes = int(task["cpu"]) / 1024, int(task["memory"]) / 1024
+    return (
+        seconds / 3600 * (vcpus * prices["vcpu_hour"] + gigabytes * prices["gb_hour"])
+    )
+
+
+def succeeded(task: Dict[str, Any]) -> bool:
+    return all(
+        container.get("exitCode") == 0 for container in task.get("containers", [])
+    )
+
+
+def summarize(tasks: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Runtime, cost and runs per dollar of the successful runs, per architecture."""
+    by_architecture: Dict[str, List[Dict[str, Any]]] = {}
+    for task in tasks:
+        by_architecture.setdefault(task_architecture(task), []).append(task)
+
+    summary = {}
+    for architecture, architecture_tasks in sorted(by_architecture.items()):
+        runs = [
+            (phase_durations(task)["run"], run_cost(task))
+            for task in architecture_tasks
+            if succeeded(task) and run_cost(task) is not None
+        ]
+        result: Dict[str, Any] = {
+            "tasks": len(architecture_tasks),
+            "failed": len(architecture_tasks) - len(runs),
+        }
+        if runs:
+            runtime = statistics.median(seconds for seconds, _ in runs)
+            cost = statistics.mean(cost for _, cost in runs)
+            result.update(
+                {
+                    "runtime_p50": round(runtime, 1),
+                    "cost_per_run": round(cost, 6),
+                    "runs_per_dollar": round(1 / cost, 1),
+                }
+            )
+        summary[architecture] = result
+    return summary
+
+
+def compare(summary: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, float]]:
+    """How much faster and how much more price-performant ARM64 is than x86_64."""
+    x86, arm = summary.get(X86_64, {}), summary.get(ARM64, {})
+    if "runtime_p50" not in x86 or "runtime_p50" not in arm:
+        return None
+    return {
+        "speedup": round(x86["runtime_p50"] / arm["runtime_p50"], 3),
+        "price_performance": round(arm["runs_per_dollar"] / x86["runs_per_dollar"], 3),
+    }
+
+
+def run_benchmark(
+    cluster: str,
+    subnets: List[str],
+    security_groups: List[str],
+    runs: int,
+    timeout_minutes: int,
+) -> List[Dict[str, Any]]:
+    """Start `runs` tasks per architecture and return them once they stopped."""
+    import boto3
+
+    ecs = boto3.client("ecs")
+    network = {"subnets": subnets, "assignPublicIp": "ENABLED"}
+    if security_groups:
+        network["securityGroups"] = security_groups
+
+    task_arns: List[str] = []
+    for family in BENCHMARK_FAMILIES.values():
+        # `run_task` starts at most 10 tasks per call
+        for start in range(0, runs, 10):
+            response = ecs.run_task(
+                cluster=cluster,
+                taskDefinition=family,
+                count=min(10, runs - start),
+                capacityProviderStrategy=[{"capacityProvider": "FARGATE", "weight": 1}],
+                platformVersion="LATEST",
+                networkConfiguration={"awsvpcConfiguration": network},
+            )
+            if response["failures"]:
+                raise RuntimeError(f"Could not start {family}: {response['failures']}")
+            task_arns.extend(task["taskArn"] for task in response["tasks"])
+
+    tasks = []
+    for start in range(0, len(task_arns), 100):
+        batch = task_arns[start : start + 100]
+        ecs.get_waiter("tasks_stopped").wait(
+            cluster=cluster,
+            tasks=batch,
+            WaiterConfig={"Delay": 15, "MaxAttempts": timeout_minutes * 4},
+        )
+        tasks.extend(ecs.describe_tasks(cluster=cluster, tasks=batch)["tasks"])
+    return tasks
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("inputs", nargs="*", type=Path, help="Saved tasks to compare")
+    parser.add_argument("--cluster", help="Run the benchmark tasks in this cluster")
+    parser.add_argument(
+        "--subnet", action="append", default=[], help="Subnet of the tasks"
+    )
+    parser.add_argument("--security-group", action="append", default=[])
+    parser.add_argument("--runs", type=int, default=3, help="Tasks per architecture")
+    parser.add_argument("--timeout-minutes", type=int, default=60)
+    parser.add_argument("--save", type=Path, help="Save the tasks to compare later")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    tasks = [task for path in args.inputs for task in read_tasks(path)]
+    if args.cluster:
+        if not args.subnet:
+            parser.error("pass the subnets of the tasks with --subnet")
+        tasks += run_benchmark(
+            args.cluster,
+            args.subnet,
+            args.security_group,
+            args.runs,
+            args.timeout_minutes,
+        )
+        if args.save:
+            args.save.write_text(json.dumps({"tasks": tasks}, default=str, indent=2))
+    if not tasks:
+        parser.error("pass saved tasks or --cluster")
+
+    summary = summarize(tasks)
+    comparison = compare(summary)
+    if args.json:
+        print(json.dumps({"architectures": summary, "arm64": comparison}, indent=2))
+        return 0
+
+    for architecture, result in summary.items():
+        line = f"{architecture:>7}: {result['tasks']} tasks, {result['failed']} failed"
+        if "runtime_p50" in result:
+            line += (
+                f", runtime p50 {result['runtime_p50']}s, "
+                f"${result['cost_per_run']:.4f} per run, "
+                f"{result['runs_per_dollar']} runs per dollar"
+            )
+        print(line)
+    if comparison:
+        print(
+            f"ARM64 runs {comparison['speedup']:.2f}x as fast and gets "
+            f"{comparison['price_performance']:.2f}x the runs per dollar of X86_64"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
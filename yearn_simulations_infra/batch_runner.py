@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Run several scheduled scripts in one container.
+
+Started by the scheduled tasks stacks in batch mode with the scripts to run
+in `BATCH_JOBS`, a JSON list of `{"script": ..., "environment": {...}}`, and
+the number of scripts to run at once in `BATCH_WORKERS`.
+
+The brownie project is loaded (and compiled) once, then every script runs in
+a process forked from it with its own environment, so the batch only pays
+for the image pull, the imports and the compile once. Each line a script
+prints is prefixed with its name, and the runner exits with an error if any
+script failed.
+
+Only uses the standard library so it can be copied into the task image next
+to the yearn-simulations project.
+"""
+
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List, Optional
+
+PROJECT_PATH = "/usr/src/app"
+RUN_SCRIPT = f"{PROJECT_PATH}/run.sh"
+
+
+class BatchJob:
+    def __init__(
+        self, script: str, environment: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.script = script
+        self.environment = environment or {}
+
+    @classmethod
+    def from_environment(cls) -> List["BatchJob"]:
+        return [
+            cls(job["script"], job.get("environment"))
+            for job in json.loads(os.environ["BATCH_JOBS"])
+        ]
+
+
+class PrefixedStream:
+    """Prefix every line written to `stream` with `prefix`."""
+
+    def __init__(self, stream, prefix: str) -> None:
+        self._stream = stream
+        self._prefix = prefix
+        self._at_line_start = True
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            for line in text.splitlines(keepends=True):
+                if self._at_line_start:
+                    self._stream.write(self._prefix)
+                self._stream.write(line)
+                self._at_line_start = line.endswith("\n")
+        return len(text)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    workers: int,
+    run_job: Callable[[BatchJob], None],
+) -> Dict[str, int]:
+    """
+    Run every job in a forked process, at most `workers` at a time, and return
+    the exit code of each one keyed by script name.
+    """
+    context = multiprocessing.get_context("fork")
+    pending = list(jobs)
+    running = {}
+    exit_codes = {}
+    started_at = {}
+
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.pop(0)
+            process = context.Process(
+                target=_run_in_child, args=(job, run_job), name=job.script
+            )
+            # Anything still buffered would be written again by the child
+            sys.stdout.flush()
+            sys.stderr.flush()
+            process.start()
+            running[process.sentinel] = (job, process)
+            started_at[job.script] = time.monotonic()
+            _log(f"started {job.script}")
+
+        for sentinel in wait(list(running)):
+            job, process = running.pop(sentinel)
+            process.join()
+            exit_codes[job.script] = process.exitcode
+            runtime = time.monotonic() - started_at[job.script]
+            _log(f"{job.script} exited with {process.exitcode} after {runtime:.1f}s")
+            report_script_metrics(job.script, runtime, process.exitcode)
+
+    return exit_codes
+
+
+def report_script_metrics(script: str, runtime: float, exit_code: int) -> None:
+    """Report each script of the task apart when it runs under `task_metrics.py`."""
+    if os.environ.get("TASK_METRICS"):
+        from task_metrics import emit_metrics
+
+        emit_metrics(
+            script,
+            {
+                "Runtime": (round(runtime, 3), "Seconds"),
+                "ExitCode": (exit_code, "None"),
+            },
+        )
+
+
+def run_with_brownie(
+    project_path: str, network_name: str
+) -> Callable[[BatchJob], None]:
+    """Load the project in this process and return a job runner forking from it."""
+    from brownie import network, project
+    from brownie.project.scripts import run
+
+    brownie_project = project.load(project_path)
+    brownie_project.load_config()
+
+    def run_job(job: BatchJob) -> None:
+        # Connections aren't shared with the parent, every script opens its own
+        network.connect(network_name)
+        try:
+            run(f"scripts/{job.script}", project=brownie_project)
+        finally:
+            network.disconnect()
+
+    return run_job
+
+
+def run_with_subprocess(job: BatchJob) -> None:
+    """Fall back to the task's own entry point, one process per script."""
+    process = subprocess.Popen(
+        [RUN_SCRIPT, job.script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    for line in process.stdout:
+        sys.stdout.write(line)
+    sys.exit(process.wait())
+
+
+def main() -> int:
+    jobs = BatchJob.from_environment()
+    workers = int(os.environ.get("BATCH_WORKERS", "4"))
+
+    if os.environ.get("BATCH_MODE", "brownie") == "subprocess":
+        run_job = run_with_subprocess
+    else:
+        run_job = run_with_brownie(
+            os.environ.get("BROWNIE_PROJECT_PATH", PROJECT_PATH),
+            os.environ.get("BROWNIE_NETWORK", "mainnet"),
+        )
+
+    exit_codes = run_batch(jobs, workers, run_job)
+    failed = sorted(script for script, code in exit_codes.items() if code != 0)
+    _log(
+        json.dumps(
+            {
+                "batch": [job.script for job in jobs],
+                "failed": failed,
+                "exit_codes": exit_codes,
+            }
+        )
+    )
+    return 1 if failed else 0
+
+
+def _run_in_child(job: BatchJob, run_job: Callable[[BatchJob], None]) -> None:
+    os.environ.update(job.environment)
+    os.environ["SCRIPT_NAME"] = job.script
+    # Scripts run for a while, don't hold their logs back until they exit
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+    sys.stdout = PrefixedStream(sys.stdout, f"[{job.script}] ")
+    sys.stderr = PrefixedStream(sys.stderr, f"[{job.script}] ")
+    try:
+        run_job(job)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def _log(message: str) -> None:
+    print(f"[batch_runner] {message}", flush=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
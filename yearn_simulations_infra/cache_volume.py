@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Keep brownie's compile, package and explorer caches on a shared volume
+between task runs.
+
+Tasks don't work on the volume directly: brownie keeps sqlite databases and
+build files that would get corrupted by concurrent tasks writing to them
+over NFS. Instead the newest snapshot on the volume is copied into place
+before the command runs, and if the command changed the caches they are
+published as a new snapshot afterwards. Snapshots are written under a
+temporary name and renamed once complete, so a task never sees a partial
+one.
+
+After publishing, snapshots beyond the newest `CACHE_KEEP` or past
+`CACHE_MAX_BYTES` altogether are evicted, oldest first. The newest snapshot
+is always kept.
+
+Usage, as the command of a task:
+
+    python3 cache_volume.py run -- /usr/src/app/run.sh my_script
+
+Configured through the environment:
+
+    CACHE_ROOT       where the volume is mounted
+    CACHE_VERSION    snapshots are kept apart per version, bump it to start over
+    CACHE_PATHS      comma separated directories to cache
+    CACHE_KEEP       number of snapshots to keep, 3 by default
+    CACHE_MAX_BYTES  total size of the snapshots to keep, 5 GiB by default
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+DEFAULT_PATHS = "~/.brownie,~/.solcx,/usr/src/app/build"
+MANIFEST_FILE_NAME = "manifest.json"
+TEMPORARY_PREFIX = ".tmp-"
+TRASH_PREFIX = ".trash-"
+# Snapshots younger than this are never evicted, a task may be restoring it
+MIN_SNAPSHOT_AGE = 10 * 60
+# Temporary snapshots older than this were left by a task that died
+STALE_TEMPORARY_AGE = 24 * 60 * 60
+
+
+class Snapshot:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.manifest = json.loads((path / MANIFEST_FILE_NAME).read_text())
+
+    @property
+    def fingerprint(self) -> str:
+        return self.manifest["fingerprint"]
+
+    @property
+    def size(self) -> int:
+        return self.manifest["bytes"]
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.manifest["created_at"]
+
+
+def snapshots(root: Path) -> List[Snapshot]:
+    """Complete snapshots under `root`, newest first."""
+    found = []
+    for path in root.glob("*"):
+        if path.name.startswith((TEMPORARY_PREFIX, TRASH_PREFIX)):
+            continue
+        try:
+            found.append(Snapshot(path))
+        except (OSError, ValueError):
+            # Evicted while listing, or not a snapshot
+            continue
+    return sorted(found, key=lambda snapshot: snapshot.path.name, reverse=True)
+
+
+def fingerprint(paths: List[Path]) -> str:
+    """Digest of the names, sizes and modification times of every cached file."""
+    digest = hashlib.sha256()
+    for index, path in enumerate(paths):
+        for file in sorted(path.rglob("*")) if path.exists() else []:
+            if file.is_file():
+                stat = file.stat()
+                entry = f"{index}:{file.relative_to(path)}"
+                digest.update(f"{entry}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def restore(root: Path, paths: List[Path]) -> Optional[Snapshot]:
+    """Copy the newest snapshot into place and return it, if there is one."""
+    for snapshot in snapshots(root):
+        try:
+            for index, path in enumerate(paths):
+                source = snapshot.path / str(index)
+                if source.exists():
+                    shutil.copytree(source, path, symlinks=True, dirs_exist_ok=True)
+            return snapshot
+        except OSError as error:
+            # Evicted while copying, try the one before it
+            _log(f"could not restore {snapshot.path.name}: {error}")
+    return None
+
+
+def publish(root: Path, paths: List[Path], base: Optional[Snapshot]) -> Optional[Path]:
+    """Publish the caches as a new snapshot, unless they are the same as `base`."""
+    current = fingerprint(paths)
+    if base is not None and base.fingerprint == current:
+        return None
+
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    temporary = root / f"{TEMPORARY_PREFIX}{name}"
+    temporary.mkdir(parents=True)
+    size = 0
+    for index, path in enumerate(paths):
+        if path.exists():
+            shutil.copytree(path, temporary / str(index), symlinks=True)
+            size += _size(temporary / str(index))
+    (temporary / MANIFEST_FILE_NAME).write_text(
+        json.dumps(
+            {
+                "paths": [str(path) for path in paths],
+                "fingerprint": current,
+                "bytes": size,
+                "created_at": time.time(),
+            }
+        )
+    )
+    snapshot = root / name
+    temporary.rename(snapshot)
+    return snapshot
+
+
+def evict(root: Path, keep: int, max_bytes: int) -> List[str]:
+    """Remove snapshots past the newest `keep` or `max_bytes`, return their names."""
+    evicted = []
+    total = 0
+    for position, snapshot in enumerate(snapshots(root)):
+        total += snapshot.size
+        if position == 0 or snapshot.age < MIN_SNAPSHOT_AGE:
+            continue
+        if position >= keep or total > max_bytes:
+            _remove(snapshot.path)
+            evicted.append(snapshot.path.name)
+
+    # Left behind by tasks that died while publishing or evicting
+    for path in [*root.glob(f"{TEMPORARY_PREFIX}*"), *root.glob(f"{TRASH_PREFIX}*")]:
+        if time.time() - path.stat().st_mtime > STALE_TEMPORARY_AGE:
+            shutil.rmtree(path, ignore_errors=True)
+    return evicted
+
+
+def run(
+    command: List[str], root: Path, paths: List[Path], keep: int, max_bytes: int
+) -> int:
+    root.mkdir(parents=True, exist_ok=True)
+    started_at = time.monotonic()
+    base = restore(root, paths)
+    _log(
+        f"restored {base.path.name if base else 'nothing'} "
+        f"in {time.monotonic() - started_at:.1f}s"
+    )
+
+    process = subprocess.Popen(command)
+    # Let the command shut down cleanly when the task is stopped, and still
+    # publish what it cached
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: process.send_signal(signum))
+    exit_code = process.wait()
+
+    try:
+        snapshot = publish(root, paths, base)
+        if snapshot is not None:
+            _log(f"published {snapshot.name}")
+            evicted = evict(root, keep, max_bytes)
+            if evicted:
+                _log(f"evicted {', '.join(evicted)}")
+    except OSError as error:
+        # The cache only saves time, it never fails the task
+        _log(f"could not publish the cache: {error}")
+    return exit_code
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Persist caches between task runs.")
+    parser.add_argument("action", choices=("run", "evict", "list"))
+    parser.add_argument("command", nargs="*", help="Command to run, after `--`")
+    args = parser.parse_args(argv)
+
+    root = Path(os.environ.get("CACHE_ROOT", "/mnt/cache")) / os.environ.get(
+        "CACHE_VERSION", "1"
+    )
+    paths = [
+        Path(path).expanduser()
+        for path in os.environ.get("CACHE_PATHS", DEFAULT_PATHS).split(",")
+        if path
+    ]
+    keep = int(os.environ.get("CACHE_KEEP", "3"))
+    max_bytes = int(os.environ.get("CACHE_MAX_BYTES", str(5 * 1024**3)))
+
+    if args.action == "run":
+        if not args.command:
+            parser.error("run needs a command")
+        return run(args.command, root, paths, keep, max_bytes)
+    if args.action == "evict":
+        for name in evict(root, keep, max_bytes):
+            print(f"evicted {name}")
+        return 0
+    for snapshot in snapshots(root):
+        print(f"{snapshot.path.name}  {snapshot.size / 1024 ** 2:.1f} MiB")
+    return 0
+
+
+def _remove(path: Path) -> None:
+    # Claim the directory first so two tasks evicting at once don't trip over
+    # each other
+    trash = path.with_name(f"{TRASH_PREFIX}{uuid.uuid4().hex[:8]}")
+    try:
+        path.rename(trash)
+    except OSError:
+        return
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def _size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def _log(message: str) -> None:
+    print(f"[cache_volume] {message}", flush=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
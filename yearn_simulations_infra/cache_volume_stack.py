@@ -0,0 +1,111 @@
+from typing import Dict, List
+
+import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_ecs as ecs
+import aws_cdk.aws_efs as efs
+from aws_cdk import core as cdk
+
+from yearn_scheduled_task import INFRA_RUNTIME_PATH
+
+CACHE_VOLUME_NAME = "CacheVolume"
+CACHE_MOUNT_PATH = "/mnt/cache"
+
+
+class CacheVolumeStack(cdk.Stack):
+    """
+    EFS volume keeping brownie's caches between task runs.
+
+    Tasks mounting it run their command through `cache_volume.py`, which
+    copies the newest cache snapshot in before the command and publishes a
+    new one after it.
+    """
+
+    @property
+    def cache_environment(self) -> Dict[str, str]:
+        """
+        Environment `cache_volume.py` reads, to add to the containers mounting
+        the volume.
+        """
+        return {
+            "CACHE_ROOT": CACHE_MOUNT_PATH,
+            "CACHE_VERSION": self._version,
+            "CACHE_KEEP": str(self._keep),
+            "CACHE_MAX_BYTES": str(self._max_bytes),
+        }
+
+    def __init__(
+        self,
+        scope: cdk.Construct,
+        construct_id: str,
+        vpc: ec2.IVpc,
+        version: str = "1",
+        keep: int = 3,
+        max_bytes: int = 5 * 1024**3,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self._version = version
+        self._keep = keep
+        self._max_bytes = max_bytes
+
+        self._vpc = vpc
+
+        # Only caches live here, nothing is lost when it is replaced
+        self._file_system = efs.FileSystem(
+            self,
+            "CacheFileSystem",
+            vpc=self._vpc,
+            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+            encrypted=True,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+        self._file_system.connections.allow_default_port_from(
+            ec2.Peer.ipv4(self._vpc.vpc_cidr_block)
+        )
+
+        # Every task sees the same owner whatever user its image runs as
+        self._access_point = self._file_system.add_access_point(
+            "BrownieCacheAccessPoint",
+            path="/brownie-cache",
+            create_acl=efs.Acl(owner_uid="1000", owner_gid="1000", permissions="755"),
+            posix_user=efs.PosixUser(uid="1000", gid="1000"),
+        )
+
+    def mount(
+        self, task_definition: ecs.TaskDefinition, container: ecs.ContainerDefinition
+    ) -> None:
+        task_definition.add_volume(
+            name=CACHE_VOLUME_NAME,
+            efs_volume_configuration=ecs.EfsVolumeConfiguration(
+                file_system_id=self._file_system.file_system_id,
+                transit_encryption="ENABLED",
+                authorization_config=ecs.AuthorizationConfig(
+                    access_point_id=self._access_point.access_point_id,
+                    iam="ENABLED",
+                ),
+            ),
+        )
+        container.add_mount_points(
+            ecs.MountPoint(
+                container_path=CACHE_MOUNT_PATH,
+                source_volume=CACHE_VOLUME_NAME,
+                read_only=False,
+            )
+        )
+        self._file_system.grant(
+            task_definition.task_role,
+            "elasticfilesystem:ClientMount",
+            "elasticfilesystem:ClientWrite",
+        )
+
+    @staticmethod
+    def wrap(command: List[str]) -> List[str]:
+        """`command` run between restoring and publishing the caches."""
+        return [
+            "python3",
+            f"{INFRA_RUNTIME_PATH}/cache_volume.py",
+            "run",
+            "--",
+            *command,
+        ]
@@ -0,0 +1,57 @@
+import shutil
+from pathlib import Path
+
+DOCKERFILE = Path(__file__).resolve().parent.parent / "docker" / "Dockerfile"
+RUNTIME_DIR = Path(__file__).resolve().parent
+
+# `PLATFORM` build argument of the Dockerfile per Fargate CPU architecture
+IMAGE_PLATFORMS = {"X86_64": "linux/amd64", "ARM64": "linux/arm64"}
+
+# Modules of this package that run inside the task containers. Only these
+# are copied into the image, so changing the stacks doesn't rebuild it.
+RUNTIME_MODULES = (
+    "batch_runner.py",
+    "cache_volume.py",
+    "cron.py",
+    "rpc_proxy.py",
+    "scheduler_service.py",
+    "simulation_cache.py",
+    "task_metrics.py",
+)
+
+# Workspace files that don't belong in the image or would make its hash
+# change without a reason
+WORKSPACE_IGNORE = (
+    ".git",
+    ".github",
+    ".venv",
+    "venv",
+    "__pycache__",
+    "*.pyc",
+    "node_modules",
+    "build",
+    "reports",
+    ".hypothesis",
+    ".pytest_cache",
+)
+
+
+def stage_image_context(workspace_path: Path, context_path: Path) -> Path:
+    """
+    Lay out the build context of `docker/Dockerfile` in `context_path`: the
+    Dockerfile, the workspace in `app/` and the runtime modules in `infra/`.
+    """
+    if context_path.exists():
+        shutil.rmtree(context_path)
+    context_path.mkdir(parents=True)
+
+    shutil.copy2(DOCKERFILE, context_path / "Dockerfile")
+    shutil.copytree(
+        workspace_path,
+        context_path / "app",
+        ignore=shutil.ignore_patterns(*WORKSPACE_IGNORE),
+    )
+    (context_path / "infra").mkdir()
+    for module in RUNTIME_MODULES:
+        shutil.copy2(RUNTIME_DIR / module, context_path / "infra" / module)
+    return context_path
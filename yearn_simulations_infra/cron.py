@@ -0,0 +1,172 @@
+import calendar
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Set
+
+# Names EventBridge accepts in the month and day-of-week fields. Days of the
+# week are numbered 1 (Sunday) to 7 (Saturday).
+MONTH_NAMES = {
+    name: number
+    for number, name in enumerate(
+        "JAN FEB MAR APR MAY JUN JUL AUG SEP OCT NOV DEC".split(), start=1
+    )
+}
+WEEK_DAY_NAMES = {
+    name: number
+    for number, name in enumerate("SUN MON TUE WED THU FRI SAT".split(), start=1)
+}
+
+
+class CronSchedule:
+    """
+    An EventBridge cron expression, with the same fields and defaults as
+    `Schedule.cron(...)`, that can be matched against times.
+
+    `L` is supported in the day-of-month field and `#` in the day-of-week
+    field. `W` is not.
+    """
+
+    def __init__(
+        self,
+        minute: Optional[str] = None,
+        hour: Optional[str] = None,
+        day: Optional[str] = None,
+        month: Optional[str] = None,
+        week_day: Optional[str] = None,
+        year: Optional[str] = None,
+    ) -> None:
+        self.minute = str(minute) if minute is not None else "*"
+        self.hour = str(hour) if hour is not None else "*"
+        self.day = str(day) if day is not None else ("?" if week_day else "*")
+        self.month = str(month) if month is not None else "*"
+        self.week_day = str(week_day) if week_day is not None else "?"
+        self.year = str(year) if year is not None else "*"
+        if self.day != "?" and self.week_day != "?":
+            raise ValueError(
+                f"`{self.expression}` sets both the day of the month and the day "
+                "of the week, EventBridge needs one of them to be `?`"
+            )
+
+        self._minutes = _parse_field(self.minute, 0, 59)
+        self._hours = _parse_field(self.hour, 0, 23)
+        self._months = _parse_field(self.month, 1, 12, MONTH_NAMES)
+        self._years = _parse_field(self.year, 1970, 2199)
+
+    @classmethod
+    def from_expression(cls, expression: str) -> "CronSchedule":
+        """Parse `cron(0 12 * * ? *)` or the six fields on their own."""
+        if expression.startswith("cron(") and expression.endswith(")"):
+            expression = expression[len("cron(") : -1]
+        fields = expression.split()
+        if len(fields) != 6:
+            raise ValueError(f"Expected six cron fields in `{expression}`")
+        minute, hour, day, month, week_day, year = fields
+        return cls(minute, hour, day, month, week_day, year)
+
+    @property
+    def minutes(self) -> Set[int]:
+        return set(self._minutes)
+
+    @property
+    def hours(self) -> Set[int]:
+        return set(self._hours)
+
+    @property
+    def expression(self) -> str:
+        return (
+            f"cron({self.minute} {self.hour} {self.day} "
+            f"{self.month} {self.week_day} {self.year})"
+        )
+
+    def matches(self, time: datetime) -> bool:
+        return (
+            time.minute in self._minutes
+            and time.hour in self._hours
+            and self._matches_date(time)
+        )
+
+    def fire_times(self, start: datetime, end: datetime) -> Iterator[datetime]:
+        """Every time the schedule fires in `[start, end)`, in order."""
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < end:
+            if self._matches_date(day):
+                for hour in sorted(self._hours):
+                    for minute in sorted(self._minutes):
+                        time = day.replace(hour=hour, minute=minute)
+                        if start <= time < end:
+                            yield time
+            day += timedelta(days=1)
+
+    def _matches_date(self, time: datetime) -> bool:
+        if time.month not in self._months or time.year not in self._years:
+            return False
+        if self.day != "?" and not _matches_day_of_month(self.day, time):
+            return False
+        if self.week_day != "?" and not _matches_day_of_week(self.week_day, time):
+            return False
+        return True
+
+
+def _matches_day_of_month(field: str, time: datetime) -> bool:
+    last_day = calendar.monthrange(time.year, time.month)[1]
+    for part in field.split(","):
+        if part == "L":
+            if time.day == last_day:
+                return True
+        elif part.endswith("W"):
+            raise ValueError(f"`W` in the day-of-month field is not supported: {field}")
+        elif time.day in _parse_field(part, 1, 31):
+            return True
+    return False
+
+
+def _matches_day_of_week(field: str, time: datetime) -> bool:
+    # Python counts Monday as 0, EventBridge counts Sunday as 1
+    week_day = (time.weekday() + 1) % 7 + 1
+    for part in field.split(","):
+        if "#" in part:
+            day, _, nth = part.partition("#")
+            if _parse_value(day, WEEK_DAY_NAMES) == week_day and (
+                (time.day - 1) // 7 + 1 == int(nth)
+            ):
+                return True
+        elif week_day in _parse_field(part, 1, 7, WEEK_DAY_NAMES):
+            return True
+    return False
+
+
+def _parse_field(field: str, low: int, high: int, names=None) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        if part in ("*", "?"):
+            values.update(range(low, high + 1))
+            continue
+
+        part, _, step = part.partition("/")
+        if part in ("*", "?"):
+            first, last = low, high
+        elif "-" in part:
+            first_name, _, last_name = part.partition("-")
+            first, last = _parse_value(first_name, names), _parse_value(
+                last_name, names
+            )
+        else:
+            first = _parse_value(part, names)
+            last = high if step else first
+
+        if not low <= first <= high or not low <= last <= high:
+            raise ValueError(f"`{field}` is outside of {low}-{high}")
+        if last >= first:
+            values.update(range(first, last + 1, int(step or 1)))
+        else:
+            # Ranges may wrap around, e.g. FRI-MON
+            values.update(
+                value if value <= high else value - (high - low + 1)
+                for value in range(first, last + (high - low + 1) + 1, int(step or 1))
+            )
+    return values
+
+
+def _parse_value(value: str, names=None) -> int:
+    if names and value.upper() in names:
+        return names[value.upper()]
+    return int(value)
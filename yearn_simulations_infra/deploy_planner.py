@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Plan a deploy of only the stacks that changed since the last one.
+
+Hashes the template and the assets of every stack in a synthesized cloud
+assembly and compares them to the hashes recorded after the last successful
+deploy. The stacks whose hash changed, or that weren't deployed before, are
+printed one per line in dependency order, for `cdk deploy --exclusively`:
+
+    cdk synth -q -o cdk.out
+    python yearn_simulations_infra/deploy_planner.py plan --state deploy-state.json
+    cdk deploy --app cdk.out --exclusively $(python ... plan --state deploy-state.json)
+    python yearn_simulations_infra/deploy_planner.py record --state deploy-state.json
+
+Assets are hashed by the fingerprint `cdk` gave them, which covers their
+content. Stacks only reference each other through exports, which are part of
+their templates, so a stack doesn't have to be deployed because a stack it
+depends on changed. It is only deployed after it.
+
+Without a state file every stack is planned.
+
+Until the `ScheduledTask<script>` stacks of the old one stack per script
+layout are deleted, the scheduled tasks stack carries their names in the
+assembly and `plan` refuses to plan, see `legacy_stacks`.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+STACK_ARTIFACT = "aws:cloudformation:stack"
+ASSET_METADATA = "aws:cdk:asset"
+# CloudFormation names of stacks to delete before deploying
+LEGACY_STACKS_METADATA = "yearn:legacy-stacks"
+STATE_VERSION = 1
+
+
+class AssemblyStack:
+    """A stack of a cloud assembly, by the name `cdk deploy` selects it with."""
+
+    def __init__(
+        self, name: str, artifact_id: str, digest: str, dependencies: List[str]
+    ) -> None:
+        self.name = name
+        self.artifact_id = artifact_id
+        self.digest = digest
+        self.dependencies = dependencies
+
+
+def read_assembly(assembly: Path) -> Dict[str, AssemblyStack]:
+    """The stacks of the cloud assembly in `assembly`, keyed by artifact id."""
+    manifest = json.loads((assembly / "manifest.json").read_text())
+    if manifest.get("missing"):
+        keys = ", ".join(missing["key"] for missing in manifest["missing"])
+        raise ValueError(f"The assembly was synthesized with missing lookups: {keys}")
+
+    stacks = {}
+    for artifact_id, artifact in manifest["artifacts"].items():
+        if artifact["type"] != STACK_ARTIFACT:
+            continue
+        digest = hashlib.sha256()
+        digest.update((assembly / artifact["properties"]["templateFile"]).read_bytes())
+        assets = sorted(
+            (entry["data"]["packaging"], entry["data"]["id"])
+            for entries in artifact.get("metadata", {}).values()
+            for entry in entries
+            if entry["type"] == ASSET_METADATA
+        )
+        digest.update(json.dumps(assets).encode())
+        stacks[artifact_id] = AssemblyStack(
+            artifact.get("displayName", artifact_id),
+            artifact_id,
+            digest.hexdigest(),
+            artifact.get("dependencies", []),
+        )
+    return stacks
+
+
+def legacy_stacks(assembly: Path) -> List[str]:
+    """Stacks the assembly asks to delete before any of its stacks is deployed."""
+    manifest = json.loads((assembly / "manifest.json").read_text())
+    return sorted(
+        stack_name
+        for artifact in manifest["artifacts"].values()
+        for entries in artifact.get("metadata", {}).values()
+        for entry in entries
+        if entry["type"] == LEGACY_STACKS_METADATA
+        for stack_name in entry["data"]
+    )
+
+
+def dependency_order(stacks: Dict[str, AssemblyStack]) -> List[AssemblyStack]:
+    """Every stack after the stacks it depends on, by name where it is free to."""
+    ordered: List[AssemblyStack] = []
+    placed = set()
+    remaining = dict(stacks)
+    while remaining:
+        ready = sorted(
+            (
+                stack
+                for stack in remaining.values()
+                if all(
+                    dependency in placed or dependency not in stacks
+                    for dependency in stack.dependencies
+                )
+            ),
+            key=lambda stack: stack.name,
+        )
+        if not ready:
+            raise ValueError(
+                "The stacks depend on each other in a cycle: "
+                f"{', '.join(sorted(remaining))}"
+            )
+        for stack in ready:
+            ordered.append(stack)
+            placed.add(stack.artifact_id)
+            del remaining[stack.artifact_id]
+    return ordered
+
+
+def read_state(path: Path) -> Dict[str, str]:
+    """Hashes of the stacks as last deployed, keyed by stack name."""
+    if not path.exists():
+        return {}
+    state = json.loads(path.read_text())
+    if state.get("version") != STATE_VERSION:
+        return {}
+    return state["stacks"]
+
+
+def write_state(path: Path, stacks: Dict[str, AssemblyStack]) -> None:
+    path.write_text(
+        json.dumps(
+            {
+                "version": STATE_VERSION,
+                "stacks": {stack.name: stack.digest for stack in stacks.values()},
+            },
+            indent=2,
+            sort_keys=True,
+        )
+        + "\n"
+    )
+
+
+def plan(stacks: Dict[str, AssemblyStack], deployed: Dict[str, str]) -> Dict[str, Any]:
+    """The stacks to deploy in order, and why, with the stacks that are unchanged."""
+    deploy, reasons, unchanged = [], {}, []
+    for stack in dependency_order(stacks):
+        if stack.name not in deployed:
+            reasons[stack.name] = "new"
+        elif deployed[stack.name] != stack.digest:
+            reasons[stack.name] = "changed"
+        else:
+            unchanged.append(stack.name)
+            continue
+        deploy.append(stack.name)
+    names = {stack.name for stack in stacks.values()}
+    return {
+        "deploy": deploy,
+        "reasons": reasons,
+        "unchanged": unchanged,
+        # Not deployed by `cdk deploy`, they have to be destroyed by hand
+        "removed": sorted(name for name in deployed if name not in names),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=("plan", "record"))
+    parser.add_argument(
+        "--assembly",
+        type=Path,
+        default=Path("cdk.out"),
+        help="Synthesized cloud assembly",
+    )
+    parser.add_argument(
+        "--state",
+        type=Path,
+        required=True,
+        help="Hashes of the last successful deploy, written by `record`",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the plan as JSON")
+    args = parser.parse_args(argv)
+
+    stacks = read_assembly(args.assembly)
+    if args.command == "record":
+        write_state(args.state, stacks)
+        print(f"Recorded {len(stacks)} stacks in {args.state}", file=sys.stderr)
+        return 0
+
+    legacy = legacy_stacks(args.assembly)
+    if legacy:
+        # Deploying first would fail on the exports they import, or run
+        # their scripts twice
+        for stack_name in legacy:
+            print(
+                f"aws cloudformation delete-stack --stack-name {stack_name}",
+                file=sys.stderr,
+            )
+        print(
+            f"Delete the {len(legacy)} stacks above if they are still deployed, "
+            "then synth with -c legacyTaskStacksDeleted=true",
+            file=sys.stderr,
+        )
+        return 1
+
+    result = plan(stacks, read_state(args.state))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    for name in result["deploy"]:
+        print(name)
+        print(f"{result['reasons'][name]:>8} {name}", file=sys.stderr)
+    print(f"{len(result['unchanged'])} stacks unchanged", file=sys.stderr)
+    for name in result["removed"]:
+        print(f"{name} is no longer in the app, destroy it by hand", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+from typing import Any, Dict, List, Optional
+
+import aws_cdk.aws_ecs as ecs
+import aws_cdk.aws_events as events
+
+# Memory (MiB) Fargate accepts for every CPU (units) setting.
+# See https://docs.aws.amazon.com/AmazonECS/latest/developerguide/task-cpu-memory-error.html
+FARGATE_MEMORY_BY_CPU: Dict[int, List[int]] = {
+    256: [512, 1024, 2048],
+    512: list(range(1024, 4096 + 1, 1024)),
+    1024: list(range(2048, 8192 + 1, 1024)),
+    2048: list(range(4096, 16384 + 1, 1024)),
+    4096: list(range(8192, 30720 + 1, 1024)),
+    8192: list(range(16384, 61440 + 1, 4096)),
+    16384: list(range(32768, 122880 + 1, 8192)),
+}
+
+# Fargate always gives tasks 20 GiB, and can be raised up to 200 GiB
+MIN_EPHEMERAL_STORAGE_GIB = 21
+MAX_EPHEMERAL_STORAGE_GIB = 200
+
+X86_64 = "X86_64"
+ARM64 = "ARM64"
+ARCHITECTURES = (X86_64, ARM64)
+
+# Capacity scheduled tasks run on. Spot tasks can be stopped whenever AWS
+# needs the capacity back, see `task_launcher.py` for their retries.
+ON_DEMAND = "on_demand"
+SPOT = "spot"
+CAPACITIES = (ON_DEMAND, SPOT)
+CAPACITY_PROVIDERS = {ON_DEMAND: "FARGATE", SPOT: "FARGATE_SPOT"}
+
+
+class InvalidFargateProfile(ValueError):
+    pass
+
+
+class FargateProfile:
+    """
+    CPU, memory, ephemeral storage and CPU architecture a task runs with.
+    """
+
+    def __init__(
+        self,
+        cpu: int = 1024,
+        memory: int = 2048,
+        ephemeral_storage: Optional[int] = None,
+        architecture: str = X86_64,
+    ) -> None:
+        self.cpu = cpu
+        self.memory = memory
+        self.ephemeral_storage = ephemeral_storage
+        self.architecture = architecture.upper()
+
+    @classmethod
+    def from_options(
+        cls, options: Dict[str, Any], default: Optional["FargateProfile"] = None
+    ) -> "FargateProfile":
+        """Read the profile keywords passed to the scheduler decorator."""
+        default = default or cls()
+        return cls(
+            cpu=int(options.get("cpu", default.cpu)),
+            memory=int(options.get("memory", default.memory)),
+            ephemeral_storage=options.get(
+                "ephemeral_storage", default.ephemeral_storage
+            ),
+            architecture=options.get("architecture", default.architecture),
+        )
+
+    @property
+    def name(self) -> str:
+        name = f"Cpu{self.cpu}Memory{self.memory}"
+        if self.ephemeral_storage:
+            name += f"Storage{self.ephemeral_storage}"
+        if self.architecture != X86_64:
+            name += self.architecture.capitalize()
+        return name
+
+    def validate(self, owner: str) -> None:
+        if self.cpu not in FARGATE_MEMORY_BY_CPU:
+            raise InvalidFargateProfile(
+                f"{owner} asks for cpu={self.cpu}, but Fargate only supports cpu of "
+                f"{', '.join(str(cpu) for cpu in FARGATE_MEMORY_BY_CPU)}."
+            )
+
+        memory_options = FARGATE_MEMORY_BY_CPU[self.cpu]
+        if self.memory not in memory_options:
+            raise InvalidFargateProfile(
+                f"{owner} asks for memory={self.memory} with cpu={self.cpu}, but "
+                "Fargate only supports memory of "
+                f"{_describe_memory_options(memory_options)} "
+                "with that cpu."
+            )
+
+        if self.ephemeral_storage is not None and not (
+            MIN_EPHEMERAL_STORAGE_GIB
+            <= self.ephemeral_storage
+            <= MAX_EPHEMERAL_STORAGE_GIB
+        ):
+            raise InvalidFargateProfile(
+                f"{owner} asks for ephemeral_storage={self.ephemeral_storage}, but "
+                f"Fargate only supports between {MIN_EPHEMERAL_STORAGE_GIB} and "
+                f"{MAX_EPHEMERAL_STORAGE_GIB} GiB."
+            )
+
+        if self.architecture not in ARCHITECTURES:
+            raise InvalidFargateProfile(
+                f"{owner} asks for architecture={self.architecture}, but Fargate only "
+                f"supports {' and '.join(ARCHITECTURES)}."
+            )
+
+    def create_task_definition(
+        self, scope: Any, construct_id: str, **kwargs
+    ) -> ecs.FargateTaskDefinition:
+        task_definition = ecs.FargateTaskDefinition(
+            scope,
+            construct_id,
+            cpu=self.cpu,
+            memory_limit_mib=self.memory,
+            ephemeral_storage_gib=self.ephemeral_storage,
+            **kwargs,
+        )
+        apply_architecture(task_definition, self.architecture)
+        return task_definition
+
+
+def apply_architecture(task_definition: ecs.TaskDefinition, architecture: str) -> None:
+    # This version of the ECS module has no `runtime_platform` setting yet, so
+    # set it on the CloudFormation resource directly.
+    if architecture == X86_64:
+        return
+    task_definition.node.default_child.add_property_override(
+        "RuntimePlatform",
+        {"CpuArchitecture": architecture, "OperatingSystemFamily": "LINUX"},
+    )
+
+
+def apply_capacity(rule: events.Rule, capacity: str, target_count: int = 1) -> None:
+    """Start the ECS task targets of `rule` on `capacity`."""
+    # The events targets of this version have no capacity provider strategy
+    # yet, and a target can't have one next to its launch type
+    if capacity == ON_DEMAND:
+        return
+    for index in range(target_count):
+        rule.node.default_child.add_property_override(
+            f"Targets.{index}.EcsParameters.CapacityProviderStrategy",
+            [{"CapacityProvider": CAPACITY_PROVIDERS[capacity], "Weight": 1}],
+        )
+        rule.node.default_child.add_property_deletion_override(
+            f"Targets.{index}.EcsParameters.LaunchType"
+        )
+
+
+def _describe_memory_options(memory_options: List[int]) -> str:
+    if len(memory_options) <= 4:
+        return ", ".join(str(memory) for memory in memory_options)
+    step = memory_options[1] - memory_options[0]
+    return f"{memory_options[0]} to {memory_options[-1]} in steps of {step}"
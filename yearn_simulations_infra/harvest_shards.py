@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Sharding of the harvest bot over parallel tasks, and a per-shard completion
+report.
+
+Every harvest tick starts `SHARD_COUNT` tasks, each with its own
+`SHARD_INDEX`. The runner keeps the strategies where
+`shard_of(strategy_address, SHARD_COUNT) == SHARD_INDEX`, which only depends
+on the address, so a strategy stays on its shard whatever else is added.
+
+The stopped events of the shards are written to a log group. Export them
+and report on them with:
+
+    aws logs filter-log-events --log-group-name <group> --start-time <ms> > stopped.json
+    python yearn_simulations_infra/harvest_shards.py stopped.json --shards 4
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# EventBridge takes at most 5 targets per rule
+MAX_RULE_TARGETS = 5
+
+# Name scheduled scripts depend on the harvest bot by, see `job_graph.py`
+HARVEST_BOT_JOB = "HarvestBot"
+
+
+def shard_of(key: str, shard_count: int) -> int:
+    digest = hashlib.sha256(key.lower().encode()).hexdigest()
+    return int(digest, 16) % shard_count
+
+
+def shard_environment(shard_index: int, shard_count: int) -> Dict[str, str]:
+    return {"SHARD_INDEX": str(shard_index), "SHARD_COUNT": str(shard_count)}
+
+
+def rule_shards(shard_count: int) -> List[List[int]]:
+    """Shard indexes grouped by the rule starting them."""
+    shards = list(range(shard_count))
+    return [
+        shards[start : start + MAX_RULE_TARGETS]
+        for start in range(0, shard_count, MAX_RULE_TARGETS)
+    ]
+
+
+def shard_schedules(shard_count: int) -> List[str]:
+    """Schedules the task launcher starts the shards under, one lease each."""
+    if shard_count == 1:
+        return ["HarvestBotTask"]
+    return [f"HarvestBotTaskShard{shard_index}" for shard_index in range(shard_count)]
+
+
+def shard_completion(event: Dict[str, Any]) -> Dict[str, Any]:
+    """One shard's outcome from its `ECS Task State Change` event."""
+    detail = event["detail"]
+    environment = {}
+    # Shard 0 runs with the task definition's environment, the others
+    # override it
+    for override in detail.get("overrides", {}).get("containerOverrides", []):
+        for variable in override.get("environment", []):
+            environment[variable["name"]] = variable["value"]
+    container = (detail.get("containers") or [{}])[0]
+    started_at, stopped_at = detail.get("startedAt"), detail.get("stoppedAt")
+    return {
+        "shard": int(environment.get("SHARD_INDEX", 0)),
+        "tick": (detail.get("createdAt") or event["time"])[:16],
+        "exit_code": container.get("exitCode"),
+        "reason": detail.get("stoppedReason"),
+        "seconds": (
+            (_parse(stopped_at) - _parse(started_at)).total_seconds()
+            if started_at and stopped_at
+            else None
+        ),
+    }
+
+
+def completion_report(
+    events: Iterable[Dict[str, Any]], shard_count: int
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Per tick, the shards that finished, failed or never reported, and the
+    wall clock time of the slowest shard.
+    """
+    ticks: Dict[str, Dict[int, Dict[str, Any]]] = {}
+    for event in events:
+        completion = shard_completion(event)
+        ticks.setdefault(completion["tick"], {})[completion["shard"]] = completion
+
+    report = {}
+    for tick, shards in sorted(ticks.items()):
+        durations = [shard["seconds"] for shard in shards.values() if shard["seconds"]]
+        report[tick] = {
+            "succeeded": sorted(
+                i for i, shard in shards.items() if shard["exit_code"] == 0
+            ),
+            "failed": sorted(
+                i for i, shard in shards.items() if shard["exit_code"] != 0
+            ),
+            "missing": [i for i in range(shard_count) if i not in shards],
+            "wall_clock_seconds": max(durations) if durations else None,
+        }
+    return report
+
+
+def read_events(path: Path) -> List[Dict[str, Any]]:
+    """Events from `aws logs filter-log-events` output or JSON lines."""
+    text = path.read_text()
+    try:
+        document = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(document, dict) and "events" in document:
+        return [json.loads(event["message"]) for event in document["events"]]
+    return document if isinstance(document, list) else [document]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Report the harvest bot shards per tick."
+    )
+    parser.add_argument("events", type=Path, nargs="+")
+    parser.add_argument(
+        "--shards", type=int, required=True, help="Shard count of the ticks"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    events = [event for path in args.events for event in read_events(path)]
+    report = completion_report(events, args.shards)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    incomplete = 0
+    for tick, outcome in report.items():
+        wall_clock = outcome["wall_clock_seconds"]
+        print(
+            f"{tick}  ok {len(outcome['succeeded'])}/{args.shards}"
+            f"  failed {outcome['failed'] or '-'}  missing {outcome['missing'] or '-'}"
+            f"  wall clock {f'{wall_clock:.0f}s' if wall_clock is not None else '-'}"
+        )
+        incomplete += bool(outcome["failed"] or outcome["missing"])
+    return 1 if incomplete else 0
+
+
+def _parse(timestamp: str) -> datetime:
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
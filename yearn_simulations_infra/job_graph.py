@@ -0,0 +1,183 @@
+"""
+Scheduled scripts started when the jobs they depend on complete, instead of
+on a cron schedule of their own.
+
+A script passing `depends_on=["fetch_prices", "HarvestBot"]` to the
+scheduler decorator runs once every job it depends on has completed
+successfully. Jobs are the scripts run as tasks, and `HarvestBot`, which
+completes once all of its shards have. `JobGraph` checks at synth time that
+every job depended on exists and that no job ends up depending on itself.
+
+At run time the task launcher starts the downstream jobs, see
+`task_launcher.py`. Each downstream job has an events rule matching the
+successful stopped events of its upstream jobs' tasks, so one job completing
+can start many (fan-out). A job depending on several (fan-in) waits behind
+a `FanInGate`. The gate records each upstream completion and opens once all
+of them completed within `FAN_IN_WINDOW_SECONDS`. It then starts the job
+once and starts over.
+
+`DynamoGateStore` keeps the gates in the table of the task launcher,
+`InMemoryGateStore` is a stand-in with the same behavior.
+"""
+
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Completions older than this don't count towards a fan-in, so a failed
+# upstream doesn't pair with the next run of the others
+FAN_IN_WINDOW_SECONDS = 6 * 3600
+
+_VISITING = 1
+_VISITED = 2
+
+
+class InvalidJobGraph(ValueError):
+    pass
+
+
+class JobGraph:
+    def __init__(self, dependencies: Dict[str, List[str]], jobs: Iterable[str]) -> None:
+        """`dependencies` lists the jobs each job depends on, out of `jobs`."""
+        self.dependencies = {
+            job: list(upstream) for job, upstream in dependencies.items() if upstream
+        }
+        self.jobs = set(jobs)
+
+    @property
+    def pipelined(self) -> Set[str]:
+        """Jobs depending on another job or depended on."""
+        pipelined = set()
+        for job, upstream in self.dependencies.items():
+            pipelined.update([job, *upstream])
+        return pipelined
+
+    def validate(self) -> None:
+        """Report every unknown job and a cycle if there is one, all at once."""
+        errors = []
+        for job, upstreams in sorted(self.dependencies.items()):
+            if job not in self.jobs:
+                errors.append(
+                    f"`{job}` depends on other jobs, but doesn't run as a task."
+                )
+            errors.extend(
+                f"`{job}` depends on `{upstream}`, which isn't a script run as a "
+                "task or HarvestBot."
+                for upstream in upstreams
+                if upstream not in self.jobs
+            )
+        cycle = self.find_cycle()
+        if cycle:
+            errors.append(
+                "Jobs depend on each other in a cycle: " + " depends on ".join(cycle)
+            )
+        if errors:
+            raise InvalidJobGraph("\n".join(errors))
+
+    def find_cycle(self) -> Optional[List[str]]:
+        """A path of jobs each depending on the next, back to the first."""
+        state: Dict[str, int] = {}
+        for start in sorted(self.dependencies):
+            if start in state:
+                continue
+            path = [start]
+            state[start] = _VISITING
+            pending = [iter(sorted(self.dependencies[start]))]
+            while pending:
+                upstream = next(pending[-1], None)
+                if upstream is None:
+                    state[path.pop()] = _VISITED
+                    pending.pop()
+                elif state.get(upstream) == _VISITING:
+                    return path[path.index(upstream) :] + [upstream]
+                elif upstream not in state:
+                    path.append(upstream)
+                    state[upstream] = _VISITING
+                    pending.append(iter(sorted(self.dependencies.get(upstream, []))))
+        return None
+
+
+def gate_id(schedule: str) -> str:
+    """Id of the fan-in gate of a schedule, next to its lease in the same table."""
+    return "gate-" + hashlib.sha256(schedule.encode()).hexdigest()[:30]
+
+
+class InMemoryGateStore:
+    def __init__(self) -> None:
+        self._gates: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def complete(self, gate_id: str, upstream: str, now: float) -> Dict[str, float]:
+        """Record that `upstream` completed, returning every completion of the gate."""
+        with self._lock:
+            completions = self._gates.setdefault(gate_id, {})
+            completions[upstream] = now
+            return dict(completions)
+
+    def reset(self, gate_id: str) -> bool:
+        """Start the gate over, False if another launch just did."""
+        with self._lock:
+            return self._gates.pop(gate_id, None) is not None
+
+
+class DynamoGateStore:
+    """
+    Gates in the task launcher's table, keyed by `gate_id` with an attribute
+    per completed upstream holding when it completed.
+    """
+
+    def __init__(self, table_name: str, client: Any) -> None:
+        self._table_name = table_name
+        self._client = client
+        self._conditional_check_failed = (
+            client.exceptions.ConditionalCheckFailedException
+        )
+
+    def complete(self, gate_id: str, upstream: str, now: float) -> Dict[str, float]:
+        response = self._client.update_item(
+            TableName=self._table_name,
+            Key={"lease_id": {"S": gate_id}},
+            UpdateExpression="SET #upstream = :now",
+            ExpressionAttributeNames={"#upstream": upstream},
+            ExpressionAttributeValues={":now": {"N": str(now)}},
+            ReturnValues="ALL_NEW",
+        )
+        return {
+            name: float(value["N"])
+            for name, value in response["Attributes"].items()
+            if name != "lease_id"
+        }
+
+    def reset(self, gate_id: str) -> bool:
+        try:
+            self._client.delete_item(
+                TableName=self._table_name,
+                Key={"lease_id": {"S": gate_id}},
+                ConditionExpression="attribute_exists(lease_id)",
+            )
+        except self._conditional_check_failed:
+            return False
+        return True
+
+
+class FanInGate:
+    def __init__(self, store: Any, window_seconds: int = FAN_IN_WINDOW_SECONDS) -> None:
+        self._store = store
+        self._window_seconds = window_seconds
+
+    def open(
+        self, gate_id: str, completed: str, requires: List[str], now: float
+    ) -> bool:
+        """
+        Record that `completed` completed, True when every one of `requires`
+        did within the window. Only one of the launches completing a gate
+        together gets True.
+        """
+        completions = self._store.complete(gate_id, completed, now)
+        if not all(
+            completions.get(upstream, now - self._window_seconds)
+            > now - self._window_seconds
+            for upstream in requires
+        ):
+            return False
+        return self._store.reset(gate_id)
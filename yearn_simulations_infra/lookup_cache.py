@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Keep the context lookups of the app cached in `cdk.context.json`.
+
+The app looks up one thing, the VPC of `SharedStack`. Once its answer is
+committed in `cdk.context.json`, synth never has to reach AWS, which is what
+CI and the benchmarks rely on. This module keeps that true:
+
+    python yearn_simulations_infra/lookup_cache.py validate
+    python yearn_simulations_infra/lookup_cache.py snapshot [--refresh]
+
+`validate` synthesizes the app with the cached context only and fails when a
+lookup is missing, or a cached answer is malformed: the VPC doesn't match the
+key it is cached under, or it has no public subnets for the tasks to run in.
+
+`snapshot` synthesizes the app, performs the lookups it is missing with
+boto3 and writes their answers to `cdk.context.json`. `--refresh` looks up
+the cached VPCs again, e.g. after subnets were added.
+
+The deployment target is taken from `CDK_DEPLOY_ACCOUNT`, `CDK_DEPLOY_REGION`
+and `CDK_DEPLOY_VPC`, falling back to the cached VPC lookup. The scheduled
+scripts are read from `YEARN_SIMULATIONS_WORKSPACE`, or an empty workspace.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_DIR = Path(__file__).resolve().parent
+CONTEXT_FILE = ROOT_DIR / "cdk.context.json"
+
+VPC_PROVIDER = "vpc-provider"
+VPC_LOOKUP_KEY = re.compile(
+    r"^vpc-provider:account=(?P<account>\d+):filter\.vpc-id=(?P<vpc_id>[^:]+)"
+    r":region=(?P<region>[^:]+)"
+)
+# Rounds of `snapshot`, a lookup can depend on the answer of another one
+MAX_SNAPSHOT_ROUNDS = 3
+
+
+def read_cached(path: Path = CONTEXT_FILE) -> Dict[str, Any]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def write_cached(cached: Dict[str, Any], path: Path = CONTEXT_FILE) -> None:
+    path.write_text(json.dumps(dict(sorted(cached.items())), indent=2) + "\n")
+
+
+def deploy_target(cached: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Account, region and VPC of the deployment, from the environment or the cache."""
+    lookups = [VPC_LOOKUP_KEY.match(key) for key in cached]
+    lookup = next((match for match in lookups if match), None)
+    target = (
+        os.environ.get("CDK_DEPLOY_ACCOUNT") or (lookup and lookup["account"]),
+        os.environ.get("CDK_DEPLOY_REGION") or (lookup and lookup["region"]),
+        os.environ.get("CDK_DEPLOY_VPC") or (lookup and lookup["vpc_id"]),
+    )
+    if not all(target):
+        raise ValueError(
+            "cdk.context.json has no cached VPC lookup to synth against, set "
+            "CDK_DEPLOY_ACCOUNT, CDK_DEPLOY_REGION and CDK_DEPLOY_VPC."
+        )
+    return target
+
+
+def synth_environment(
+    workspace: Path,
+    outdir: Path,
+    context: Dict[str, Any],
+    cached: Optional[Dict[str, Any]] = None,
+) -> Dict[str, str]:
+    """
+    Environment of an `app.py` run that only knows the lookups in `cached`,
+    `cdk.context.json` by default.
+    """
+    cached = read_cached() if cached is None else cached
+    account, region, vpc_id = deploy_target(cached)
+
+    full_context = json.loads((ROOT_DIR / "cdk.json").read_text())["context"]
+    full_context.update(cached)
+    full_context.update(context)
+    return {
+        **os.environ,
+        "CDK_CONTEXT_JSON": json.dumps(full_context),
+        "CDK_OUTDIR": str(outdir),
+        "CDK_DEFAULT_ACCOUNT": account,
+        "CDK_DEFAULT_REGION": region,
+        "CDK_DEPLOY_ACCOUNT": account,
+        "CDK_DEPLOY_REGION": region,
+        "CDK_DEPLOY_VPC": vpc_id,
+        "YEARN_SIMULATIONS_WORKSPACE": str(workspace),
+        "PYTHONPATH": os.pathsep.join(
+            path for path in (str(PACKAGE_DIR), os.environ.get("PYTHONPATH")) if path
+        ),
+        "JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION": "1",
+    }
+
+
+def missing_lookups(outdir: Path) -> List[Dict[str, Any]]:
+    """Lookups the synth in `outdir` needed, but didn't find in its context."""
+    return json.loads((outdir / "manifest.json").read_text()).get("missing", [])
+
+
+def synth(
+    workspace: Path,
+    outdir: Path,
+    context: Dict[str, Any],
+    cached: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """Synthesize the app into `outdir`, returning the lookups it is missing."""
+    completed = subprocess.run(
+        [sys.executable, str(ROOT_DIR / "app.py")],
+        cwd=ROOT_DIR,
+        env=synth_environment(workspace, outdir, context, cached),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(
+            f"Synth failed with {completed.returncode}:\n{completed.stdout[-4000:]}"
+        )
+    return missing_lookups(outdir)
+
+
+def check_vpc(key: str, vpc: Dict[str, Any]) -> List[str]:
+    """What is wrong with the cached answer of a VPC lookup."""
+    problems = []
+    props = key_props(key)
+    wanted = props.get("filter", {}).get("vpc-id")
+    if wanted and vpc.get("vpcId") != wanted:
+        problems.append(f"{key}: cached VPC {vpc.get('vpcId')} isn't {wanted}")
+    groups = vpc.get("subnetGroups")
+    if groups is None:
+        # Lookups without `returnAsymmetricSubnets` are cached flat
+        return problems + (
+            [] if vpc.get("publicSubnetIds") else [f"{key}: no public subnets"]
+        )
+    for group in groups:
+        for subnet in group.get("subnets", []):
+            absent = [
+                field
+                for field in ("subnetId", "cidr", "availabilityZone", "routeTableId")
+                if not subnet.get(field)
+            ]
+            if absent:
+                problems.append(
+                    f"{key}: subnet {subnet.get('subnetId')} of {group.get('name')} "
+                    f"has no {', '.join(absent)}"
+                )
+    if not any(
+        group.get("type") == "Public" and group.get("subnets") for group in groups
+    ):
+        problems.append(f"{key}: no public subnets, which every task runs in")
+    return problems
+
+
+def key_props(key: str) -> Dict[str, Any]:
+    """The lookup props a context key was made of, e.g. the `filter` of a VPC."""
+    props: Dict[str, Any] = {}
+    for part in key.split(":")[1:]:
+        name, _, value = part.partition("=")
+        if name.startswith("filter."):
+            props.setdefault("filter", {})[name[len("filter.") :]] = value
+        else:
+            props[name] = {"true": True, "false": False}.get(value, value)
+    return props
+
+
+def lookup_vpc(props: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What `cdk` answers a VPC lookup with, for lookups that return asymmetric
+    subnets. Subnets are public when their route table routes to an internet
+    gateway, private otherwise, unless tagged with `aws-cdk:subnet-type`.
+    """
+    try:
+        import boto3
+    except ImportError:
+        raise RuntimeError(
+            "Taking a snapshot of a lookup needs boto3: pip install boto3"
+        )
+
+    ec2 = boto3.client("ec2", region_name=props["region"])
+    vpcs = ec2.describe_vpcs(
+        Filters=[
+            {"Name": name, "Values": [value]}
+            for name, value in props.get("filter", {}).items()
+        ]
+    )["Vpcs"]
+    if len(vpcs) != 1:
+        raise ValueError(f"Found {len(vpcs)} VPCs matching {props.get('filter')}")
+    vpc_id = vpcs[0]["VpcId"]
+    in_vpc = [{"Name": "vpc-id", "Values": [vpc_id]}]
+
+    subnets = [
+        subnet
+        for page in ec2.get_paginator("describe_subnets").paginate(Filters=in_vpc)
+        for subnet in page["Subnets"]
+    ]
+    route_tables = [
+        table
+        for page in ec2.get_paginator("describe_route_tables").paginate(Filters=in_vpc)
+        for table in page["RouteTables"]
+    ]
+    main_table = next(
+        (
+            table
+            for table in route_tables
+            if any(association.get("Main") for association in table["Associations"])
+        ),
+        None,
+    )
+
+    groups: Dict[str, Dict[str, Any]] = {}
+    for subnet in sorted(subnets, key=lambda subnet: subnet["AvailabilityZone"]):
+        table = next(
+            (
+                table
+                for table in route_tables
+                if any(
+                    association.get("SubnetId") == subnet["SubnetId"]
+                    for association in table["Associations"]
+                )
+            ),
+            main_table,
+        )
+        tags = {tag["Key"]: tag["Value"] for tag in subnet.get("Tags", [])}
+        subnet_type = tags.get("aws-cdk:subnet-type")
+        if subnet_type is None:
+            routes_to_internet = table is not None and any(
+                route.get("GatewayId", "").startswith("igw-")
+                for route in table["Routes"]
+            )
+            subnet_type = (
+                "Public"
+                if routes_to_internet or subnet.get("MapPublicIpOnLaunch")
+                else "Private"
+            )
+        name = tags.get("aws-cdk:subnet-name", subnet_type)
+        groups.setdefault(name, {"name": name, "type": subnet_type, "subnets": []})[
+            "subnets"
+        ].append(
+            {
+                "subnetId": subnet["SubnetId"],
+                "cidr": subnet["CidrBlock"],
+                "availabilityZone": subnet["AvailabilityZone"],
+                "routeTableId": table["RouteTableId"] if table else None,
+            }
+        )
+
+    answer = {
+        "vpcId": vpc_id,
+        "vpcCidrBlock": vpcs[0]["CidrBlock"],
+        "availabilityZones": [],
+        "subnetGroups": list(groups.values()),
+    }
+    vpn_gateways = ec2.describe_vpn_gateways(
+        Filters=[
+            {"Name": "attachment.vpc-id", "Values": [vpc_id]},
+            {"Name": "attachment.state", "Values": ["attached"]},
+            {"Name": "state", "Values": ["available"]},
+        ]
+    )["VpnGateways"]
+    if len(vpn_gateways) == 1:
+        answer["vpnGatewayId"] = vpn_gateways[0]["VpnGatewayId"]
+    return answer
+
+
+def validate(workspace: Path, context: Dict[str, Any]) -> List[str]:
+    cached = read_cached()
+    problems = [
+        problem
+        for key, value in cached.items()
+        if key.startswith(f"{VPC_PROVIDER}:")
+        for problem in check_vpc(key, value)
+    ]
+    with tempfile.TemporaryDirectory() as outdir:
+        for missing in synth(workspace, Path(outdir), context, cached):
+            problems.append(f"{missing['key']}: not cached")
+    return problems
+
+
+def snapshot(
+    workspace: Path, context: Dict[str, Any], refresh: bool = False
+) -> List[str]:
+    """Cache the answers of the missing lookups, returning the keys written."""
+    cached = read_cached()
+    wanted = {
+        key: key_props(key)
+        for key in cached
+        if refresh and key.startswith(f"{VPC_PROVIDER}:")
+    }
+    written = []
+    for _ in range(MAX_SNAPSHOT_ROUNDS):
+        with tempfile.TemporaryDirectory() as outdir:
+            for missing in synth(workspace, Path(outdir), context, cached):
+                wanted[missing["key"]] = missing["props"]
+        if not wanted:
+            break
+        for key, props in wanted.items():
+            if not key.startswith(f"{VPC_PROVIDER}:"):
+                raise ValueError(f"{key}: only VPC lookups can be snapshot")
+            cached[key] = lookup_vpc(props)
+            written.append(key)
+        wanted = {}
+    else:
+        raise RuntimeError(f"Lookups still missing after {MAX_SNAPSHOT_ROUNDS} rounds")
+    write_cached(cached)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=("validate", "snapshot"))
+    parser.add_argument(
+        "--refresh", action="store_true", help="Look up the cached VPCs again"
+    )
+    parser.add_argument(
+        "-c",
+        "--context",
+        action="append",
+        default=[],
+        help="key=value synth context, e.g. -c rpcProxy=true",
+    )
+    args = parser.parse_args(argv)
+    context = dict(definition.split("=", 1) for definition in args.context)
+
+    with tempfile.TemporaryDirectory() as directory:
+        workspace = os.environ.get("YEARN_SIMULATIONS_WORKSPACE")
+        if not workspace:
+            workspace = directory
+            (Path(directory) / "scripts").mkdir()
+
+        if args.command == "snapshot":
+            for key in snapshot(Path(workspace), context, args.refresh):
+                print(f"cached {key}")
+            return 0
+
+        problems = validate(Path(workspace), context)
+    for problem in problems:
+        print(f"INVALID {problem}")
+    if not problems:
+        print(f"Every lookup is cached in {CONTEXT_FILE.name}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Scheduled scaling of the simulator service ahead of the minutes the scheduled
+tasks start in.
+
+The scheduled scripts and the harvest bot send their simulations as they
+start, so the simulator's load arrives on their cron minutes, which are all
+known at synth. `capacity_timeline` raises the simulator's task count `lead`
+minutes before every minute something starts in, by a task per
+`starts_per_task` tasks starting together, and holds it for `hold` minutes.
+Overlapping windows keep the higher count.
+
+`plan_changes` turns the timeline into the scheduled actions
+`YearnSimulationsInfraStack` deploys, each setting a task count on the cron
+minutes it applies at. `format_timeline` shows the plan per hour of the day.
+
+Schedules are compared over the same week as in `schedule_stagger.py`, so
+only schedules repeating every week are planned for.
+"""
+
+import math
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+from cron import WEEK_DAY_NAMES, CronSchedule
+from schedule_stagger import HORIZON_END, HORIZON_START
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# Application Auto Scaling allows this many scheduled actions per service
+MAX_SCHEDULED_ACTIONS = 200
+
+_DAY_NAMES = {number: name for name, number in WEEK_DAY_NAMES.items()}
+
+
+class Prescaling:
+    def __init__(
+        self,
+        lead: int = 5,
+        hold: int = 15,
+        starts_per_task: int = 4,
+        max_tasks: int = 10,
+    ) -> None:
+        """
+        Raise the task count `lead` minutes before tasks start and keep it up
+        for `hold` minutes after, by a task per `starts_per_task` tasks
+        starting together and up to `max_tasks`.
+        """
+        self.lead = lead
+        self.hold = hold
+        self.starts_per_task = starts_per_task
+        self.max_tasks = max_tasks
+
+    def validate(self) -> None:
+        if self.lead < 0 or self.hold < 1:
+            raise ValueError(
+                "Simulator pre-scaling needs lead >= 0 and hold >= 1 minutes, "
+                f"got lead={self.lead} hold={self.hold}."
+            )
+        if self.starts_per_task < 1 or self.max_tasks < 1:
+            raise ValueError(
+                "Simulator pre-scaling needs starts_per_task >= 1 and max_tasks >= 1, "
+                f"got starts_per_task={self.starts_per_task} "
+                f"max_tasks={self.max_tasks}."
+            )
+
+
+class ScalingChange:
+    """Set the task count to `capacity` every time `schedule` fires."""
+
+    def __init__(self, capacity: int, schedule: CronSchedule) -> None:
+        self.capacity = capacity
+        self.schedule = schedule
+
+
+def repeats_weekly(schedule: CronSchedule) -> bool:
+    return (
+        schedule.day in ("*", "?")
+        and schedule.month == "*"
+        and schedule.year == "*"
+        and "#" not in schedule.week_day
+    )
+
+
+def capacity_timeline(
+    schedules: Iterable[CronSchedule], prescaling: Prescaling, base: int
+) -> List[int]:
+    """Task count for every minute of the week, from Monday 00:00 UTC."""
+    starts = Counter()
+    for schedule in schedules:
+        fire_times = schedule.fire_times(HORIZON_START, HORIZON_END)
+        starts.update(_minute_of_week(time) for time in fire_times)
+
+    timeline = [base] * MINUTES_PER_WEEK
+    for minute, count in starts.items():
+        capacity = min(
+            base + math.ceil(count / prescaling.starts_per_task),
+            max(prescaling.max_tasks, base),
+        )
+        # Windows wrap around the end of the week like the schedules do
+        for offset in range(-prescaling.lead, prescaling.hold):
+            index = (minute + offset) % MINUTES_PER_WEEK
+            timeline[index] = max(timeline[index], capacity)
+    return timeline
+
+
+def plan_changes(timeline: List[int], base: int) -> List[ScalingChange]:
+    """
+    The task count changes of `timeline`, one per count and minute of the
+    hour, on the hours and days of the week the change happens.
+    """
+    if min(timeline) == max(timeline) != base:
+        # Something starts every minute, keep the count up all the time
+        return [ScalingChange(timeline[0], CronSchedule(minute="0"))]
+
+    # (capacity, minute) -> day of the week -> hours
+    changes: Dict[Tuple[int, int], Dict[int, Set[int]]] = {}
+    for index, capacity in enumerate(timeline):
+        if capacity == timeline[index - 1]:
+            continue
+        time = HORIZON_START + timedelta(minutes=index)
+        # Python counts Monday as 0, cron counts Sunday as 1
+        week_day = (time.weekday() + 1) % 7 + 1
+        changes.setdefault((capacity, time.minute), {}).setdefault(week_day, set()).add(
+            time.hour
+        )
+
+    planned = []
+    for (capacity, minute), hours_by_day in sorted(changes.items()):
+        days_by_hours: Dict[Tuple[int, ...], List[int]] = {}
+        for week_day, hours in sorted(hours_by_day.items()):
+            days_by_hours.setdefault(tuple(sorted(hours)), []).append(week_day)
+        for hours, week_days in sorted(days_by_hours.items()):
+            week_day_field = _field(week_days, 1, 7)
+            planned.append(
+                ScalingChange(
+                    capacity,
+                    CronSchedule(
+                        minute=str(minute),
+                        hour=_field(hours, 0, 23),
+                        week_day=week_day_field if week_day_field != "*" else None,
+                    ),
+                )
+            )
+    return planned
+
+
+def format_timeline(timeline: List[int], base: int) -> str:
+    """Peak task count per hour of the day, for each group of days alike."""
+    profiles: Dict[Tuple[Tuple[int, int], ...], List[int]] = {}
+    for day in range(7):
+        profile = []
+        for hour in range(24):
+            start = day * MINUTES_PER_DAY + hour * 60
+            minutes = timeline[start : start + 60]
+            profile.append((max(minutes), sum(capacity > base for capacity in minutes)))
+        # Days are counted from Monday, named from Sunday
+        profiles.setdefault(tuple(profile), []).append((day + 1) % 7 + 1)
+
+    lines = []
+    for profile, week_days in profiles.items():
+        days = ", ".join(_DAY_NAMES[week_day] for week_day in week_days)
+        lines.append(
+            f"Simulator tasks per hour (UTC, peak tasks, minutes above {base}), {days}:"
+        )
+        for hour, (peak, minutes) in enumerate(profile):
+            line = f"  {hour:02d}:00 {'#' * peak:<20} {peak} tasks"
+            if minutes:
+                line += f", {minutes} minutes above {base}"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def _minute_of_week(time: datetime) -> int:
+    return int((time - HORIZON_START).total_seconds()) // 60
+
+
+def _field(values: Iterable[int], low: int, high: int) -> str:
+    """Cron field of `values`, with consecutive values as ranges."""
+    values = sorted(values)
+    if values == list(range(low, high + 1)):
+        return "*"
+    ranges = []
+    for value in values:
+        if ranges and ranges[-1][1] == value - 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return ",".join(
+        str(first) if first == last else f"{first}-{last}" for first, last in ranges
+    )
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Suggest Fargate sizes for the scheduled scripts and the simulator bot from
+exported task utilization metrics.
+
+Reads Container Insights performance events, the lines of `task_metrics.py`
+or CloudWatch metric exports saved as CSV, JSON or JSON lines, and writes a
+profile file that synth picks up with `cdk synth -c taskProfiles=<file>`.
+
+Scheduled scripts of the same size share a task definition, so Container
+Insights only knows them by their shared family. Their samples are reported
+and left out; per script sizes come from the `task_metrics.py` lines of
+`-c taskMetrics=true`, which carry the script name.
+
+Usage:
+
+    python yearn_simulations_infra/rightsizing.py metrics/*.json -o task-profiles.json
+"""
+
+import argparse
+import csv
+import json
+import math
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fargate_profiles import FARGATE_MEMORY_BY_CPU, FargateProfile
+
+# Field names accepted for each value, compared lowercased without underscores.
+# The Container Insights names come first.
+KEY_FIELDS = ("scriptname", "servicename", "taskdefinitionfamily", "task", "name")
+CPU_FIELDS = ("cpuutilized", "cpu")
+MEMORY_FIELDS = ("memoryutilized", "peakmemory", "memory")
+# Task definition families shared by the scheduled scripts of a profile, see
+# `ScheduledTask.profile_name`
+SHARED_FAMILY = re.compile(r"Cpu\d+Memory\d+\w*Secrets[0-9a-f]{8}TaskDefinition")
+
+# On-demand Fargate prices in us-east-1, only used to rank sizes against each other
+PRICE_PER_VCPU_HOUR = 0.04048
+PRICE_PER_GB_HOUR = 0.004445
+
+
+class UtilizationStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.cpu: List[float] = []
+        self.memory: List[float] = []
+
+    def add(self, cpu: Optional[float], memory: Optional[float]) -> None:
+        if cpu is not None:
+            self.cpu.append(cpu)
+        if memory is not None:
+            self.memory.append(memory)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            "cpu": _distribution(self.cpu),
+            "memory": _distribution(self.memory),
+            "samples": max(len(self.cpu), len(self.memory)),
+        }
+
+
+def read_samples(path: Path) -> Iterator[Dict[str, str]]:
+    """Yield one flat record per sample, whatever the export format."""
+    with path.open() as export:
+        if path.suffix.lower() == ".csv":
+            yield from csv.DictReader(export)
+            return
+
+        text = export.read().strip()
+        if not text:
+            return
+        if text.startswith("["):
+            yield from json.loads(text)
+            return
+        for line in text.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                # CloudWatch Logs exports wrap the performance event in `message`
+                if isinstance(record.get("message"), str):
+                    record = json.loads(record["message"])
+                yield record
+
+
+def collect_stats(
+    paths: Iterable[Path], key_field: Optional[str] = None
+) -> Dict[str, UtilizationStats]:
+    stats: Dict[str, UtilizationStats] = {}
+    for path in paths:
+        for record in read_samples(path):
+            fields = {_normalize(name): value for name, value in record.items()}
+            # Only task level Container Insights events describe a whole task
+            if fields.get("type", "Task") != "Task":
+                continue
+            name = _first(fields, (_normalize(key_field),) if key_field else KEY_FIELDS)
+            cpu = _number(_first(fields, CPU_FIELDS))
+            memory = _number(_first(fields, MEMORY_FIELDS))
+            # The stopped task lines of `task_metrics.py` only carry timings
+            if not name or (cpu is None and memory is None):
+                continue
+            stats.setdefault(name, UtilizationStats(name)).add(cpu, memory)
+    return stats
+
+
+def is_shared_family(name: str) -> bool:
+    """Whether `name` is a task definition family several scripts run from."""
+    return bool(SHARED_FAMILY.search(name))
+
+
+def recommend_profile(
+    stats: UtilizationStats,
+    cpu_headroom: float,
+    memory_headroom: float,
+    cpu_percentile: float,
+) -> Optional[FargateProfile]:
+    """
+    Smallest valid Fargate size covering the chosen CPU percentile and the peak
+    memory, both with headroom. Memory uses the peak because running out of it
+    kills the task, while running out of CPU only slows it down.
+    """
+    if not stats.cpu or not stats.memory:
+        return None
+
+    needed_cpu = _percentile(stats.cpu, cpu_percentile) * (1 + cpu_headroom)
+    needed_memory = max(stats.memory) * (1 + memory_headroom)
+
+    candidates = [
+        (cpu, memory)
+        for cpu, memory_options in FARGATE_MEMORY_BY_CPU.items()
+        for memory in memory_options
+        if cpu >= needed_cpu and memory >= needed_memory
+    ]
+    if not candidates:
+        return None
+    cpu, memory = min(candidates, key=lambda size: (_hourly_price(*size), size))
+    return FargateProfile(cpu=cpu, memory=memory)
+
+
+def load_profiles(path: Path) -> Dict[str, Dict[str, int]]:
+    """Profiles from a file written by this tool, keyed by script or service name."""
+    return json.loads(Path(path).read_text())["profiles"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("exports", nargs="+", type=Path, help="CSV or JSON exports")
+    parser.add_argument("-o", "--output", type=Path, default=Path("task-profiles.json"))
+    parser.add_argument(
+        "--key",
+        help="Field naming the script or service of a sample. "
+        "Defaults to the first of script_name, ServiceName and TaskDefinitionFamily.",
+    )
+    parser.add_argument("--cpu-headroom", type=float, default=0.2)
+    parser.add_argument("--memory-headroom", type=float, default=0.25)
+    parser.add_argument("--cpu-percentile", type=float, default=95)
+    args = parser.parse_args(argv)
+
+    stats = collect_stats(args.exports, key_field=args.key)
+    if not stats:
+        print("No task utilization samples found.", file=sys.stderr)
+        return 1
+
+    shared = sorted(name for name in stats if is_shared_family(name))
+    for name in shared:
+        print(
+            f"{name}: shared by the scripts of a profile, which can't be told "
+            "apart, size them from task_metrics.py lines instead",
+            file=sys.stderr,
+        )
+        del stats[name]
+
+    profiles = {}
+    report = {}
+    for name in sorted(stats):
+        profile = recommend_profile(
+            stats[name], args.cpu_headroom, args.memory_headroom, args.cpu_percentile
+        )
+        report[name] = stats[name].summary()
+        if profile is None:
+            print(f"{name}: not enough data or too large for Fargate", file=sys.stderr)
+            continue
+        profiles[name] = {"cpu": profile.cpu, "memory": profile.memory}
+        print(
+            f"{name}: cpu p50/p95/max "
+            f"{_format(report[name]['cpu'])}, memory p50/p95/max "
+            f"{_format(report[name]['memory'])} "
+            f"-> cpu={profile.cpu} memory={profile.memory}"
+        )
+
+    args.output.write_text(
+        json.dumps(
+            {
+                "profiles": profiles,
+                "utilization": report,
+                "settings": {
+                    "cpu_headroom": args.cpu_headroom,
+                    "memory_headroom": args.memory_headroom,
+                    "cpu_percentile": args.cpu_percentile,
+                },
+            },
+            indent=2,
+            sort_keys=True,
+        )
+    )
+    print(f"Wrote {len(profiles)} profiles to {args.output}")
+    return 0
+
+
+def _normalize(name: str) -> str:
+    return name.replace("_", "").lower()
+
+
+def _first(fields: Dict[str, str], names: Tuple[str, ...]) -> Optional[str]:
+    for name in names:
+        if fields.get(name) not in (None, ""):
+            return fields[name]
+    return None
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    rank = max(math.ceil(percentile / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "max": max(values),
+    }
+
+
+def _format(distribution: Dict[str, float]) -> str:
+    return "/".join(f"{distribution[name]:.0f}" for name in ("p50", "p95", "max"))
+
+
+def _hourly_price(cpu: int, memory: int) -> float:
+    return cpu / 1024 * PRICE_PER_VCPU_HOUR + memory / 1024 * PRICE_PER_GB_HOUR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Caching JSON-RPC proxy shared by the bots in front of the Ethereum node.
+
+Calls reading chain state are pinned to a block hash before they are sent
+upstream, so their results can be cached for as long as the proxy runs:
+`latest` and block numbers are resolved to the hash of that block, and the
+call is forwarded with an EIP-1898 `{"blockHash": ...}` parameter. `latest`
+is the head block seen at most `RPC_HEAD_TTL` seconds ago.
+
+Identical calls in flight at the same time are only sent once, and calls
+arriving within `RPC_BATCH_WINDOW` seconds of each other are sent upstream
+as a single JSON-RPC batch. Anything else, like sending transactions, is
+forwarded as it is.
+
+Configured through the environment:
+
+    RPC_UPSTREAM_URL  node to forward to, formatted with the environment,
+                      defaults to Infura with WEB3_INFURA_PROJECT_ID
+    RPC_PROXY_PORT    port to listen on, 8545 by default
+
+`GET /stats` returns the hit, miss and upstream counters.
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_PORT = 8545
+DEFAULT_UPSTREAM_URL = "https://mainnet.infura.io/v3/{WEB3_INFURA_PROJECT_ID}"
+
+# Results that can't change once they exist
+IMMUTABLE_METHODS = {
+    "eth_chainId",
+    "net_version",
+    "eth_getBlockByHash",
+    "eth_getBlockTransactionCountByHash",
+    "eth_getTransactionByBlockHashAndIndex",
+    "eth_getUncleByBlockHashAndIndex",
+}
+# Methods reading state at a block, with the position of their block parameter
+STATE_METHODS = {
+    "eth_call": 1,
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getStorageAt": 2,
+    "eth_getProof": 2,
+}
+
+# Transport = send one JSON-RPC request or batch, return the decoded response
+Transport = Callable[[Any], Any]
+# Outcome of a call, `{"result": ...}` or `{"error": ...}`
+Outcome = Dict[str, Any]
+
+
+class UpstreamError(Exception):
+    def __init__(self, error: Dict[str, Any]) -> None:
+        super().__init__(error.get("message", "upstream error"))
+        self.error = error
+
+
+class LruCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class UpstreamBatcher:
+    """Collect calls for up to `window` seconds and send them as one batch."""
+
+    def __init__(
+        self,
+        transport: Transport,
+        stats: "ProxyStats",
+        max_batch_size: int = 50,
+        window: float = 0.005,
+        concurrency: int = 8,
+    ) -> None:
+        self._transport = transport
+        self._stats = stats
+        self._max_batch_size = max_batch_size
+        self._window = window
+        self._queue: "queue.Queue[Tuple[str, List[Any], Future]]" = queue.Queue()
+        self._senders = ThreadPoolExecutor(concurrency, thread_name_prefix="upstream")
+        threading.Thread(target=self._collect, name="batcher", daemon=True).start()
+
+    def call(self, method: str, params: List[Any]) -> Outcome:
+        future: Future = Future()
+        self._queue.put((method, params, future))
+        return future.result()
+
+    def _collect(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + self._window
+            while len(pending) < self._max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            # Keep collecting the next batch while this one is in flight
+            self._senders.submit(self._send, pending)
+
+    def _send(self, pending: List[Tuple[str, List[Any], Future]]) -> None:
+        requests = [
+            {"jsonrpc": "2.0", "id": index, "method": method, "params": params}
+            for index, (method, params, _) in enumerate(pending)
+        ]
+        self._stats.add(upstream_requests=1, upstream_calls=len(requests))
+        try:
+            responses = self._transport(requests if len(requests) > 1 else requests[0])
+            if not isinstance(responses, list):
+                responses = [responses]
+            by_id = {response.get("id"): response for response in responses}
+            for index, (_, _, future) in enumerate(pending):
+                response = by_id.get(index)
+                if response is None:
+                    future.set_exception(
+                        UpstreamError(
+                            {"code": -32603, "message": "missing from upstream batch"}
+                        )
+                    )
+                elif "error" in response:
+                    future.set_result({"error": response["error"]})
+                else:
+                    future.set_result({"result": response.get("result")})
+        except Exception as error:
+            self._stats.add(upstream_failures=1)
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+
+
+class ProxyStats:
+    def __init__(self) -> None:
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            self._counts.update(counts)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts.get("hits", 0) + counts.get("misses", 0)
+        counts["hit_rate"] = counts.get("hits", 0) / lookups if lookups else 0.0
+        return counts
+
+
+class RpcProxy:
+    def __init__(
+        self,
+        transport: Transport,
+        cache_size: int = 100_000,
+        head_ttl: float = 1.0,
+        confirmations: int = 12,
+        batch_window: float = 0.005,
+        max_batch_size: int = 50,
+    ) -> None:
+        self.stats = ProxyStats()
+        self.head_ttl = head_ttl
+        self.confirmations = confirmations
+        self._cache = LruCache(cache_size)
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._upstream = UpstreamBatcher(
+            transport, self.stats, max_batch_size=max_batch_size, window=batch_window
+        )
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one JSON-RPC request."""
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            response.update(
+                self._outcome(request["method"], request.get("params") or [])
+            )
+        except UpstreamError as error:
+            response["error"] = error.error
+        except Exception as error:
+            response["error"] = {"code": -32603, "message": str(error)}
+        return response
+
+    def _outcome(self, method: str, params: List[Any]) -> Outcome:
+        if method == "eth_blockNumber":
+            return {"result": hex(self._head())}
+
+        pinned = self._pin(method, params)
+        if pinned is None:
+            self.stats.add(passthrough=1)
+            return self._upstream.call(method, params)
+        return self._fetch(*pinned)
+
+    def _pin(self, method: str, params: List[Any]) -> Optional[Tuple[str, List[Any]]]:
+        """
+        The call with its block replaced by a block hash, or None if it can't
+        be cached.
+        """
+        if method in IMMUTABLE_METHODS:
+            return method, params
+        if method == "eth_getBlockByNumber" and params:
+            block_hash = self._block_hash(params[0])
+            if block_hash is not None:
+                return "eth_getBlockByHash", [block_hash, *params[1:2]]
+        if method in STATE_METHODS:
+            index = STATE_METHODS[method]
+            block = params[index] if len(params) > index else "latest"
+            block_hash = self._block_hash(block)
+            if block_hash is not None:
+                return method, [*params[:index], {"blockHash": block_hash}]
+        return None
+
+    def _fetch(self, method: str, params: List[Any], cache: bool = True) -> Outcome:
+        """
+        Cached or upstream outcome of a call, sending identical calls in
+        flight once.
+        """
+        key = json.dumps([method, params], sort_keys=True)
+        with self._lock:
+            outcome = self._cache.get(key) if cache else None
+            if outcome is not None:
+                self.stats.add(hits=1)
+                return outcome
+            future = self._in_flight.get(key)
+            waiting = future is not None
+            if waiting:
+                self.stats.add(hits=1, coalesced=1)
+            else:
+                self.stats.add(misses=1)
+                future = self._in_flight[key] = Future()
+        if waiting:
+            return future.result()
+
+        try:
+            outcome = self._upstream.call(method, params)
+            # Blocks that don't exist yet, or calls that failed, may be different later
+            if cache and outcome.get("result") is not None:
+                self._cache.set(key, outcome)
+            future.set_result(outcome)
+        except Exception as error:
+            future.set_exception(error)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+    def _head(self) -> int:
+        head = self._cache.get("head")
+        if head is not None:
+            self.stats.add(hits=1)
+            return head
+        outcome = self._fetch("eth_blockNumber", [], cache=False)
+        if "error" in outcome:
+            raise UpstreamError(outcome["error"])
+        head = int(outcome["result"], 16)
+        self._cache.set("head", head, ttl=self.head_ttl)
+        return head
+
+    def _block_hash(self, block: Any) -> Optional[str]:
+        if isinstance(block, dict):
+            if "blockHash" in block:
+                return block["blockHash"]
+            block = block.get("blockNumber")
+        if block == "latest":
+            number = self._head()
+        elif isinstance(block, str) and block.startswith("0x"):
+            number = int(block, 16)
+        else:
+            # `pending`, `earliest`, `safe` and `finalized` aren't pinned
+            return None
+
+        cached = self._cache.get(("hash", number))
+        if cached is not None:
+            return cached
+        outcome = self._fetch("eth_getBlockByNumber", [hex(number), False], cache=False)
+        if "error" in outcome:
+            raise UpstreamError(outcome["error"])
+        block = outcome.get("result")
+        if block is None:
+            return None
+
+        # Blocks near the head can still be replaced by a reorg, so only keep
+        # their hash until the head moves on
+        confirmed = number <= self._head() - self.confirmations
+        self._cache.set(
+            ("hash", number), block["hash"], ttl=None if confirmed else self.head_ttl
+        )
+        self._cache.set(
+            json.dumps(["eth_getBlockByHash", [block["hash"], False]], sort_keys=True),
+            {"result": block},
+        )
+        return block["hash"]
+
+
+def http_transport(url: str, timeout: float = 30) -> Transport:
+    def send(payload: Any) -> Any:
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    return send
+
+
+def serve(proxy: RpcProxy, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Start answering on `port` in a background thread and return the server."""
+    # Batches from clients are answered call by call, so each can wait on the
+    # cache or the upstream without holding up the others
+    workers = ThreadPoolExecutor(64, thread_name_prefix="batch")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            self._reply(
+                200, proxy.stats.snapshot() if self.path == "/stats" else {"ok": True}
+            )
+
+        def do_POST(self) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                request = json.loads(body)
+            except ValueError:
+                self._reply(
+                    200,
+                    {
+                        "jsonrpc": "2.0",
+                        "id": None,
+                        "error": {"code": -32700, "message": "Parse error"},
+                    },
+                )
+                return
+            if isinstance(request, list):
+                self._reply(200, list(workers.map(proxy.handle, request)))
+            else:
+                self._reply(200, proxy.handle(request))
+
+        def _reply(self, status: int, payload: Any) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="server", daemon=True).start()
+    return server
+
+
+def main() -> int:
+    upstream_url = os.environ.get("RPC_UPSTREAM_URL", DEFAULT_UPSTREAM_URL).format(
+        **os.environ
+    )
+    proxy = RpcProxy(
+        http_transport(upstream_url),
+        cache_size=int(os.environ.get("RPC_CACHE_SIZE", "100000")),
+        head_ttl=float(os.environ.get("RPC_HEAD_TTL", "1")),
+        batch_window=float(os.environ.get("RPC_BATCH_WINDOW", "0.005")),
+    )
+    port = int(os.environ.get("RPC_PROXY_PORT", DEFAULT_PORT))
+    serve(proxy, port)
+    print(f"[rpc_proxy] listening on {port}", flush=True)
+
+    while True:
+        time.sleep(300)
+        print(
+            f"[rpc_proxy] {json.dumps(proxy.stats.snapshot(), sort_keys=True)}",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Benchmark `rpc_proxy.py` against a local JSON-RPC stub.
+
+The stub answers the calls the bots make most with a fixed delay per HTTP
+request and a new block every `--block-time` seconds. The same workload is
+sent straight to the stub and then through the proxy, and the latency,
+upstream traffic and cache hit rate of both runs are reported.
+
+Usage:
+
+    python yearn_simulations_infra/rpc_proxy_benchmark.py --clients 16 --requests 200
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from rpc_proxy import RpcProxy, http_transport, serve
+
+
+class StubNode:
+    """Deterministic chain answering `eth_*` calls, counting what it was sent."""
+
+    def __init__(self, latency: float, block_time: float) -> None:
+        self.latency = latency
+        self.block_time = block_time
+        self.counts = Counter()
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def head(self) -> int:
+        return 13_000_000 + int((time.monotonic() - self._started_at) / self.block_time)
+
+    def answer(self, payload: Any) -> Any:
+        with self._lock:
+            self.counts["requests"] += 1
+            self.counts["calls"] += len(payload) if isinstance(payload, list) else 1
+        time.sleep(self.latency)
+        if isinstance(payload, list):
+            return [self._answer_call(request) for request in payload]
+        return self._answer_call(payload)
+
+    def _answer_call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        method, params = request["method"], request.get("params") or []
+        if method == "eth_blockNumber":
+            result: Any = hex(self.head)
+        elif method == "eth_chainId":
+            result = "0x1"
+        elif method == "eth_getBlockByNumber":
+            number = self.head if params[0] == "latest" else int(params[0], 16)
+            result = self._block(number) if number <= self.head else None
+        elif method == "eth_getBlockByHash":
+            result = {"hash": params[0], "number": None}
+        elif method == "eth_call":
+            result = "0x" + _digest(json.dumps(params, sort_keys=True))
+        else:
+            return {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {"code": -32601, "message": "Method not found"},
+            }
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+    @staticmethod
+    def _block(number: int) -> Dict[str, Any]:
+        return {"number": hex(number), "hash": "0x" + _digest(str(number))}
+
+
+def serve_stub(node: StubNode) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self) -> None:
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body = json.dumps(node.answer(payload)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_workload(
+    url: str, clients: int, requests: int, contracts: int, seed: int
+) -> List[float]:
+    """Send the same mix of calls from every client and return the latencies."""
+    send = http_transport(url)
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def client(index: int) -> None:
+        rng = random.Random(seed + index)
+        mine = []
+        for request_id in range(requests):
+            roll = rng.random()
+            if roll < 0.7:
+                # A few popular contracts get most of the calls
+                contract = min(int(rng.expovariate(1 / (contracts / 4))), contracts - 1)
+                request = {
+                    "method": "eth_call",
+                    "params": [
+                        {"to": f"0x{contract:040x}", "data": "0x18160ddd"},
+                        "latest",
+                    ],
+                }
+            elif roll < 0.9:
+                request = {
+                    "method": "eth_getBlockByNumber",
+                    "params": ["latest", False],
+                }
+            else:
+                request = {"method": "eth_blockNumber", "params": []}
+            request.update(jsonrpc="2.0", id=request_id)
+
+            started_at = time.perf_counter()
+            response = send(request)
+            mine.append(time.perf_counter() - started_at)
+            if "error" in response:
+                raise RuntimeError(response["error"])
+        with lock:
+            latencies.extend(mine)
+
+    threads = [
+        threading.Thread(target=client, args=(index,)) for index in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    for name in ("direct", "proxy"):
+        node = StubNode(args.latency / 1000, args.block_time)
+        stub = serve_stub(node)
+        stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+        proxy: Optional[RpcProxy] = None
+        url = stub_url
+        if name == "proxy":
+            proxy = RpcProxy(
+                http_transport(stub_url), batch_window=args.batch_window / 1000
+            )
+            url = f"http://127.0.0.1:{serve(proxy, 0, '127.0.0.1').server_address[1]}"
+
+        started_at = time.perf_counter()
+        latencies = sorted(
+            run_workload(url, args.clients, args.requests, args.contracts, args.seed)
+        )
+        elapsed = time.perf_counter() - started_at
+
+        results[name] = {
+            "requests": len(latencies),
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "latency_ms": {
+                label: round(_percentile(latencies, percentile) * 1000, 2)
+                for label, percentile in (("p50", 50), ("p95", 95), ("p99", 99))
+            },
+            "upstream_requests": node.counts["requests"],
+            "upstream_calls": node.counts["calls"],
+        }
+        if proxy is not None:
+            results[name]["proxy"] = proxy.stats.snapshot()
+        stub.shutdown()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client")
+    parser.add_argument(
+        "--contracts", type=int, default=40, help="Distinct contracts called"
+    )
+    parser.add_argument("--latency", type=float, default=40, help="Stub latency in ms")
+    parser.add_argument(
+        "--block-time", type=float, default=2.0, help="Seconds per stub block"
+    )
+    parser.add_argument(
+        "--batch-window", type=float, default=5, help="Proxy batch window in ms"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        print(
+            f"{name:>6}: {result['requests']} requests, "
+            f"{result['requests_per_second']}/s, latency p50/p95/p99 "
+            f"{latency['p50']}/{latency['p95']}/{latency['p99']} ms, "
+            f"{result['upstream_requests']} upstream requests with "
+            f"{result['upstream_calls']} calls"
+        )
+    stats = results["proxy"]["proxy"]
+    print(
+        f"cache hit rate {stats['hit_rate']:.1%} "
+        f"({stats.get('hits', 0)} hits, {stats.get('coalesced', 0)} of them coalesced, "
+        f"{stats.get('misses', 0)} misses)"
+    )
+    return 0
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    return values[max(int(len(values) * percentile / 100 + 0.5), 1) - 1]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
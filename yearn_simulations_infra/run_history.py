@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""
+Rebuild the runs of the scheduled tasks from exported `YearnBotsLogGroup`
+logs and flag the scripts that got slower, start later or fail more often.
+
+Reads gzip (or plain) JSON lines, one log event per line as written by
+
+    aws logs filter-log-events --log-group-name <group> --output json \\
+        | jq -c '.events[]' | gzip > export.jsonl.gz
+
+or one subscription filter record per line, with the events of a stream in
+`logEvents`. Files are streamed line by line and every run is folded into
+fixed size histograms as soon as its stream goes quiet, so memory doesn't grow
+with the size of the export.
+
+A run is a log stream, named `<stream_prefix>/<container>/<task id>` by the
+awslogs driver. Scheduled tasks share their stream prefix with every script
+of their profile, so a run goes by the script its `[run] started <script>`
+first line or a `task_metrics.py` line names, by its stream prefix
+otherwise. Scripts in a batch or in the scheduler service are runs of their
+own, from the lines `batch_runner.py` and `scheduler_service.py` log when
+they start and stop them. For each script it reports:
+
+    duration   first until last log line of the run
+    start lag  from the cron fire time until the first log line, which
+               includes provisioning and pulling the image
+    failures   runs exiting with a non zero code or logging a traceback
+
+The cron schedules come from the manifest synth writes into `cdk.out`, and
+`--schedule name=cron(...)` for anything else. Staggered scripts count their
+stagger as start lag.
+
+Usage:
+
+    python yearn_simulations_infra/run_history.py exports/*.jsonl.gz \\
+        --manifest cdk.out/scheduled-scripts.manifest.json \\
+        --schedule 'HarvestBotTask=cron(20 * * * ? *)' \\
+        --split 2022-01-15T00:00:00
+"""
+
+import argparse
+import gzip
+import json
+import math
+import re
+import resource
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from cron import CronSchedule
+from task_metrics import EVENT, SCRIPT_DIMENSION
+
+BASELINE = "baseline"
+CURRENT = "current"
+
+# Runs whose stream logged nothing for this long are considered over
+DEFAULT_IDLE_SECONDS = 6 * 3600
+# Streams tracked at once, the quietest is closed first past this
+DEFAULT_MAX_OPEN_RUNS = 10000
+# Runs starting longer than this after a fire time count as unscheduled
+DEFAULT_MAX_LAG_SECONDS = 3600
+
+RUN_START = re.compile(r"^\[run\] started (\S+)")
+BATCH_EXIT = re.compile(r"^\[batch_runner\] (\S+) exited with (-?\d+) after ([\d.]+)s")
+SCHEDULER_START = re.compile(r"^\[scheduler\] \S+ \S+ starting (\S+)")
+SCHEDULER_EXIT = re.compile(r"^\[scheduler\] \S+ \S+ (\S+) exited with (-?\d+)")
+TRACEBACK = "Traceback (most recent call last)"
+
+
+class LogHistogram:
+    """
+    Counts of values in buckets `growth` times wider than the previous one,
+    whose quantiles are off by at most `growth - 1` relative to the values.
+    """
+
+    def __init__(self, growth: float = 1.05, smallest: float = 0.01) -> None:
+        self._log_growth = math.log(growth)
+        self._smallest = smallest
+        self._buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value: float) -> None:
+        index = 0
+        if value > self._smallest:
+            index = math.ceil(math.log(value / self._smallest) / self._log_growth)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = max(math.ceil(quantile * self.count), 1)
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                upper = self._smallest * math.exp(index * self._log_growth)
+                return round(min(max(upper, self.minimum), self.maximum), 3)
+        return self.maximum
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        if not self.count:
+            return {}
+        return {
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "mean": round(self.total / self.count, 3),
+            "max": round(self.maximum, 3),
+        }
+
+
+class Run:
+    __slots__ = ("name", "stream", "started_at", "ended_at", "failed")
+
+    def __init__(
+        self, name: str, stream: str, started_at: float, ended_at: float, failed: bool
+    ) -> None:
+        self.name = name
+        self.stream = stream
+        self.started_at = started_at
+        self.ended_at = ended_at
+        self.failed = failed
+
+    @property
+    def duration(self) -> float:
+        return max(self.ended_at - self.started_at, 0.0)
+
+
+class RunStats:
+    def __init__(self) -> None:
+        self.durations = LogHistogram()
+        self.start_lags = LogHistogram()
+        self.runs = 0
+        self.failures = 0
+        self.unscheduled = 0
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.runs if self.runs else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "failure_rate": round(self.failure_rate, 4),
+            "unscheduled": self.unscheduled,
+            "duration": self.durations.summary(),
+            "start_lag": self.start_lags.summary(),
+        }
+
+
+class _OpenStream:
+    __slots__ = ("name", "started_at", "last_seen", "failed", "service", "starting")
+
+    def __init__(self, name: str, timestamp: float) -> None:
+        self.name = name
+        self.started_at = timestamp
+        self.last_seen = timestamp
+        self.failed = False
+        # The scheduler service's stream holds its scripts' runs, not a run
+        self.service = False
+        self.starting: Dict[str, float] = {}
+
+
+class RunTimelines:
+    """Turn log events into runs, handing each to `on_run` once it is over."""
+
+    def __init__(
+        self,
+        on_run: Callable[[Run], None],
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        max_open_runs: int = DEFAULT_MAX_OPEN_RUNS,
+    ) -> None:
+        self._on_run = on_run
+        self._idle_seconds = idle_seconds
+        self._max_open_runs = max_open_runs
+        self._open: Dict[str, _OpenStream] = {}
+        self._latest = -math.inf
+        self._events = 0
+
+    def add(self, timestamp: float, stream: str, message: str) -> None:
+        self._events += 1
+        self._latest = max(self._latest, timestamp)
+        run = self._open.get(stream)
+        if run is None:
+            run = self._open[stream] = _OpenStream(stream.split("/", 1)[0], timestamp)
+        run.started_at = min(run.started_at, timestamp)
+        run.last_seen = max(run.last_seen, timestamp)
+
+        if TRACEBACK in message:
+            run.failed = True
+        elif message.startswith("[run]"):
+            match = RUN_START.match(message)
+            if match:
+                run.name = match.group(1)
+        elif message.startswith("[batch_runner]"):
+            match = BATCH_EXIT.match(message)
+            if match:
+                script, exit_code, runtime = match.groups()
+                started_at = timestamp - float(runtime)
+                self._on_run(
+                    Run(script, stream, started_at, timestamp, exit_code != "0")
+                )
+                run.failed = run.failed or exit_code != "0"
+        elif message.startswith("[scheduler]"):
+            run.service = True
+            self._scheduler_line(run, stream, timestamp, message)
+        elif EVENT in message and message.startswith("{"):
+            self._metrics_line(run, message)
+
+        if self._events % 10000 == 0 or len(self._open) > self._max_open_runs:
+            self._close_idle()
+
+    def close(self) -> None:
+        for stream in list(self._open):
+            self._close(stream)
+
+    def _scheduler_line(
+        self, run: _OpenStream, stream: str, timestamp: float, message: str
+    ) -> None:
+        match = SCHEDULER_START.match(message)
+        if match:
+            run.starting[match.group(1)] = timestamp
+            return
+        match = SCHEDULER_EXIT.match(message)
+        if match:
+            script, exit_code = match.groups()
+            started_at = run.starting.pop(script, None)
+            if started_at is not None:
+                self._on_run(
+                    Run(script, stream, started_at, timestamp, exit_code != "0")
+                )
+
+    @staticmethod
+    def _metrics_line(run: _OpenStream, message: str) -> None:
+        try:
+            document = json.loads(message)
+        except ValueError:
+            return
+        # Lines with a runtime are about one script of a batch or the service,
+        # which its exit line already accounts for
+        if document.get("event") != EVENT or "Runtime" in document:
+            return
+        script_name = document.get(SCRIPT_DIMENSION)
+        if script_name and script_name != "unknown":
+            run.name = script_name
+        if document.get("ExitCode") not in (None, 0):
+            run.failed = True
+
+    def _close_idle(self) -> None:
+        for stream, run in list(self._open.items()):
+            if run.last_seen < self._latest - self._idle_seconds:
+                self._close(stream)
+        if len(self._open) > self._max_open_runs:
+            quietest = sorted(
+                self._open, key=lambda stream: self._open[stream].last_seen
+            )
+            for stream in quietest[: len(self._open) - self._max_open_runs]:
+                self._close(stream)
+
+    def _close(self, stream: str) -> None:
+        run = self._open.pop(stream)
+        if not run.service:
+            self._on_run(
+                Run(run.name, stream, run.started_at, run.last_seen, run.failed)
+            )
+
+
+class RunHistory:
+    """Statistics of the runs per script and window."""
+
+    def __init__(
+        self,
+        schedules: Dict[str, CronSchedule],
+        split: Optional[float] = None,
+        max_lag_seconds: int = DEFAULT_MAX_LAG_SECONDS,
+    ) -> None:
+        self._schedules = schedules
+        self._split = split
+        self._max_lag_seconds = max_lag_seconds
+        self.stats: Dict[Tuple[str, str], RunStats] = {}
+
+    def add(self, run: Run) -> None:
+        window = CURRENT
+        if self._split is not None and run.started_at < self._split:
+            window = BASELINE
+        stats = self.stats.get((run.name, window))
+        if stats is None:
+            stats = self.stats[(run.name, window)] = RunStats()
+        stats.runs += 1
+        stats.failures += run.failed
+        stats.durations.add(run.duration)
+
+        schedule = self._schedules.get(run.name)
+        if schedule is not None:
+            lag = start_lag(schedule, run.started_at, self._max_lag_seconds)
+            if lag is None:
+                stats.unscheduled += 1
+            else:
+                stats.start_lags.add(lag)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        summary: Dict[str, Dict[str, Any]] = {}
+        for (name, window), stats in sorted(self.stats.items()):
+            summary.setdefault(name, {})[window] = stats.summary()
+        return summary
+
+    def regressions(
+        self,
+        threshold: float = 0.25,
+        lag_slack: float = 60,
+        failure_increase: float = 0.1,
+        min_runs: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """
+        Scripts whose current window is worse than their baseline: p50 or p95
+        duration up by more than `threshold`, p95 start lag up by more than
+        `threshold` and `lag_slack` seconds, or failure rate up by more than
+        `failure_increase`.
+        """
+        found = []
+        for (name, window), current in sorted(self.stats.items()):
+            baseline = self.stats.get((name, BASELINE))
+            if window != CURRENT or baseline is None:
+                continue
+            if min(baseline.runs, current.runs) < min_runs:
+                continue
+
+            checks = [
+                (
+                    f"duration {label}",
+                    baseline.durations,
+                    current.durations,
+                    quantile,
+                    0,
+                )
+                for label, quantile in (("p50", 0.5), ("p95", 0.95))
+            ]
+            checks.append(
+                (
+                    "start lag p95",
+                    baseline.start_lags,
+                    current.start_lags,
+                    0.95,
+                    lag_slack,
+                )
+            )
+            for metric, before, after, quantile, slack in checks:
+                was, now = before.quantile(quantile), after.quantile(quantile)
+                if was is None or now is None:
+                    continue
+                if now > was * (1 + threshold) and now - was > slack:
+                    found.append(_regression(name, metric, was, now))
+            if current.failure_rate - baseline.failure_rate > failure_increase:
+                found.append(
+                    _regression(
+                        name,
+                        "failure rate",
+                        round(baseline.failure_rate, 4),
+                        round(current.failure_rate, 4),
+                    )
+                )
+        return found
+
+
+def start_lag(
+    schedule: CronSchedule, started_at: float, max_lag_seconds: int
+) -> Optional[float]:
+    """
+    Seconds since the schedule last fired before `started_at`, if within
+    `max_lag_seconds`.
+    """
+    started = datetime.fromtimestamp(started_at, timezone.utc).replace(tzinfo=None)
+    fired = started.replace(second=0, microsecond=0)
+    earliest = started - timedelta(seconds=max_lag_seconds)
+    while fired >= earliest:
+        if schedule.matches(fired):
+            return (started - fired).total_seconds()
+        fired -= timedelta(minutes=1)
+    return None
+
+
+def read_events(export: BinaryIO) -> Iterator[Tuple[float, str, str]]:
+    """Yield `(seconds since the epoch, stream, message)` of every event in order."""
+    # Exports are gzip'd or not whatever their name says
+    lines: BinaryIO = export
+    if export.peek(2)[:2] == b"\x1f\x8b":
+        lines = gzip.GzipFile(fileobj=export)
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "logEvents" in record:
+            stream = record.get("logStream", "")
+            for event in record["logEvents"]:
+                yield event["timestamp"] / 1000, stream, event.get("message", "")
+            continue
+        yield (
+            _timestamp(record.get("timestamp", record.get("@timestamp"))),
+            record.get("logStreamName", record.get("@logStream", "")),
+            record.get("message", record.get("@message", "")),
+        )
+
+
+def analyze(
+    paths: Iterable[str],
+    history: RunHistory,
+    idle_seconds: float = DEFAULT_IDLE_SECONDS,
+    max_open_runs: int = DEFAULT_MAX_OPEN_RUNS,
+) -> Dict[str, Any]:
+    """
+    Fold every event of `paths` (`-` for stdin) into `history`, returning read
+    stats.
+    """
+    timelines = RunTimelines(history.add, idle_seconds, max_open_runs)
+    started_at = time.perf_counter()
+    events = read_bytes = 0
+    for path in paths:
+        export = sys.stdin.buffer if path == "-" else open(path, "rb")
+        try:
+            for timestamp, stream, message in read_events(export):
+                timelines.add(timestamp, stream, message)
+                events += 1
+            read_bytes += export.tell() if export.seekable() else 0
+        finally:
+            if export is not sys.stdin.buffer:
+                export.close()
+    timelines.close()
+    seconds = time.perf_counter() - started_at
+    return {
+        "events": events,
+        "bytes": read_bytes,
+        "seconds": round(seconds, 3),
+        "events_per_second": round(events / seconds, 1) if seconds else None,
+        # KiB on Linux
+        "peak_memory_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def load_schedules(
+    manifest: Optional[Path], extra: Iterable[str] = ()
+) -> Dict[str, CronSchedule]:
+    """
+    Schedules of the scripts in a scheduled scripts manifest, plus
+    `name=cron(...)` ones.
+    """
+    schedules = {}
+    if manifest:
+        for cached in json.loads(manifest.read_text()).get("files", {}).values():
+            for script in cached["scripts"]:
+                schedules[script["script_name"]] = CronSchedule(
+                    minute=script["minute"],
+                    hour=script["hour"],
+                    day=script["day"],
+                    month=script["month"],
+                    week_day=script["week_day"],
+                    year=script["year"],
+                )
+    for definition in extra:
+        name, separator, expression = definition.partition("=")
+        if not separator:
+            raise ValueError(f"Expected name=cron(...), got `{definition}`")
+        schedules[name] = CronSchedule.from_expression(expression)
+    return schedules
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "exports", nargs="+", help="JSON lines exports, gzip'd or not, - for stdin"
+    )
+    parser.add_argument(
+        "--manifest", type=Path, help="scheduled-scripts.manifest.json from cdk.out"
+    )
+    parser.add_argument(
+        "--schedule", action="append", default=[], help="name=cron(...), repeatable"
+    )
+    parser.add_argument(
+        "--split",
+        help="ISO time, runs before it are the baseline and after it are compared "
+        "to it",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="Relative slowdown flagged"
+    )
+    parser.add_argument(
+        "--lag-slack", type=float, default=60, help="Start lag seconds tolerated"
+    )
+    parser.add_argument("--failure-increase", type=float, default=0.1)
+    parser.add_argument(
+        "--min-runs", type=int, default=5, help="Runs needed in each window"
+    )
+    parser.add_argument("--idle-seconds", type=float, default=DEFAULT_IDLE_SECONDS)
+    parser.add_argument("--max-open-runs", type=int, default=DEFAULT_MAX_OPEN_RUNS)
+    parser.add_argument("--max-lag", type=int, default=DEFAULT_MAX_LAG_SECONDS)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument(
+        "--check", action="store_true", help="Exit with 1 when a regression is found"
+    )
+    args = parser.parse_args(argv)
+
+    history = RunHistory(
+        load_schedules(args.manifest, args.schedule),
+        split=_timestamp(args.split) if args.split else None,
+        max_lag_seconds=args.max_lag,
+    )
+    read = analyze(args.exports, history, args.idle_seconds, args.max_open_runs)
+    summary = history.summary()
+    regressions = history.regressions(
+        args.threshold, args.lag_slack, args.failure_increase, args.min_runs
+    )
+
+    if args.json:
+        print(
+            json.dumps(
+                {"read": read, "scripts": summary, "regressions": regressions},
+                indent=2,
+                sort_keys=True,
+            )
+        )
+    else:
+        print(
+            f"{'script':<32}{'window':>10}{'runs':>7}{'failed':>8}"
+            f"{'duration p50/p95':>20}{'lag p50/p95':>16}"
+        )
+        for name, windows in summary.items():
+            for window, stats in windows.items():
+                print(
+                    f"{name:<32}{window:>10}{stats['runs']:>7}"
+                    f"{stats['failure_rate']:>8.1%}"
+                    f"{_format(stats['duration']):>20}{_format(stats['start_lag']):>16}"
+                )
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['script']}: {regression['metric']} "
+                f"{regression['baseline']} -> {regression['current']}"
+            )
+        print(
+            f"{read['events']} events in {read['seconds']}s, "
+            f"peak memory {read['peak_memory_mb']} MB"
+        )
+    return 1 if args.check and regressions else 0
+
+
+def _regression(
+    name: str, metric: str, baseline: float, current: float
+) -> Dict[str, Any]:
+    return {"script": name, "metric": metric, "baseline": baseline, "current": current}
+
+
+def _timestamp(value: Any) -> float:
+    """
+    Seconds since the epoch from epoch milliseconds or ISO strings, UTC unless
+    given.
+    """
+    if isinstance(value, (int, float)):
+        return value / 1000
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _format(distribution: Dict[str, Optional[float]]) -> str:
+    if not distribution:
+        return "-"
+    return f"{distribution['p50']:.0f}s/{distribution['p95']:.0f}s"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Benchmark `run_history.py` on synthetic log exports.
+
+Writes gzip'd JSON lines exports of hourly scripts and a batch of scripts,
+where one script gets slower halfway through, then analyzes a small export
+and one `--scale` times larger in their own processes. Reports the
+throughput and peak memory of each, and checks that:
+
+- the peak memory doesn't grow with the export, beyond `--max-memory-growth`
+- the slowed down script is flagged, and nothing else is
+- every run is named after its script, though its log stream is named after
+  the profile it shares with the other scripts
+
+Usage:
+
+    python yearn_simulations_infra/run_history_benchmark.py --days 7 --scale 4
+"""
+
+import argparse
+import gzip
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+RUN_HISTORY = Path(__file__).resolve().parent / "run_history.py"
+REGRESSED_SCRIPT = "script_0"
+BATCHED_SCRIPTS = ("batched_0", "batched_1")
+BATCH_MINUTE = 30
+START = datetime(2022, 1, 3, tzinfo=timezone.utc)
+# Scheduled tasks log to streams named after their profile, shared by all of
+# its scripts, see `yearn_scheduled_task.py`
+STREAM_PREFIX = "Cpu1024Memory2048Secrets5f70bf18Task/ScheduledTaskContainer"
+BATCH_NAME = "Batch3f1c2a9d"
+
+
+def script_minute(index: int) -> int:
+    return index * 7 % 60
+
+
+def write_manifest(path: Path, scripts: int) -> None:
+    """
+    A scheduled scripts manifest as synth writes it, with the fields
+    `run_history.py` reads.
+    """
+    names = [(f"script_{index}", script_minute(index)) for index in range(scripts)]
+    names += [(name, BATCH_MINUTE) for name in BATCHED_SCRIPTS]
+    path.write_text(
+        json.dumps(
+            {
+                "files": {
+                    "scripts.py": {
+                        "scripts": [
+                            {
+                                "script_name": name,
+                                "minute": str(minute),
+                                "hour": None,
+                                "day": None,
+                                "month": None,
+                                "week_day": None,
+                                "year": None,
+                            }
+                            for name, minute in names
+                        ]
+                    }
+                }
+            }
+        )
+    )
+
+
+def write_export(
+    path: Path, days: int, scripts: int, lines: int, slowdown: float, seed: int
+) -> int:
+    """Write `days` of hourly runs, returning the number of events."""
+    rng = random.Random(seed)
+    baselines = {f"script_{index}": rng.uniform(60, 600) for index in range(scripts)}
+    halfway = START + timedelta(days=days / 2)
+    events = 0
+    with gzip.open(path, "wt") as export:
+        for hour in range(days * 24):
+            fired_hour = START + timedelta(hours=hour)
+            hour_events = []
+            for name, baseline in baselines.items():
+                fired = fired_hour.replace(
+                    minute=script_minute(int(name.split("_")[1]))
+                )
+                duration = baseline * rng.lognormvariate(0, 0.1)
+                if name == REGRESSED_SCRIPT and fired >= halfway:
+                    duration *= slowdown
+                hour_events += _task_run(
+                    rng, name, fired, duration, lines, failed=rng.random() < 0.02
+                )
+            hour_events += _batch_run(
+                rng, fired_hour.replace(minute=BATCH_MINUTE), lines
+            )
+            hour_events.sort(key=lambda event: event["timestamp"])
+            for event in hour_events:
+                export.write(json.dumps(event) + "\n")
+            events += len(hour_events)
+    return events
+
+
+def _task_run(
+    rng: random.Random,
+    name: str,
+    fired: datetime,
+    duration: float,
+    lines: int,
+    failed: bool,
+) -> List[Dict[str, Any]]:
+    stream = f"{STREAM_PREFIX}/{uuid.UUID(int=rng.getrandbits(128)).hex}"
+    started_at = fired.timestamp() + rng.uniform(20, 90)
+    messages = [f"[run] started {name}", f"Running '{name}.py::main'..."]
+    messages += [_noise(rng) for _ in range(lines - len(messages) - 1)]
+    messages.append(
+        "Traceback (most recent call last):" if failed else f"{name} finished"
+    )
+    step = duration / (len(messages) - 1)
+    return [
+        {
+            "timestamp": int((started_at + index * step) * 1000),
+            "logStreamName": stream,
+            "message": message,
+        }
+        for index, message in enumerate(messages)
+    ]
+
+
+def _batch_run(rng: random.Random, fired: datetime, lines: int) -> List[Dict[str, Any]]:
+    stream = f"{STREAM_PREFIX}/{uuid.UUID(int=rng.getrandbits(128)).hex}"
+    at = fired.timestamp() + rng.uniform(20, 90)
+    events = [
+        {
+            "timestamp": int(at * 1000),
+            "logStreamName": stream,
+            "message": f"[run] started {BATCH_NAME}",
+        }
+    ]
+    for name in BATCHED_SCRIPTS:
+        runtime = rng.uniform(100, 140)
+        messages = [f"[batch_runner] started {name}"]
+        messages += [_noise(rng) for _ in range(lines // 2)]
+        for index, message in enumerate(messages):
+            events.append(
+                {
+                    "timestamp": int((at + index * runtime / len(messages)) * 1000),
+                    "logStreamName": stream,
+                    "message": message,
+                }
+            )
+        at += runtime
+        events.append(
+            {
+                "timestamp": int(at * 1000),
+                "logStreamName": stream,
+                "message": f"[batch_runner] {name} exited with 0 after {runtime:.1f}s",
+            }
+        )
+    return events
+
+
+def _noise(rng: random.Random) -> str:
+    return (
+        f"Simulating harvest of 0x{rng.getrandbits(160):040x}: "
+        f"gain {rng.uniform(0, 1000):.4f} loss {rng.uniform(0, 10):.4f}"
+    )
+
+
+def analyze(export: Path, manifest: Path, split: datetime) -> Dict[str, Any]:
+    completed = subprocess.run(
+        [
+            sys.executable,
+            str(RUN_HISTORY),
+            str(export),
+            "--manifest",
+            str(manifest),
+            "--split",
+            split.isoformat(),
+            "--json",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(completed.stdout)
+
+
+def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = Path(directory) / "scheduled-scripts.manifest.json"
+        write_manifest(manifest, args.scripts)
+        for label, days in (("small", args.days), ("large", args.days * args.scale)):
+            export = Path(directory) / f"{label}.jsonl.gz"
+            events = write_export(
+                export, days, args.scripts, args.lines, args.slowdown, args.seed
+            )
+            analysis = analyze(export, manifest, START + timedelta(days=days / 2))
+            read = analysis["read"]
+            results[label] = {
+                "days": days,
+                "events": events,
+                "export_mb": round(export.stat().st_size / 2**20, 1),
+                "seconds": read["seconds"],
+                "events_per_second": read["events_per_second"],
+                "compressed_mb_per_second": round(
+                    export.stat().st_size / 2**20 / read["seconds"], 2
+                ),
+                "peak_memory_mb": read["peak_memory_mb"],
+                "flagged": sorted(
+                    {regression["script"] for regression in analysis["regressions"]}
+                ),
+                "named": sorted(analysis["scripts"]),
+            }
+
+    small, large = results["small"], results["large"]
+    scripts = sorted(
+        [
+            *(f"script_{index}" for index in range(args.scripts)),
+            *BATCHED_SCRIPTS,
+            BATCH_NAME,
+        ]
+    )
+    growth = large["peak_memory_mb"] / small["peak_memory_mb"] - 1
+    results["checks"] = {
+        "memory_growth": round(growth, 3),
+        "constant_memory": growth <= args.max_memory_growth,
+        "regression_flagged": all(
+            result["flagged"] == [REGRESSED_SCRIPT] for result in (small, large)
+        ),
+        "runs_named": all(result["named"] == scripts for result in (small, large)),
+    }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=7, help="Days in the small export")
+    parser.add_argument(
+        "--scale", type=int, default=4, help="Times larger the large export is"
+    )
+    parser.add_argument("--scripts", type=int, default=20, help="Hourly scripts")
+    parser.add_argument("--lines", type=int, default=50, help="Log lines per run")
+    parser.add_argument(
+        "--slowdown",
+        type=float,
+        default=1.6,
+        help=f"Of {REGRESSED_SCRIPT} halfway through",
+    )
+    parser.add_argument("--max-memory-growth", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args)
+    checks = results["checks"]
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        for label in ("small", "large"):
+            result = results[label]
+            print(
+                f"{label:>5}: {result['days']} days, {result['events']} events, "
+                f"{result['export_mb']} MB gzip'd, {result['seconds']}s "
+                f"({result['events_per_second']} events/s, "
+                f"{result['compressed_mb_per_second']} MB/s), "
+                f"peak memory {result['peak_memory_mb']} MB, "
+                f"flagged {', '.join(result['flagged']) or 'nothing'}"
+            )
+        print(
+            f"memory growth {checks['memory_growth']:.1%}, "
+            f"constant memory {'ok' if checks['constant_memory'] else 'FAILED'}, "
+            f"regression flagged {'ok' if checks['regression_flagged'] else 'FAILED'}, "
+            f"runs named {'ok' if checks['runs_named'] else 'FAILED'}"
+        )
+    passed = ("constant_memory", "regression_flagged", "runs_named")
+    return 0 if all(checks[check] for check in passed) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
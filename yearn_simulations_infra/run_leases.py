@@ -0,0 +1,222 @@
+"""
+Leases keeping runs of a schedule from overlapping.
+
+A run holds its schedule's lease from when it is launched until its task
+stops. The launch owns the lease until it has started the task, from then
+on the task's ARN does. The lease expires on its own after `expires_at`, in
+case the stop is never seen. `DynamoLeaseStore` keeps them in the DynamoDB
+table of the task launcher, `InMemoryLeaseStore` is a stand-in with the same
+conditions.
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional
+
+SKIP = "skip"
+QUEUE = "queue"
+PREEMPT = "preempt"
+OVERLAP_POLICIES = (SKIP, QUEUE, PREEMPT)
+
+DEFAULT_LEASE_SECONDS = 2 * 3600
+
+
+def lease_id(schedule: str) -> str:
+    """
+    Id of a schedule's lease. It is also the `startedBy` of its tasks, which
+    ECS limits to 36 characters, hence a digest of the name.
+    """
+    return "lease-" + hashlib.sha256(schedule.encode()).hexdigest()[:30]
+
+
+class Lease:
+    def __init__(
+        self,
+        lease_id: str,
+        schedule: str,
+        owner: str,
+        expires_at: float,
+        task_arn: Optional[str] = None,
+        queued: Optional[Dict[str, Any]] = None,
+        launch: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.lease_id = lease_id
+        self.schedule = schedule
+        self.owner = owner
+        self.expires_at = expires_at
+        self.task_arn = task_arn
+        # At most one launch waits for the lease, later ones replace it
+        self.queued = queued
+        # Launch of the running task, kept to start it again if Spot
+        # capacity is taken back
+        self.launch = launch
+
+
+class InMemoryLeaseStore:
+    def __init__(self) -> None:
+        self._leases: Dict[str, Lease] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, lease: Lease, now: float) -> bool:
+        """Take `lease` unless another unexpired lease holds its id."""
+        with self._lock:
+            held = self._leases.get(lease.lease_id)
+            if held and held.expires_at > now:
+                return False
+            self._leases[lease.lease_id] = lease
+            return True
+
+    def take_over(self, lease: Lease) -> Optional[Lease]:
+        """Take `lease` whoever holds it, returning the previous holder."""
+        with self._lock:
+            held = self._leases.get(lease.lease_id)
+            self._leases[lease.lease_id] = lease
+            return held
+
+    def get(self, lease_id: str) -> Optional[Lease]:
+        with self._lock:
+            return self._leases.get(lease_id)
+
+    def set_task(self, lease_id: str, owner: str, task_arn: str) -> bool:
+        """Hand the lease from the launch holding it to the task it started."""
+        with self._lock:
+            held = self._leases.get(lease_id)
+            if held is None or held.owner != owner:
+                return False
+            held.owner = held.task_arn = task_arn
+            return True
+
+    def queue(self, lease_id: str, launch: Dict[str, Any]) -> bool:
+        with self._lock:
+            held = self._leases.get(lease_id)
+            if held is None:
+                return False
+            held.queued = launch
+            return True
+
+    def release(self, lease_id: str, owner: str) -> Optional[Lease]:
+        """Drop the lease if `owner` still holds it, returning it."""
+        with self._lock:
+            held = self._leases.get(lease_id)
+            if held is None or held.owner != owner:
+                return None
+            return self._leases.pop(lease_id)
+
+
+class DynamoLeaseStore:
+    """Leases in a DynamoDB table keyed by `lease_id`, using conditional writes."""
+
+    def __init__(self, table_name: str, client: Any) -> None:
+        self._table_name = table_name
+        self._client = client
+        self._conditional_check_failed = (
+            client.exceptions.ConditionalCheckFailedException
+        )
+
+    def acquire(self, lease: Lease, now: float) -> bool:
+        try:
+            self._client.put_item(
+                TableName=self._table_name,
+                Item=self._item(lease),
+                ConditionExpression=(
+                    "attribute_not_exists(lease_id) OR expires_at <= :now"
+                ),
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+        except self._conditional_check_failed:
+            return False
+        return True
+
+    def take_over(self, lease: Lease) -> Optional[Lease]:
+        response = self._client.put_item(
+            TableName=self._table_name, Item=self._item(lease), ReturnValues="ALL_OLD"
+        )
+        return self._lease(response.get("Attributes"))
+
+    def get(self, lease_id: str) -> Optional[Lease]:
+        response = self._client.get_item(
+            TableName=self._table_name,
+            Key={"lease_id": {"S": lease_id}},
+            ConsistentRead=True,
+        )
+        return self._lease(response.get("Item"))
+
+    def set_task(self, lease_id: str, owner: str, task_arn: str) -> bool:
+        return self._update(
+            lease_id,
+            "SET task_arn = :task_arn, lease_owner = :task_arn",
+            "lease_owner = :owner",
+            {":task_arn": {"S": task_arn}, ":owner": {"S": owner}},
+        )
+
+    def queue(self, lease_id: str, launch: Dict[str, Any]) -> bool:
+        return self._update(
+            lease_id,
+            "SET queued = :queued",
+            "attribute_exists(lease_id)",
+            {":queued": {"S": json.dumps(launch, sort_keys=True)}},
+        )
+
+    def release(self, lease_id: str, owner: str) -> Optional[Lease]:
+        try:
+            response = self._client.delete_item(
+                TableName=self._table_name,
+                Key={"lease_id": {"S": lease_id}},
+                ConditionExpression="lease_owner = :owner",
+                ExpressionAttributeValues={":owner": {"S": owner}},
+                ReturnValues="ALL_OLD",
+            )
+        except self._conditional_check_failed:
+            return None
+        return self._lease(response.get("Attributes"))
+
+    def _update(
+        self,
+        lease_id: str,
+        update: str,
+        condition: str,
+        values: Dict[str, Dict[str, str]],
+    ) -> bool:
+        try:
+            self._client.update_item(
+                TableName=self._table_name,
+                Key={"lease_id": {"S": lease_id}},
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values,
+            )
+        except self._conditional_check_failed:
+            return False
+        return True
+
+    @staticmethod
+    def _item(lease: Lease) -> Dict[str, Dict[str, str]]:
+        # `owner` is a reserved word in DynamoDB expressions
+        item = {
+            "lease_id": {"S": lease.lease_id},
+            "schedule": {"S": lease.schedule},
+            "lease_owner": {"S": lease.owner},
+            "expires_at": {"N": str(lease.expires_at)},
+        }
+        if lease.task_arn:
+            item["task_arn"] = {"S": lease.task_arn}
+        if lease.queued:
+            item["queued"] = {"S": json.dumps(lease.queued, sort_keys=True)}
+        if lease.launch:
+            item["launch"] = {"S": json.dumps(lease.launch, sort_keys=True)}
+        return item
+
+    @staticmethod
+    def _lease(item: Optional[Dict[str, Dict[str, str]]]) -> Optional[Lease]:
+        if not item:
+            return None
+        return Lease(
+            lease_id=item["lease_id"]["S"],
+            schedule=item["schedule"]["S"],
+            owner=item["lease_owner"]["S"],
+            expires_at=float(item["expires_at"]["N"]),
+            task_arn=item.get("task_arn", {}).get("S"),
+            queued=json.loads(item["queued"]["S"]) if "queued" in item else None,
+            launch=json.loads(item["launch"]["S"]) if "launch" in item else None,
+        )
@@ -0,0 +1,115 @@
+import hashlib
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from cron import CronSchedule
+
+# Schedules are compared over one whole week, starting on a Monday, which
+# covers hourly, daily and weekly crons alike.
+HORIZON_START = datetime(2021, 1, 4)
+HORIZON_END = HORIZON_START + timedelta(days=7)
+
+
+class FlexibleSchedule:
+    """A schedule that may start up to `window` minutes after its cron minute."""
+
+    def __init__(self, name: str, schedule: CronSchedule, window: int) -> None:
+        self.name = name
+        self.schedule = schedule
+        self.window = window
+
+    @property
+    def can_stagger(self) -> bool:
+        # Only a single fixed minute can be moved without changing the meaning
+        # of the schedule
+        return self.window >= 1 and self.schedule.minute.isdigit()
+
+
+def plan_stagger(
+    flexible_schedules: Iterable[FlexibleSchedule],
+    fixed_schedules: Iterable[CronSchedule] = (),
+) -> Dict[str, CronSchedule]:
+    """
+    Move every flexible schedule within its window to the minute where the
+    fewest other tasks start.
+
+    Schedules are placed one at a time in name order, each one picking the
+    offset with the lowest peak and then the lowest total of starts it would
+    join. Ties are broken by a hash of the name and offset, so the plan is the
+    same on every synth. Schedules that can't be staggered are returned
+    unchanged.
+    """
+    flexible_schedules = sorted(flexible_schedules, key=lambda flexible: flexible.name)
+
+    load = Counter()
+    for schedule in fixed_schedules:
+        load.update(_fire_times(schedule))
+    for flexible in flexible_schedules:
+        if not flexible.can_stagger:
+            load.update(_fire_times(flexible.schedule))
+
+    planned = {}
+    for flexible in flexible_schedules:
+        schedule = flexible.schedule
+        if flexible.can_stagger:
+            fire_times = list(_fire_times(schedule))
+            minute = int(schedule.minute)
+            # Up to and including `window` minutes later, within the hour
+            offsets = range(0, min(flexible.window + 1, 60 - minute))
+
+            def cost(offset: int) -> Tuple[int, int, str]:
+                shifted = [time + timedelta(minutes=offset) for time in fire_times]
+                starts = [load[time] for time in shifted]
+                # Spread equally good offsets by name rather than piling them
+                # all on the cron minute
+                tie_breaker = hashlib.sha256(
+                    f"{flexible.name}:{offset}".encode()
+                ).hexdigest()
+                return (max(starts, default=0), sum(starts), tie_breaker)
+
+            offset = min(offsets, key=cost)
+            schedule = CronSchedule(
+                minute=str(minute + offset),
+                hour=schedule.hour,
+                day=schedule.day,
+                month=schedule.month,
+                week_day=schedule.week_day,
+                year=schedule.year,
+            )
+            load.update(_fire_times(schedule))
+        planned[flexible.name] = schedule
+
+    return planned
+
+
+def start_histogram(schedules: Iterable[CronSchedule]) -> List[Tuple[int, int, int]]:
+    """
+    `(minute of the hour, schedules starting in it, peak starts in one minute)`
+    for every minute of the hour in which something starts.
+    """
+    jobs = Counter()
+    starts = Counter()
+    for schedule in schedules:
+        fire_times = set(_fire_times(schedule))
+        jobs.update({time.minute for time in fire_times})
+        starts.update(fire_times)
+
+    peaks = Counter()
+    for time, count in starts.items():
+        peaks[time.minute] = max(peaks[time.minute], count)
+
+    return [(minute, jobs[minute], peaks[minute]) for minute in sorted(jobs)]
+
+
+def format_histogram(histogram: List[Tuple[int, int, int]]) -> str:
+    lines = [
+        "Task starts per minute of the hour (schedules, peak starts in one minute):"
+    ]
+    for minute, jobs, peak in histogram:
+        lines.append(f"  :{minute:02d} {'#' * peak:<20} {jobs} schedules, peak {peak}")
+    return "\n".join(lines)
+
+
+def _fire_times(schedule: CronSchedule) -> Iterable[datetime]:
+    return schedule.fire_times(HORIZON_START, HORIZON_END)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Long running scheduler for scheduled scripts that opted out of their own
+Fargate task.
+
+The scheduled tasks stack starts it as a service with the jobs to run in
+`SCHEDULED_JOBS`, a JSON list of
+`{"script": ..., "cron": "cron(...)", "timeout": <seconds>, "environment": {...}}`,
+and the number of scripts allowed to run at once in `MAX_CONCURRENT_JOBS`.
+
+The brownie project is loaded once when the service starts. Every run is
+forked from that warm process, like `batch_runner.py` does, and is killed
+if it runs past its timeout. A job that is still running when it is due
+again is skipped rather than started twice.
+
+Try a schedule locally without running anything, using a fake clock:
+
+    SCHEDULED_JOBS='[{"script": "report", "cron": "cron(0/15 * * * ? *)"}]' \\
+        python scheduler_service.py --simulate-minutes 120
+"""
+
+import abc
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from batch_runner import (
+    BatchJob,
+    PROJECT_PATH,
+    report_script_metrics,
+    run_with_brownie,
+    _run_in_child,
+)
+from cron import CronSchedule
+
+DEFAULT_TIMEOUT = 30 * 60
+# How often finished and timed out runs are looked for between two minutes
+POLL_SECONDS = 5
+# Runs missed while the service was busy or paused are still started, but
+# not further back than this
+MAX_CATCH_UP = timedelta(minutes=5)
+
+
+class SystemClock:
+    def now(self) -> datetime:
+        return datetime.utcnow()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class FakeClock:
+    """A clock that only moves when slept on, for trying schedules locally."""
+
+    def __init__(self, start: datetime) -> None:
+        self._now = start
+
+    def now(self) -> datetime:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        self._now += timedelta(seconds=seconds)
+
+
+class ScheduledJob:
+    def __init__(
+        self,
+        script: str,
+        schedule: CronSchedule,
+        timeout: float = DEFAULT_TIMEOUT,
+        environment: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.script = script
+        self.schedule = schedule
+        self.timeout = timeout
+        self.environment = environment or {}
+
+    @classmethod
+    def from_environment(cls) -> List["ScheduledJob"]:
+        return [
+            cls(
+                job["script"],
+                CronSchedule.from_expression(job["cron"]),
+                float(job.get("timeout") or DEFAULT_TIMEOUT),
+                job.get("environment"),
+            )
+            for job in json.loads(os.environ["SCHEDULED_JOBS"])
+        ]
+
+
+class Run(abc.ABC):
+    """A started job. `exit_code` is None while it's still running."""
+
+    def __init__(self, job: ScheduledJob, started_at: datetime) -> None:
+        self.job = job
+        self.started_at = started_at
+
+    @property
+    @abc.abstractmethod
+    def exit_code(self) -> Optional[int]: ...
+
+    @abc.abstractmethod
+    def kill(self) -> None: ...
+
+
+class ProcessRun(Run):
+    def __init__(self, job: ScheduledJob, started_at: datetime, run_job) -> None:
+        import multiprocessing
+
+        super().__init__(job, started_at)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self._process = multiprocessing.get_context("fork").Process(
+            target=_run_in_child,
+            args=(BatchJob(job.script, job.environment), run_job),
+            name=job.script,
+        )
+        self._process.start()
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return self._process.exitcode
+
+    def kill(self) -> None:
+        self._process.terminate()
+        self._process.join(10)
+        if self._process.exitcode is None:
+            self._process.kill()
+        self._process.join()
+
+
+class Scheduler:
+    def __init__(
+        self,
+        jobs: List[ScheduledJob],
+        start_run: Callable[[ScheduledJob, datetime], Run],
+        clock=None,
+        max_concurrent_jobs: int = 4,
+    ) -> None:
+        self.jobs = jobs
+        self.clock = clock or SystemClock()
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.running: Dict[str, Run] = {}
+        self._start_run = start_run
+        self._last_minute = self._minute(self.clock.now())
+
+    def tick(self) -> None:
+        """
+        Reap finished runs, kill overdue ones and start the jobs due since the
+        last tick.
+        """
+        now = self.clock.now()
+
+        for script, run in list(self.running.items()):
+            if run.exit_code is None and now - run.started_at > timedelta(
+                seconds=run.job.timeout
+            ):
+                self._log(
+                    f"{script} timed out after {run.job.timeout:.0f}s, killing it"
+                )
+                run.kill()
+            if run.exit_code is not None:
+                self._log(f"{script} exited with {run.exit_code}")
+                report_script_metrics(
+                    script, (now - run.started_at).total_seconds(), run.exit_code
+                )
+                del self.running[script]
+
+        minute = self._minute(now)
+        due_minute = max(self._last_minute, minute - MAX_CATCH_UP) + timedelta(
+            minutes=1
+        )
+        while due_minute <= minute:
+            for job in self.jobs:
+                if job.schedule.matches(due_minute):
+                    self._start(job, now)
+            due_minute += timedelta(minutes=1)
+        self._last_minute = minute
+
+    def run_forever(self) -> None:
+        while True:
+            self.tick()
+            self.clock.sleep(self._seconds_until_next_tick())
+
+    def _start(self, job: ScheduledJob, now: datetime) -> None:
+        if job.script in self.running:
+            self._log(f"skipping {job.script}, the previous run is still going")
+        elif len(self.running) >= self.max_concurrent_jobs:
+            self._log(
+                f"skipping {job.script}, already running {len(self.running)} jobs"
+            )
+        else:
+            self._log(f"starting {job.script}")
+            self.running[job.script] = self._start_run(job, now)
+
+    def _seconds_until_next_tick(self) -> float:
+        now = self.clock.now()
+        next_minute = self._minute(now) + timedelta(minutes=1)
+        return max(min((next_minute - now).total_seconds(), POLL_SECONDS), 0.1)
+
+    def _log(self, message: str) -> None:
+        _log(f"{self.clock.now():%Y-%m-%d %H:%M:%S} {message}")
+
+    @staticmethod
+    def _minute(time: datetime) -> datetime:
+        return time.replace(second=0, microsecond=0)
+
+
+class SimulatedRun(Run):
+    """A run that finishes straight away, used with `--simulate-minutes`."""
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return 0
+
+    def kill(self) -> None:
+        pass
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run scheduled scripts in process.")
+    parser.add_argument(
+        "--simulate-minutes",
+        type=int,
+        help="Only print which jobs would start over this many minutes, using a "
+        "fake clock.",
+    )
+    args = parser.parse_args(argv)
+
+    jobs = ScheduledJob.from_environment()
+    max_concurrent_jobs = int(os.environ.get("MAX_CONCURRENT_JOBS", "4"))
+
+    if args.simulate_minutes:
+        clock = FakeClock(datetime.utcnow().replace(second=0, microsecond=0))
+        end = clock.now() + timedelta(minutes=args.simulate_minutes)
+        scheduler = Scheduler(jobs, SimulatedRun, clock, max_concurrent_jobs)
+        while clock.now() < end:
+            scheduler.tick()
+            clock.sleep(60)
+        return 0
+
+    run_job = run_with_brownie(
+        os.environ.get("BROWNIE_PROJECT_PATH", PROJECT_PATH),
+        os.environ.get("BROWNIE_NETWORK", "mainnet"),
+    )
+    scheduler = Scheduler(
+        jobs,
+        lambda job, now: ProcessRun(job, now, run_job),
+        max_concurrent_jobs=max_concurrent_jobs,
+    )
+
+    # ECS stops the service with SIGTERM, take the running scripts down with it
+    def stop(signum, frame):
+        for run in scheduler.running.values():
+            run.kill()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    _log(f"scheduling {len(jobs)} jobs")
+    scheduler.run_forever()
+    return 0
+
+
+def _log(message: str) -> None:
+    print(f"[scheduler] {message}", flush=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
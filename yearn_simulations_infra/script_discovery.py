@@ -0,0 +1,309 @@
+import ast
+import hashlib
+import json
+import sys
+from importlib import import_module
+from pathlib import Path
+from pkgutil import iter_modules
+from typing import Any, Dict, List, Optional
+
+# Bump whenever the parser or the manifest layout changes so stale manifests
+# left behind in `cdk.out` are ignored instead of trusted.
+MANIFEST_VERSION = 1
+MANIFEST_FILE_NAME = "scheduled-scripts.manifest.json"
+
+SCHEDULER_MODULE = "scheduler"
+CRON_FIELDS = ("day", "hour", "minute", "month", "week_day", "year")
+
+
+class ScheduledScriptSpec:
+    """
+    Everything the stacks need to know about a scheduled script, without
+    holding a reference to the imported script function.
+    """
+
+    def __init__(
+        self,
+        script_name: str,
+        telegram_chat_id: Optional[str] = None,
+        environment: Optional[Dict[str, str]] = None,
+        secrets: Optional[List[str]] = None,
+        day: Optional[str] = None,
+        hour: Optional[str] = None,
+        minute: Optional[str] = None,
+        month: Optional[str] = None,
+        week_day: Optional[str] = None,
+        year: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.script_name = script_name
+        self.telegram_chat_id = telegram_chat_id
+        self.environment = environment
+        self.secrets = list(secrets or [])
+        self.day = day
+        self.hour = hour
+        self.minute = minute
+        self.month = month
+        self.week_day = week_day
+        self.year = year
+        # Any other keyword passed to the scheduler decorator
+        self.options = dict(options or {})
+
+    @classmethod
+    def from_scheduled_script(cls, scheduled_script: Any) -> "ScheduledScriptSpec":
+        """
+        Build a spec from an entry of
+        `schedule_scripts_storage.scheduled_scripts`.
+        """
+        known = {"script", "telegram_chat_id", "environment", "secrets", *CRON_FIELDS}
+        attributes = {
+            key: value
+            for key, value in vars(scheduled_script).items()
+            if not key.startswith("_")
+        }
+        # Schedulers keeping the decorator's keywords in an `options` dict
+        # pass them the same as ones setting an attribute per keyword
+        if isinstance(attributes.get("options"), dict):
+            attributes = {**attributes.pop("options"), **attributes}
+        options = {key: value for key, value in attributes.items() if key not in known}
+        return cls(
+            script_name=scheduled_script.script.__module__.split(".")[-1],
+            telegram_chat_id=attributes.get("telegram_chat_id"),
+            environment=attributes.get("environment"),
+            secrets=attributes.get("secrets"),
+            options=options,
+            **{field: attributes.get(field) for field in CRON_FIELDS},
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScheduledScriptSpec":
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "script_name": self.script_name,
+            "telegram_chat_id": self.telegram_chat_id,
+            "environment": self.environment,
+            "secrets": self.secrets,
+            **{field: getattr(self, field) for field in CRON_FIELDS},
+            "options": self.options,
+        }
+
+
+class ScriptDiscoveryError(Exception):
+    pass
+
+
+def discover_scheduled_scripts(
+    workspace_path: Path, manifest_dir: Optional[Path] = None
+) -> List[ScheduledScriptSpec]:
+    """
+    Find scheduled scripts by reading the scheduler decorators straight from
+    the script sources, without importing brownie or the scripts themselves.
+
+    When `manifest_dir` is given, the parsed result of every script is stored
+    there keyed by the hash of its source, and only scripts whose content
+    changed since the previous run are parsed again.
+    """
+    scripts_path = _scripts_path(workspace_path)
+    manifest_path = manifest_dir.joinpath(MANIFEST_FILE_NAME) if manifest_dir else None
+    cached_files = _read_manifest(manifest_path)
+
+    files = {}
+    scheduled_scripts = []
+    for module_name, source_path in _iter_script_sources(scripts_path):
+        source = source_path.read_bytes()
+        digest = hashlib.sha256(source).hexdigest()
+        relative_path = source_path.relative_to(scripts_path).as_posix()
+
+        cached = cached_files.get(relative_path)
+        if cached and cached["sha256"] == digest:
+            scripts = [
+                ScheduledScriptSpec.from_dict(data) for data in cached["scripts"]
+            ]
+        else:
+            scripts = _parse_script_source(module_name, source, source_path)
+
+        files[relative_path] = {
+            "sha256": digest,
+            "scripts": [script.to_dict() for script in scripts],
+        }
+        scheduled_scripts.extend(scripts)
+
+    if manifest_path and files != cached_files:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        manifest_path.write_text(
+            json.dumps(
+                {"version": MANIFEST_VERSION, "files": files}, indent=2, sort_keys=True
+            )
+        )
+
+    return scheduled_scripts
+
+
+def discover_scheduled_scripts_with_brownie(
+    workspace_path: Path,
+) -> List[ScheduledScriptSpec]:
+    """
+    Find scheduled scripts by loading the brownie project and importing every
+    script module. Slow, but sees decorators whose arguments are only known at
+    runtime.
+    """
+    from brownie import project
+
+    # Add root to sys path so we can import more predictively
+    root_path = Path(".").resolve().root
+    sys.path.insert(0, root_path)
+
+    brownie_project = None
+    try:
+        brownie_project = project.load(project_path=workspace_path)
+        brownie_project.load_config()
+
+        brownie_project._add_to_main_namespace()
+
+        script_path = brownie_project._path.joinpath(
+            brownie_project._structure["scripts"]
+        )
+
+        brownie_project_module = import_module(SCHEDULER_MODULE)
+
+        # import all script modules so we can be
+        scripts_module = ".".join(script_path.parts[1:])
+        for _, module_name, _ in iter_modules([script_path]):
+            # import the module and iterate through its attributes
+            import_module(f"{scripts_module}.{module_name}")
+
+        storage = brownie_project_module.schedule_scripts_storage
+        return [
+            ScheduledScriptSpec.from_scheduled_script(scheduled_script)
+            for scheduled_script in storage.scheduled_scripts
+        ]
+
+    finally:
+        sys.path.remove(root_path)
+        if brownie_project is not None:
+            brownie_project._remove_from_main_namespace()
+
+
+def _scripts_path(workspace_path: Path) -> Path:
+    # Brownie lets a project move its scripts folder through the `project_structure`
+    # setting, so honour it when it's a plain literal in the config.
+    scripts_dir = "scripts"
+    config_path = workspace_path.joinpath("brownie-config.yaml")
+    if config_path.exists():
+        in_project_structure = False
+        for line in config_path.read_text().splitlines():
+            if line and not line[0].isspace():
+                in_project_structure = line.startswith("project_structure:")
+                continue
+            key, _, value = line.strip().partition(":")
+            if in_project_structure and key == "scripts" and value.strip():
+                scripts_dir = value.strip().strip("'\"")
+    return workspace_path.joinpath(scripts_dir)
+
+
+def _iter_script_sources(scripts_path: Path):
+    # Same modules `iter_modules` would hand to `import_module`, in the same order
+    for _, module_name, is_package in iter_modules([str(scripts_path)]):
+        if is_package:
+            yield module_name, scripts_path.joinpath(module_name, "__init__.py")
+        else:
+            yield module_name, scripts_path.joinpath(f"{module_name}.py")
+
+
+def _parse_script_source(
+    module_name: str, source: bytes, source_path: Path
+) -> List[ScheduledScriptSpec]:
+    tree = ast.parse(source, filename=str(source_path))
+
+    scheduler_names = set()
+    scheduler_modules = set()
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module == SCHEDULER_MODULE:
+            scheduler_names.update(alias.asname or alias.name for alias in node.names)
+        elif isinstance(node, ast.Import):
+            scheduler_modules.update(
+                alias.asname or alias.name
+                for alias in node.names
+                if alias.name == SCHEDULER_MODULE
+            )
+        elif isinstance(node, ast.Assign):
+            # Module level constants are often used for chat ids
+            try:
+                value = ast.literal_eval(node.value)
+            except (ValueError, TypeError, SyntaxError):
+                continue
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    constants[target.id] = value
+
+    scheduled_scripts = []
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if not isinstance(decorator, ast.Call):
+                continue
+            func = decorator.func
+            is_scheduler_call = (
+                isinstance(func, ast.Name) and func.id in scheduler_names
+            ) or (
+                isinstance(func, ast.Attribute)
+                and isinstance(func.value, ast.Name)
+                and func.value.id in scheduler_modules
+            )
+            if not is_scheduler_call:
+                continue
+
+            location = f"{source_path}:{decorator.lineno}"
+            if decorator.args:
+                raise ScriptDiscoveryError(
+                    f"{location}: pass scheduler arguments as keywords so they can "
+                    "be read without importing the script, or synth with "
+                    "`-c scriptDiscovery=brownie`."
+                )
+            arguments = {
+                keyword.arg: _literal_value(keyword.value, constants, location)
+                for keyword in decorator.keywords
+            }
+            scheduled_scripts.append(_spec_from_arguments(module_name, arguments))
+
+    return scheduled_scripts
+
+
+def _literal_value(node: ast.AST, constants: Dict[str, Any], location: str) -> Any:
+    if isinstance(node, ast.Name) and node.id in constants:
+        return constants[node.id]
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        raise ScriptDiscoveryError(
+            f"{location}: scheduler arguments must be literals or module level "
+            "constants to be read statically, or synth with "
+            "`-c scriptDiscovery=brownie`."
+        )
+
+
+def _spec_from_arguments(
+    script_name: str, arguments: Dict[str, Any]
+) -> ScheduledScriptSpec:
+    known = {"telegram_chat_id", "environment", "secrets", *CRON_FIELDS}
+    return ScheduledScriptSpec(
+        script_name=script_name,
+        options={key: value for key, value in arguments.items() if key not in known},
+        **{key: value for key, value in arguments.items() if key in known},
+    )
+
+
+def _read_manifest(manifest_path: Optional[Path]) -> Dict[str, Any]:
+    if not manifest_path or not manifest_path.exists():
+        return {}
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except ValueError:
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("files", {})
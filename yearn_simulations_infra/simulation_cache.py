@@ -0,0 +1,208 @@
+"""
+Results of fork simulations shared by the simulator bot and the scheduled
+scripts, so a strategy's harvest at a block is only simulated once.
+
+A result is keyed by what decides it: the network, the strategy, the block
+the chain was forked at and a hash of the code that ran the simulation.
+Results expire after `SIMULATION_CACHE_TTL` seconds. DynamoDB deletes
+expired items on its own but only eventually, so expired ones are also
+ignored when read.
+
+    from simulation_cache import code_hash, default_cache
+
+    result = default_cache().get_or_simulate(
+        "mainnet", strategy.address, block, code_hash([Path(__file__)]),
+        lambda: simulate_harvest(strategy, block),
+    )
+
+Results have to be JSON serializable. `default_cache` uses the table in
+`SIMULATION_CACHE_TABLE`, and an `InMemoryResultStore` without one, so
+scripts run the same locally. A failing table is treated as a miss, the
+simulation still runs.
+
+Every lookup logs a line the metric filters of `SimulationCacheStack` count
+as `SimulationCacheHits` or `SimulationCacheMisses` per network. Hits also
+count the seconds the original simulation took as `SimulationSecondsSaved`.
+
+Only uses the standard library, and boto3 when there is a table, so it can
+be copied into the task image next to the yearn-simulations project.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+# DynamoDB items can't be over 400 KB, larger results aren't cached
+MAX_RESULT_BYTES = 350 * 1024
+# Marks the lines of this module, which the metric filters match on
+EVENT = "simulation_cache"
+HIT = "hit"
+MISS = "miss"
+
+
+def cache_key(network: str, strategy: str, block: int, code_hash: str) -> str:
+    # Addresses come checksummed or not
+    return f"{network}/{strategy.lower()}/{block}/{code_hash}"
+
+
+def code_hash(paths: Iterable[Path]) -> str:
+    """Digest of the files under `paths`, to key results by the code producing them."""
+    digest = hashlib.sha256()
+    files = sorted(
+        file
+        for path in paths
+        for file in ([path] if path.is_file() else path.rglob("*.py"))
+    )
+    for file in files:
+        digest.update(str(file).encode())
+        digest.update(file.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class CachedResult:
+    def __init__(self, result: Any, seconds: float, expires_at: float) -> None:
+        self.result = result
+        # How long the simulation producing it took
+        self.seconds = seconds
+        self.expires_at = expires_at
+
+
+class InMemoryResultStore:
+    def __init__(self) -> None:
+        self._results: Dict[str, CachedResult] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            return self._results.get(key)
+
+    def put(self, key: str, cached: CachedResult) -> None:
+        with self._lock:
+            self._results[key] = cached
+
+
+class DynamoResultStore:
+    """Results in a DynamoDB table keyed by `cache_key`, expiring on `expires_at`."""
+
+    def __init__(self, table_name: str, client: Any) -> None:
+        self._table_name = table_name
+        self._client = client
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        response = self._client.get_item(
+            TableName=self._table_name, Key={"cache_key": {"S": key}}
+        )
+        item = response.get("Item")
+        if not item:
+            return None
+        return CachedResult(
+            result=json.loads(item["result"]["S"]),
+            seconds=float(item["seconds"]["N"]),
+            expires_at=float(item["expires_at"]["N"]),
+        )
+
+    def put(self, key: str, cached: CachedResult) -> None:
+        self._client.put_item(
+            TableName=self._table_name,
+            Item={
+                "cache_key": {"S": key},
+                "result": {"S": json.dumps(cached.result, sort_keys=True)},
+                "seconds": {"N": str(round(cached.seconds, 3))},
+                # The table's TTL attribute, in whole seconds
+                "expires_at": {"N": str(int(cached.expires_at))},
+            },
+        )
+
+
+class SimulationCache:
+    def __init__(
+        self,
+        store: Any,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+        emit: Callable[[str], None] = print,
+    ) -> None:
+        self._store = store
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._emit = emit
+
+    def get_or_simulate(
+        self,
+        network: str,
+        strategy: str,
+        block: int,
+        code_hash: str,
+        simulate: Callable[[], Any],
+    ) -> Any:
+        """The cached result of the simulation, or the result of running it."""
+        key = cache_key(network, strategy, block, code_hash)
+        cached = self._get(key)
+        if cached is not None:
+            self._emit_lookup(network, HIT, cached.seconds)
+            return cached.result
+
+        self._emit_lookup(network, MISS)
+        started_at = self._clock()
+        result = simulate()
+        finished_at = self._clock()
+        if len(json.dumps(result, sort_keys=True)) <= MAX_RESULT_BYTES:
+            self._put(
+                key,
+                CachedResult(
+                    result, finished_at - started_at, finished_at + self._ttl_seconds
+                ),
+            )
+        return result
+
+    def _get(self, key: str) -> Optional[CachedResult]:
+        try:
+            cached = self._store.get(key)
+        except Exception as error:
+            print(f"Could not read the simulation cache: {error}", file=sys.stderr)
+            return None
+        if cached is None or cached.expires_at <= self._clock():
+            return None
+        return cached
+
+    def _put(self, key: str, cached: CachedResult) -> None:
+        try:
+            self._store.put(key, cached)
+        except Exception as error:
+            print(f"Could not write the simulation cache: {error}", file=sys.stderr)
+
+    def _emit_lookup(self, network: str, result: str, seconds_saved: float = 0) -> None:
+        self._emit(
+            json.dumps(
+                {
+                    "event": EVENT,
+                    "network": network,
+                    "result": result,
+                    "seconds_saved": round(seconds_saved, 3),
+                }
+            )
+        )
+
+
+_default_cache: Optional[SimulationCache] = None
+
+
+def default_cache() -> SimulationCache:
+    """The cache configured by the task's environment, shared by its callers."""
+    global _default_cache
+    if _default_cache is None:
+        ttl_seconds = int(os.environ.get("SIMULATION_CACHE_TTL") or DEFAULT_TTL_SECONDS)
+        store: Any = InMemoryResultStore()
+        table_name = os.environ.get("SIMULATION_CACHE_TABLE")
+        if table_name:
+            import boto3
+
+            store = DynamoResultStore(table_name, boto3.client("dynamodb"))
+        _default_cache = SimulationCache(store, ttl_seconds)
+    return _default_cache
@@ -0,0 +1,132 @@
+from typing import Dict
+
+import aws_cdk.aws_cloudwatch as cloudwatch
+import aws_cdk.aws_dynamodb as dynamodb
+import aws_cdk.aws_ecs as ecs
+import aws_cdk.aws_logs as logs
+from aws_cdk import core as cdk
+
+from simulation_cache import EVENT, HIT, MISS
+from yearn_scheduled_task import INFRA_RUNTIME_PATH
+
+METRICS_NAMESPACE = "YearnSimulationCache"
+NETWORK_DIMENSION = "network"
+
+
+class SimulationCacheStack(cdk.Stack):
+    """
+    DynamoDB table of simulation results shared by every task, with the
+    metrics of its hits and misses. See `simulation_cache.py`.
+    """
+
+    @property
+    def cache_environment(self) -> Dict[str, str]:
+        """
+        Environment `simulation_cache.py` reads, to add to the containers using
+        the cache.
+        """
+        return {
+            "SIMULATION_CACHE_TABLE": self._table.table_name,
+            "SIMULATION_CACHE_TTL": str(int(self._ttl.to_seconds())),
+            # Scripts import `simulation_cache` from the runtime modules
+            "PYTHONPATH": INFRA_RUNTIME_PATH,
+        }
+
+    def __init__(
+        self,
+        scope: cdk.Construct,
+        construct_id: str,
+        log_group: logs.LogGroup,
+        ttl: cdk.Duration = cdk.Duration.hours(24),
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self._ttl = ttl
+
+        # Only results that can be simulated again live here
+        self._table = dynamodb.Table(
+            self,
+            "SimulationResults",
+            partition_key=dynamodb.Attribute(
+                name="cache_key", type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+
+        # The containers log to the shared log group, where their lines
+        # aren't picked up as embedded metrics on their own
+        lookup = f'($.event = "{EVENT}")'
+        for metric_name, pattern, value, unit in (
+            ("SimulationCacheHits", f'{lookup} && ($.result = "{HIT}")', "1", "Count"),
+            (
+                "SimulationCacheMisses",
+                f'{lookup} && ($.result = "{MISS}")',
+                "1",
+                "Count",
+            ),
+            (
+                "SimulationSecondsSaved",
+                f'{lookup} && ($.result = "{HIT}")',
+                "$.seconds_saved",
+                "Seconds",
+            ),
+        ):
+            metric_filter = logs.CfnMetricFilter(
+                self,
+                f"{metric_name}MetricFilter",
+                log_group_name=log_group.log_group_name,
+                filter_pattern=f"{{ {pattern} }}",
+                metric_transformations=[
+                    logs.CfnMetricFilter.MetricTransformationProperty(
+                        metric_namespace=METRICS_NAMESPACE,
+                        metric_name=metric_name,
+                        metric_value=value,
+                    )
+                ],
+            )
+            # This version of the CDK doesn't know about the unit and
+            # dimensions of metric filters yet
+            metric_filter.add_property_override("MetricTransformations.0.Unit", unit)
+            metric_filter.add_property_override(
+                "MetricTransformations.0.Dimensions",
+                [{"Key": NETWORK_DIMENSION, "Value": f"$.{NETWORK_DIMENSION}"}],
+            )
+
+        # Hits per hour are the fork simulations the cache saved
+        cloudwatch.Dashboard(
+            self,
+            "SimulationCacheDashboard",
+            dashboard_name="YearnSimulationCache",
+            widgets=[
+                [
+                    cloudwatch.GraphWidget(
+                        title="Simulation cache lookups per hour",
+                        left=[
+                            self.metric("SimulationCacheHits"),
+                            self.metric("SimulationCacheMisses"),
+                        ],
+                        right=[self.metric("SimulationSecondsSaved")],
+                        width=12,
+                    )
+                ]
+            ],
+        )
+
+    def grant(self, task_definition: ecs.TaskDefinition) -> None:
+        self._table.grant_read_write_data(task_definition.task_role)
+
+    @staticmethod
+    def metric(metric_name: str) -> cloudwatch.MathExpression:
+        """`metric_name` summed over every network, per hour."""
+        return cloudwatch.MathExpression(
+            expression=(
+                f"SUM(SEARCH('{{{METRICS_NAMESPACE},{NETWORK_DIMENSION}}} "
+                f"MetricName=\"{metric_name}\"', 'Sum', 3600))"
+            ),
+            using_metrics={},
+            label=metric_name,
+            period=cdk.Duration.hours(1),
+        )
@@ -0,0 +1,81 @@
+from fnmatch import fnmatch
+from typing import Callable, Dict, Iterable, List, Optional
+
+from aws_cdk import core as cdk
+
+
+class StackRegistry:
+    """
+    Holds stack factories and only runs the ones that are needed.
+
+    A factory receives the registry and returns the stack it builds. Factories
+    get hold of the stacks they depend on through `registry.get(...)`, so
+    building a selected stack also builds everything it needs, and nothing
+    else.
+    """
+
+    def __init__(self, scope: cdk.Construct) -> None:
+        self._scope = scope
+        self._factories: Dict[str, Callable[["StackRegistry"], cdk.Stack]] = {}
+        self._stacks: Dict[str, cdk.Stack] = {}
+        self._building: List[str] = []
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    @property
+    def built(self) -> Dict[str, cdk.Stack]:
+        return dict(self._stacks)
+
+    def register(
+        self, name: str, factory: Callable[["StackRegistry"], cdk.Stack]
+    ) -> None:
+        if name in self._factories:
+            raise ValueError(f"A stack named `{name}` is already registered.")
+        self._factories[name] = factory
+
+    def get(self, name: str) -> cdk.Stack:
+        if name in self._stacks:
+            return self._stacks[name]
+        if name not in self._factories:
+            raise KeyError(f"No stack named `{name}` is registered.")
+        if name in self._building:
+            cycle = " -> ".join(self._building + [name])
+            raise ValueError(f"Stack dependency cycle: {cycle}")
+
+        self._building.append(name)
+        try:
+            self._stacks[name] = self._factories[name](self)
+        finally:
+            self._building.pop()
+        return self._stacks[name]
+
+    def select(self, patterns: Optional[Iterable[str]]) -> List[str]:
+        """
+        Names of the registered stacks matching any of `patterns`, or all of
+        them when no pattern is given. Patterns may be a bare stack name, the
+        full `Scope/Stack` path shown by `cdk ls`, or a glob of either.
+        """
+        patterns = [pattern for pattern in (patterns or []) if pattern]
+        if not patterns:
+            return self.names
+
+        scope_path = self._scope.node.path
+        selected = [
+            name
+            for name in self._factories
+            if any(
+                fnmatch(name, pattern) or fnmatch(f"{scope_path}/{name}", pattern)
+                for pattern in patterns
+            )
+        ]
+        if not selected:
+            raise ValueError(
+                f"No stacks match {', '.join(patterns)}. "
+                f"Available stacks: {', '.join(self._factories)}"
+            )
+        return selected
+
+    def build(self, patterns: Optional[Iterable[str]] = None) -> List[cdk.Stack]:
+        return [self.get(name) for name in self.select(patterns)]
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Compare how long tasks take to start, from ECS task timestamps.
+
+Reads the output of `aws ecs describe-tasks`, or fetches the recently
+stopped tasks of a cluster with boto3, and reports each startup phase per
+label:
+
+    provisioning  created until the image pull started
+    pull          pulling the image
+    start         pulled until the container started
+    run           container started until it exited
+    total         created until the container exited
+
+The first label is the baseline the others are compared to. Warming the
+image moves work from `run` into the build, so compare `total` as well as
+the startup phases.
+
+Usage:
+
+    aws ecs describe-tasks --cluster ... --tasks ... > before.json
+    python yearn_simulations_infra/startup_benchmark.py \
+        latest=before.json built=after.json
+
+    python yearn_simulations_infra/startup_benchmark.py \
+        --cluster <cluster> --family <family>
+"""
+
+import argparse
+import json
+import math
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# (phase, from timestamp, to timestamp)
+PHASES = (
+    ("provisioning", "createdAt", "pullStartedAt"),
+    ("pull", "pullStartedAt", "pullStoppedAt"),
+    ("start", "pullStoppedAt", "startedAt"),
+    ("run", "startedAt", "executionStoppedAt"),
+    ("total", "createdAt", "executionStoppedAt"),
+)
+
+
+def phase_durations(task: Dict[str, Any]) -> Dict[str, float]:
+    """Seconds spent in each phase a task has both timestamps for."""
+    durations = {}
+    for phase, start, end in PHASES:
+        started_at, ended_at = _timestamp(task.get(start)), _timestamp(task.get(end))
+        if started_at is not None and ended_at is not None:
+            durations[phase] = ended_at - started_at
+    return durations
+
+
+def read_tasks(path: Path) -> List[Dict[str, Any]]:
+    document = json.loads(path.read_text())
+    return document["tasks"] if isinstance(document, dict) else document
+
+
+def fetch_tasks(
+    cluster: str, family: Optional[str], limit: int
+) -> List[Dict[str, Any]]:
+    """Recently stopped tasks of `cluster`. ECS only keeps them for about an hour."""
+    import boto3
+
+    ecs = boto3.client("ecs")
+    arguments = {"cluster": cluster, "desiredStatus": "STOPPED"}
+    if family:
+        arguments["family"] = family
+    task_arns = []
+    for page in ecs.get_paginator("list_tasks").paginate(**arguments):
+        task_arns.extend(page["taskArns"])
+    task_arns = task_arns[:limit]
+
+    tasks = []
+    for start in range(0, len(task_arns), 100):
+        tasks.extend(
+            ecs.describe_tasks(cluster=cluster, tasks=task_arns[start : start + 100])[
+                "tasks"
+            ]
+        )
+    return tasks
+
+
+def summarize(tasks: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    by_phase: Dict[str, List[float]] = {}
+    for task in tasks:
+        for phase, duration in phase_durations(task).items():
+            by_phase.setdefault(phase, []).append(duration)
+    return {
+        phase: {
+            "tasks": len(durations),
+            "p50": _percentile(durations, 50),
+            "p95": _percentile(durations, 95),
+        }
+        for phase, durations in by_phase.items()
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "inputs", nargs="*", help="`label=describe-tasks.json`, or just the file"
+    )
+    parser.add_argument("--cluster", help="Fetch stopped tasks of this cluster instead")
+    parser.add_argument(
+        "--family", help="Only fetch tasks of this task definition family"
+    )
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--label", default="fetched", help="Label of the fetched tasks")
+    parser.add_argument(
+        "--save", type=Path, help="Save the fetched tasks to compare later"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    labelled: List[Tuple[str, List[Dict[str, Any]]]] = []
+    for value in args.inputs:
+        label, _, path = value.rpartition("=")
+        labelled.append((label or Path(path).stem, read_tasks(Path(path))))
+    if args.cluster:
+        tasks = fetch_tasks(args.cluster, args.family, args.limit)
+        if args.save:
+            args.save.write_text(json.dumps({"tasks": tasks}, default=str, indent=2))
+        labelled.append((args.label, tasks))
+    if not labelled:
+        parser.error("pass describe-tasks files or --cluster")
+
+    results = {label: summarize(tasks) for label, tasks in labelled}
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+
+    baseline_label = labelled[0][0]
+    print(f"{'':<14}" + "".join(f"{label:>24}" for label, _ in labelled))
+    for phase, _, _ in PHASES:
+        row = f"{phase:<14}"
+        for label, _ in labelled:
+            summary = results[label].get(phase)
+            if summary is None:
+                row += f"{'-':>24}"
+                continue
+            cell = f"{summary['p50']:.1f}s/{summary['p95']:.1f}s"
+            baseline = results[baseline_label].get(phase)
+            if label != baseline_label and baseline:
+                cell += f" ({summary['p50'] - baseline['p50']:+.1f}s)"
+            row += f"{cell:>24}"
+        print(row)
+    print("p50/p95 per phase, with the change of the p50 against " + baseline_label)
+    return 0
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    """Seconds since the epoch from the CLI's ISO strings or epoch numbers."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace("Z", "+00:00")
+    # `default=str` writes boto3 datetimes with a space instead of a `T`
+    parsed = datetime.fromisoformat(text.replace(" ", "T", 1))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    rank = max(math.ceil(percentile / 100 * len(ordered)), 1)
+    return round(ordered[rank - 1], 3)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
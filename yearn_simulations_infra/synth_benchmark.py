@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Measure how synth grows with the number of scheduled scripts.
+
+Generates brownie style workspaces with 10, 100 and 500 scheduled scripts
+(`--sizes`) and runs `app.py` against each in its own process, the way
+`cdk synth` does. For every size it records the wall time and peak RSS of the
+synth, and the construct count, resource count and template bytes of each
+stack.
+
+Lookups are answered from `cdk.context.json` only, see `lookup_cache.py`. A
+synth needing a lookup that isn't cached fails instead of reaching out to
+AWS, so the benchmark runs offline.
+
+Results are written as JSON with `--output`. Given `--baseline`, an earlier
+results file, it exits with 1 when a size got slower, bigger or more
+memory hungry than the tolerances allow.
+
+Usage:
+
+    python yearn_simulations_infra/synth_benchmark.py --output synth-benchmark.json
+    python yearn_simulations_infra/synth_benchmark.py --baseline synth-benchmark.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from lookup_cache import ROOT_DIR, missing_lookups, synth_environment
+
+DEFAULT_SIZES = (10, 100, 500)
+
+# Relative growth over the baseline tolerated per measure. Wall time and
+# memory vary between machines and runs, the synthesized output doesn't.
+DEFAULT_TOLERANCES = {
+    "wall_seconds": 0.5,
+    "peak_rss_mb": 0.2,
+    "constructs": 0.0,
+    "resources": 0.0,
+    "template_bytes": 0.01,
+}
+
+SCHEDULER_SOURCE = """\
+class ScheduledScript:
+    def __init__(
+        self, script, telegram_chat_id, environment=None, secrets=None, **kwargs
+    ):
+        self.script = script
+        self.telegram_chat_id = telegram_chat_id
+        self.environment = environment
+        self.secrets = secrets or []
+        self.options = kwargs
+
+
+class ScheduleScriptsStorage:
+    def __init__(self):
+        self.scheduled_scripts = []
+
+
+schedule_scripts_storage = ScheduleScriptsStorage()
+
+
+def schedule_script(telegram_chat_id, **kwargs):
+    def decorator(func):
+        schedule_scripts_storage.scheduled_scripts.append(
+            ScheduledScript(func, telegram_chat_id, **kwargs)
+        )
+        return func
+
+    return decorator
+"""
+
+
+def write_workspace(path: Path, scripts: int, seed: int = 0) -> None:
+    """
+    A workspace with `scripts` scheduled scripts, mixing the schedules, sizes
+    and options real scripts use.
+    """
+    rng = random.Random(seed)
+    scripts_path = path / "scripts"
+    scripts_path.mkdir(parents=True, exist_ok=True)
+    (path / "scheduler.py").write_text(SCHEDULER_SOURCE)
+    (path / "requirements.txt").write_text("eth-brownie\n")
+    for index in range(scripts):
+        options = {
+            "telegram_chat_id": f"-100{index % 7}",
+            "minute": str(rng.randrange(60)),
+            "hour": rng.choice(["*", "*/2", "*/4", str(rng.randrange(24))]),
+        }
+        if rng.random() < 0.2:
+            options.update(
+                rng.choice([{"cpu": 256, "memory": 512}, {"cpu": 2048, "memory": 8192}])
+            )
+        if rng.random() < 0.1:
+            options["run_mode"] = "service"
+        if rng.random() < 0.2:
+            options["stagger_window"] = rng.choice([5, 10, 15])
+        if rng.random() < 0.1:
+            options["timeout"] = rng.choice([600, 1800, 3600])
+        if rng.random() < 0.2:
+            options["environment"] = {"VAULT_GROUP": f"group_{index % 5}"}
+        if rng.random() < 0.1:
+            options["secrets"] = [f"extra_key_{index % 3}"]
+        arguments = ", ".join(f"{name}={value!r}" for name, value in options.items())
+        (scripts_path / f"script_{index}.py").write_text(
+            "from scheduler import schedule_script\n\n\n"
+            f"@schedule_script({arguments})\n"
+            "def main():\n"
+            "    pass\n"
+        )
+
+
+def run_synth(environment: Dict[str, str], log_path: Path) -> Tuple[float, float]:
+    """
+    Run `app.py`, returning its wall time and the peak RSS of the process tree
+    in MB.
+    """
+    with log_path.open("wb") as log:
+        started_at = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, str(ROOT_DIR / "app.py")],
+            cwd=ROOT_DIR,
+            env=environment,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_seconds = time.perf_counter() - started_at
+    # `os.waitstatus_to_exitcode` is only there from Python 3.9
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"Synth failed with {process.returncode}:\n{log_path.read_text()[-4000:]}"
+        )
+    # KiB on Linux, covering the jsii runtime once it has been reaped
+    return wall_seconds, usage.ru_maxrss / 1024
+
+
+def measure_stacks(outdir: Path) -> Dict[str, Dict[str, int]]:
+    """Constructs, resources and template bytes of every stack in a cloud assembly."""
+    missing = missing_lookups(outdir)
+    if missing:
+        keys = ", ".join(lookup["key"] for lookup in missing)
+        raise RuntimeError(
+            f"Synth needed lookups missing from cdk.context.json: {keys}"
+        )
+
+    manifest = json.loads((outdir / "manifest.json").read_text())
+
+    stacks = {}
+    for artifact in manifest["artifacts"].values():
+        if artifact["type"] != "aws:cloudformation:stack":
+            continue
+        template_path = outdir / artifact["properties"]["templateFile"]
+        template = json.loads(template_path.read_text())
+        stacks[artifact["displayName"]] = {
+            "constructs": 0,
+            "resources": len(template.get("Resources", {})),
+            "template_bytes": template_path.stat().st_size,
+        }
+
+    # Constructs belong to the closest stack above them
+    tree = json.loads((outdir / "tree.json").read_text())["tree"]
+    pending = [(tree, None)]
+    while pending:
+        node, stack = pending.pop()
+        path = node.get("path", "")
+        if path in stacks:
+            stack = path
+        elif stack is not None:
+            stacks[stack]["constructs"] += 1
+        pending.extend((child, stack) for child in node.get("children", {}).values())
+    return stacks
+
+
+def benchmark(
+    sizes: List[int], context: Dict[str, Any], seed: int = 0
+) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            workspace, outdir = (
+                Path(directory) / "workspace",
+                Path(directory) / "cdk.out",
+            )
+            write_workspace(workspace, size, seed)
+            wall_seconds, peak_rss_mb = run_synth(
+                synth_environment(workspace, outdir, context),
+                Path(directory) / "synth.log",
+            )
+            stacks = measure_stacks(outdir)
+        results[str(size)] = {
+            "wall_seconds": round(wall_seconds, 2),
+            "peak_rss_mb": round(peak_rss_mb, 1),
+            "constructs": sum(stack["constructs"] for stack in stacks.values()),
+            "resources": sum(stack["resources"] for stack in stacks.values()),
+            "template_bytes": sum(stack["template_bytes"] for stack in stacks.values()),
+            "stacks": stacks,
+        }
+    return results
+
+
+def regressions(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerances: Dict[str, float],
+) -> List[str]:
+    found = []
+    for size, result in results.items():
+        if size not in baseline:
+            continue
+        for measure, tolerance in tolerances.items():
+            was, now = baseline[size][measure], result[measure]
+            if now > was * (1 + tolerance):
+                found.append(
+                    f"{size} scripts: {measure} went from {was} to {now} "
+                    f"({now / was - 1:+.1%}, {tolerance:.0%} tolerated)"
+                )
+    return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in DEFAULT_SIZES),
+        help="Comma separated script counts",
+    )
+    parser.add_argument(
+        "-c",
+        "--context",
+        action="append",
+        default=[],
+        help="key=value synth context, e.g. -c taskMetrics=true",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the results to this file")
+    parser.add_argument("--baseline", type=Path, help="Results to compare against")
+    for measure, tolerance in DEFAULT_TOLERANCES.items():
+        parser.add_argument(
+            f"--{measure.replace('_', '-')}-tolerance",
+            dest=measure,
+            type=float,
+            default=tolerance,
+        )
+    args = parser.parse_args(argv)
+
+    context = dict(definition.split("=", 1) for definition in args.context)
+    results = benchmark(
+        [int(size) for size in args.sizes.split(",")], context, args.seed
+    )
+    document = {"context": context, "seed": args.seed, "sizes": results}
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+
+    for size, result in results.items():
+        print(
+            f"{size:>4} scripts: {result['wall_seconds']}s, "
+            f"peak RSS {result['peak_rss_mb']} MB, {result['constructs']} constructs, "
+            f"{result['resources']} resources, {result['template_bytes'] // 1024} KiB "
+            f"of templates in {len(result['stacks'])} stacks"
+        )
+
+    if not args.baseline:
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("context", {}) != context:
+        print(
+            "The baseline was synthesized with other context: "
+            f"{baseline.get('context')}"
+        )
+        return 1
+    found = regressions(
+        results,
+        baseline["sizes"],
+        {measure: getattr(args, measure) for measure in DEFAULT_TOLERANCES},
+    )
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Lambda starting scheduled tasks in place of their events rules, so runs of a
+schedule don't overlap.
+
+Rules send it a launch:
+
+    {"schedule": "...", "overlap": "skip", "lease_seconds": 7200, "run_task": {...}}
+
+where `run_task` holds the arguments of `ecs.run_task`. The launcher takes
+the schedule's lease before starting the task, and releases it on the task's
+stopped event. While an earlier run holds the lease, `overlap` decides what
+happens to the new one:
+
+    skip     it doesn't run
+    queue    it runs once the earlier run stops
+    preempt  the earlier run is stopped and the new one runs
+
+Launches with `"capacity": "spot"` run on Fargate Spot. When Spot takes the
+capacity back, the launcher starts the task again on FARGATE under the same
+lease, as long as the launch's deadline hasn't passed. The deadline is
+`deadline_seconds` after the rule fired (`fired_at`), the lease's duration by
+default.
+
+Launches of jobs depending on other jobs, see `job_graph.py`, come from the
+stopped events of their upstream tasks and carry `after`:
+
+    {"completed": "<startedBy of the stopped task>", "requires": ["lease-...", ...]}
+
+A launch requiring more than one upstream only goes ahead once its fan-in
+gate opens.
+
+Lease latencies and what became of each launch, including Spot
+interruptions and their retries, are written as CloudWatch embedded metric
+format logs, per schedule.
+"""
+
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from job_graph import DynamoGateStore, FanInGate, InMemoryGateStore, gate_id
+from run_leases import (
+    DEFAULT_LEASE_SECONDS,
+    PREEMPT,
+    QUEUE,
+    SKIP,
+    DynamoLeaseStore,
+    Lease,
+    lease_id,
+)
+
+METRICS_NAMESPACE = "YearnScheduledTasks"
+
+# The Lambda doesn't ship `fargate_profiles.py`, which names the capacities
+SPOT = "spot"
+# Stop code of tasks whose Fargate Spot capacity was taken back
+SPOT_INTERRUPTION = "SpotInterruption"
+ON_DEMAND_STRATEGY = [{"capacityProvider": "FARGATE", "weight": 1}]
+
+
+class Launcher:
+    def __init__(
+        self,
+        store: Any,
+        ecs: Any,
+        clock: Callable[[], float] = time.time,
+        emit: Callable[[str], None] = print,
+        gates: Optional[FanInGate] = None,
+    ) -> None:
+        self._store = store
+        self._ecs = ecs
+        self._gates = gates or FanInGate(InMemoryGateStore())
+        self._clock = clock
+        self._emit = emit
+
+    def launch(self, launch: Dict[str, Any]) -> Optional[str]:
+        """Start the launch's task if its policy allows, returning the task ARN."""
+        schedule = launch["schedule"]
+        policy = launch.get("overlap", SKIP)
+        now = self._clock()
+        if "after" in launch:
+            after = launch["after"]
+            if len(after["requires"]) > 1 and not self._gates.open(
+                gate_id(schedule), after["completed"], after["requires"], now
+            ):
+                self._emit_metrics(schedule, {"UpstreamsPending": (1, "Count")})
+                return None
+            # A queued launch has passed its gate already
+            launch = {name: value for name, value in launch.items() if name != "after"}
+        lease_seconds = int(launch.get("lease_seconds", DEFAULT_LEASE_SECONDS))
+        if "deadline_at" not in launch:
+            # Queued launches keep the deadline of when they were due
+            launch = {
+                **launch,
+                "deadline_at": self._deadline_at(launch, lease_seconds, now),
+            }
+        lease = Lease(
+            lease_id=lease_id(schedule),
+            schedule=schedule,
+            owner=str(uuid.uuid4()),
+            expires_at=now + lease_seconds,
+            launch=launch if launch.get("capacity") == SPOT else None,
+        )
+
+        acquired = self._store.acquire(lease, now)
+        metrics = {
+            "LeaseAcquireLatency": (self._milliseconds_since(now), "Milliseconds")
+        }
+        if not acquired and policy == QUEUE:
+            if self._store.queue(lease.lease_id, launch):
+                self._emit_metrics(schedule, {**metrics, "RunsQueued": (1, "Count")})
+                return None
+            # The earlier run stopped meanwhile
+            acquired = self._store.acquire(lease, self._clock())
+        if not acquired and policy == PREEMPT:
+            previous = self._store.take_over(lease)
+            if previous and previous.task_arn:
+                self._ecs.stop_task(
+                    cluster=launch["run_task"]["cluster"],
+                    task=previous.task_arn,
+                    reason=f"Preempted by a new run of {schedule}",
+                )
+            metrics["RunsPreempted"] = (1, "Count")
+            acquired = True
+        if not acquired:
+            self._emit_metrics(schedule, {**metrics, "RunsSkipped": (1, "Count")})
+            return None
+
+        response = self._ecs.run_task(
+            **launch["run_task"], startedBy=lease.lease_id, count=1
+        )
+        if response.get("failures") or not response.get("tasks"):
+            self._store.release(lease.lease_id, lease.owner)
+            self._emit_metrics(schedule, {**metrics, "RunsFailedToStart": (1, "Count")})
+            raise RuntimeError(
+                f"Could not start a run of {schedule}: {response.get('failures')}"
+            )
+        task_arn = response["tasks"][0]["taskArn"]
+        self._store.set_task(lease.lease_id, lease.owner, task_arn)
+        self._emit_metrics(schedule, {**metrics, "RunsStarted": (1, "Count")})
+        return task_arn
+
+    def task_stopped(self, event: Dict[str, Any]) -> Optional[str]:
+        """
+        Release the lease of a stopped task, and start the launch queued
+        behind it if there is one.
+        """
+        detail = event["detail"]
+        if detail.get("stopCode") == SPOT_INTERRUPTION:
+            task_arn = self._retry_on_demand(detail)
+            if task_arn:
+                return task_arn
+        started_at = self._clock()
+        released = self._store.release(detail["startedBy"], detail["taskArn"])
+        # Preempted tasks, or ones whose lease expired, hold nothing anymore
+        if released is None:
+            return None
+        self._emit_metrics(
+            released.schedule,
+            {
+                "LeaseReleaseLatency": (
+                    self._milliseconds_since(started_at),
+                    "Milliseconds",
+                )
+            },
+        )
+        if released.queued:
+            return self.launch(released.queued)
+        return None
+
+    def _retry_on_demand(self, detail: Dict[str, Any]) -> Optional[str]:
+        """
+        Start an interrupted Spot task again on FARGATE under its lease, unless
+        its deadline passed. Returns the new task's ARN.
+        """
+        lease = self._store.get(detail["startedBy"])
+        if lease is None or lease.task_arn != detail["taskArn"] or not lease.launch:
+            return None
+        metrics = {"SpotInterruptions": (1, "Count")}
+        if self._clock() >= lease.launch["deadline_at"]:
+            self._emit_metrics(
+                lease.schedule, {**metrics, "SpotRetriesPastDeadline": (1, "Count")}
+            )
+            return None
+
+        run_task = {
+            name: value
+            for name, value in lease.launch["run_task"].items()
+            if name not in ("capacityProviderStrategy", "launchType")
+        }
+        response = self._ecs.run_task(
+            **run_task,
+            capacityProviderStrategy=ON_DEMAND_STRATEGY,
+            startedBy=lease.lease_id,
+            count=1,
+        )
+        if response.get("failures") or not response.get("tasks"):
+            self._emit_metrics(
+                lease.schedule, {**metrics, "SpotRetriesFailedToStart": (1, "Count")}
+            )
+            return None
+        task_arn = response["tasks"][0]["taskArn"]
+        # The lease moves from the interrupted task to the new one, unless a
+        # new run preempted it meanwhile
+        if not self._store.set_task(lease.lease_id, detail["taskArn"], task_arn):
+            self._ecs.stop_task(
+                cluster=run_task["cluster"],
+                task=task_arn,
+                reason=f"{lease.schedule} was preempted while retrying on FARGATE",
+            )
+            self._emit_metrics(lease.schedule, metrics)
+            return None
+        self._emit_metrics(lease.schedule, {**metrics, "SpotRetries": (1, "Count")})
+        return task_arn
+
+    @staticmethod
+    def _deadline_at(launch: Dict[str, Any], lease_seconds: int, now: float) -> float:
+        fired_at = now
+        if launch.get("fired_at"):
+            fired_at = datetime.fromisoformat(
+                launch["fired_at"].replace("Z", "+00:00")
+            ).timestamp()
+        return fired_at + int(launch.get("deadline_seconds") or lease_seconds)
+
+    def _milliseconds_since(self, started_at: float) -> float:
+        return round((self._clock() - started_at) * 1000, 3)
+
+    def _emit_metrics(
+        self, schedule: str, metrics: Dict[str, Tuple[float, str]]
+    ) -> None:
+        self._emit(
+            json.dumps(
+                {
+                    "_aws": {
+                        "Timestamp": int(self._clock() * 1000),
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": METRICS_NAMESPACE,
+                                "Dimensions": [["Schedule"]],
+                                "Metrics": [
+                                    {"Name": name, "Unit": unit}
+                                    for name, (_, unit) in metrics.items()
+                                ],
+                            }
+                        ],
+                    },
+                    "Schedule": schedule,
+                    **{name: value for name, (value, _) in metrics.items()},
+                }
+            )
+        )
+
+
+_launcher: Optional[Launcher] = None
+
+
+def handler(event: Dict[str, Any], context: Any) -> Optional[str]:
+    global _launcher
+    if _launcher is None:
+        import boto3
+
+        dynamodb = boto3.client("dynamodb")
+        _launcher = Launcher(
+            DynamoLeaseStore(os.environ["LEASE_TABLE"], dynamodb),
+            boto3.client("ecs"),
+            gates=FanInGate(DynamoGateStore(os.environ["LEASE_TABLE"], dynamodb)),
+        )
+    if event.get("detail-type") == "ECS Task State Change":
+        return _launcher.task_stopped(event)
+    return _launcher.launch(event)
@@ -0,0 +1,219 @@
+from typing import Any, Dict, List, Optional
+
+import aws_cdk.aws_dynamodb as dynamodb
+import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_ecs as ecs
+import aws_cdk.aws_events as events
+import aws_cdk.aws_events_targets as events_targets
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_lambda as lambda_
+from aws_cdk import core as cdk
+
+from container_image import RUNTIME_DIR
+from fargate_profiles import CAPACITIES, CAPACITY_PROVIDERS, ON_DEMAND
+from run_leases import DEFAULT_LEASE_SECONDS, OVERLAP_POLICIES, SKIP, lease_id
+
+# Modules of this package the launcher Lambda runs
+LAUNCHER_MODULES = ("job_graph.py", "run_leases.py", "task_launcher.py")
+
+
+class TaskLauncherStack(cdk.Stack):
+    """
+    Lambda starting scheduled tasks under a lease per schedule, so a slow run
+    doesn't overlap the next one. See `task_launcher.py`.
+    """
+
+    def __init__(self, scope: cdk.Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self._leases = dynamodb.Table(
+            self,
+            "RunLeases",
+            partition_key=dynamodb.Attribute(
+                name="lease_id", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+
+        self._function = lambda_.Function(
+            self,
+            "TaskLauncher",
+            runtime=lambda_.Runtime.PYTHON_3_9,
+            handler="task_launcher.handler",
+            code=lambda_.Code.from_asset(
+                str(RUNTIME_DIR),
+                exclude=["*", *(f"!{module}" for module in LAUNCHER_MODULES)],
+            ),
+            environment={"LEASE_TABLE": self._leases.table_name},
+            timeout=cdk.Duration.seconds(30),
+        )
+        self._leases.grant_read_write_data(self._function)
+
+        # Releases the lease of every task the launcher started
+        events.Rule(
+            self,
+            "LeasedTaskStopped",
+            event_pattern=events.EventPattern(
+                source=["aws.ecs"],
+                detail_type=["ECS Task State Change"],
+                detail={
+                    "lastStatus": ["STOPPED"],
+                    "startedBy": [{"prefix": "lease-"}],
+                },
+            ),
+            targets=[events_targets.LambdaFunction(self._function)],
+        )
+
+    def target(
+        self,
+        schedule: str,
+        cluster: ecs.ICluster,
+        task_definition: ecs.TaskDefinition,
+        container_overrides: List[Dict[str, Any]],
+        overlap: str = SKIP,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        capacity: str = ON_DEMAND,
+        deadline_seconds: Optional[int] = None,
+        after: Optional[List[str]] = None,
+    ) -> events_targets.LambdaFunction:
+        """
+        Rule target launching `task_definition` through the launcher. Spot
+        runs interrupted before `deadline_seconds` after the rule fired are
+        retried on FARGATE. Targets of a `completion_rule` pass the schedules
+        of that rule as `after`, the launch waits for all of them.
+        """
+        if overlap not in OVERLAP_POLICIES:
+            raise ValueError(
+                f"`{schedule}` asks for overlap={overlap}, expected one of "
+                f"{', '.join(OVERLAP_POLICIES)}."
+            )
+        if capacity not in CAPACITIES:
+            raise ValueError(
+                f"`{schedule}` asks for capacity={capacity}, expected one of "
+                f"{', '.join(CAPACITIES)}."
+            )
+        launch: Dict[str, Any] = {}
+        placement: Dict[str, Any] = {"launchType": "FARGATE"}
+        if capacity != ON_DEMAND:
+            launch = {
+                "capacity": capacity,
+                "deadline_seconds": deadline_seconds or lease_seconds,
+                "fired_at": events.EventField.time,
+            }
+            placement = {
+                "capacityProviderStrategy": [
+                    {"capacityProvider": CAPACITY_PROVIDERS[capacity], "weight": 1}
+                ]
+            }
+        if after:
+            launch["after"] = {
+                "completed": events.EventField.from_path("$.detail.startedBy"),
+                "requires": [lease_id(upstream) for upstream in after],
+            }
+        return events_targets.LambdaFunction(
+            self._function,
+            event=events.RuleTargetInput.from_object(
+                {
+                    "schedule": schedule,
+                    "overlap": overlap,
+                    "lease_seconds": lease_seconds,
+                    **launch,
+                    "run_task": {
+                        "cluster": cluster.cluster_arn,
+                        "taskDefinition": task_definition.task_definition_arn,
+                        **placement,
+                        "platformVersion": "LATEST",
+                        "networkConfiguration": {
+                            "awsvpcConfiguration": {
+                                "subnets": cluster.vpc.select_subnets(
+                                    subnet_type=ec2.SubnetType.PUBLIC
+                                ).subnet_ids,
+                                "securityGroups": [
+                                    self._security_group(
+                                        cluster, task_definition
+                                    ).security_group_id
+                                ],
+                                "assignPublicIp": "ENABLED",
+                            }
+                        },
+                        "overrides": {"containerOverrides": container_overrides},
+                    },
+                }
+            ),
+        )
+
+    @staticmethod
+    def completion_rule(
+        scope: cdk.Construct,
+        construct_id: str,
+        cluster: ecs.ICluster,
+        schedules: List[str],
+    ) -> events.Rule:
+        """
+        Rule matching the runs of `schedules` the launcher started, once they
+        completed successfully.
+        """
+        return events.Rule(
+            scope,
+            construct_id,
+            event_pattern=events.EventPattern(
+                source=["aws.ecs"],
+                detail_type=["ECS Task State Change"],
+                detail={
+                    "clusterArn": [cluster.cluster_arn],
+                    "lastStatus": ["STOPPED"],
+                    "startedBy": [lease_id(schedule) for schedule in schedules],
+                    # Rather than stopped, preempted or taken back by Spot
+                    "stopCode": ["EssentialContainerExited"],
+                    "containers": {"exitCode": [0]},
+                },
+            ),
+        )
+
+    def grant_launch(
+        self, cluster: ecs.ICluster, task_definition: ecs.TaskDefinition
+    ) -> None:
+        """
+        Let the launcher start and stop tasks of `task_definition`. The policy
+        lives with the task definition, whose stack already depends on this one.
+        """
+        statements = [
+            iam.PolicyStatement(
+                actions=["ecs:RunTask"],
+                resources=[task_definition.task_definition_arn],
+                conditions={"ArnEquals": {"ecs:cluster": cluster.cluster_arn}},
+            ),
+            iam.PolicyStatement(
+                actions=["ecs:StopTask"],
+                resources=["*"],
+                conditions={"ArnEquals": {"ecs:cluster": cluster.cluster_arn}},
+            ),
+            iam.PolicyStatement(
+                actions=["iam:PassRole"],
+                resources=[
+                    task_definition.task_role.role_arn,
+                    task_definition.obtain_execution_role().role_arn,
+                ],
+            ),
+        ]
+        iam.Policy(
+            task_definition,
+            "TaskLauncherPolicy",
+            roles=[self._function.role],
+            statements=statements,
+        )
+
+    @staticmethod
+    def _security_group(
+        cluster: ecs.ICluster, task_definition: ecs.TaskDefinition
+    ) -> ec2.ISecurityGroup:
+        # Same one an `EcsTask` target would create for the task definition
+        security_group: Optional[ec2.ISecurityGroup] = (
+            task_definition.node.try_find_child("SecurityGroup")
+        )
+        if security_group is None:
+            security_group = ec2.SecurityGroup(
+                task_definition, "SecurityGroup", vpc=cluster.vpc
+            )
+        return security_group
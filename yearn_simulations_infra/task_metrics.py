@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Timing metrics of the tasks, per script, in CloudWatch embedded metric format.
+
+What ECS knows is read from the task's stopped event by the Lambda
+`handler`: the image pull, the secret fetch (from the end of the pull until
+the container started, which the secrets take most of), the runtime and the
+exit code. What only the container knows is measured by running its command
+through this module:
+
+    python3 /usr/src/infra/task_metrics.py -- /usr/src/app/run.sh <script>
+
+It reports how long loading the brownie project took, how long after that
+the first RPC call came back, and the peak memory and average CPU units of
+the command. Both end up
+in the `YearnTasks` namespace with the script name as the `script_name`
+dimension. Lambda logs are turned into metrics as they are, the container's
+lines go through the metric filters of `TaskMetricsStack`.
+
+Only uses the standard library so it can be copied into the task image next
+to the yearn-simulations project.
+"""
+
+import argparse
+import importlib.abc
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+METRICS_NAMESPACE = "YearnTasks"
+SCRIPT_DIMENSION = "script_name"
+# Marks the lines of this module, which the metric filters match on
+EVENT = "task_metrics"
+
+# (metric, from timestamp, to timestamp) of the stopped event
+STOPPED_TASK_PHASES = (
+    ("Provisioning", "createdAt", "pullStartedAt"),
+    ("ImagePull", "pullStartedAt", "pullStoppedAt"),
+    ("SecretFetch", "pullStoppedAt", "startedAt"),
+    ("Runtime", "startedAt", "executionStoppedAt"),
+)
+# Metrics the container reports, with their unit
+CONTAINER_METRICS = {
+    "ProjectLoad": "Seconds",
+    "FirstRpc": "Seconds",
+    "PeakMemory": "Megabytes",
+    "CpuUtilized": "None",
+    "Runtime": "Seconds",
+    "ExitCode": "None",
+}
+
+# Runs the hooks in every Python process the command starts
+SITECUSTOMIZE = "import task_metrics\ntask_metrics.install_hooks()\n"
+
+
+def metrics_document(
+    script_name: str, metrics: Dict[str, Tuple[float, str]], timestamp: float
+) -> Dict[str, Any]:
+    return {
+        "_aws": {
+            "Timestamp": int(timestamp * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [[SCRIPT_DIMENSION]],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit}
+                        for name, (_, unit) in metrics.items()
+                    ],
+                }
+            ],
+        },
+        "event": EVENT,
+        SCRIPT_DIMENSION: script_name,
+        **{name: value for name, (value, _) in metrics.items()},
+    }
+
+
+def emit_metrics(script_name: str, metrics: Dict[str, Tuple[float, str]]) -> None:
+    print(json.dumps(metrics_document(script_name, metrics, time.time())), flush=True)
+
+
+def stopped_task_metrics(detail: Dict[str, Any]) -> Dict[str, Tuple[float, str]]:
+    """Phases and exit code of an `ECS Task State Change` event of a stopped task."""
+    metrics = {}
+    for name, start, end in STOPPED_TASK_PHASES:
+        if detail.get(start) and detail.get(end):
+            seconds = (_parse(detail[end]) - _parse(detail[start])).total_seconds()
+            metrics[name] = (round(seconds, 3), "Seconds")
+    exit_code = (detail.get("containers") or [{}])[0].get("exitCode")
+    if exit_code is not None:
+        metrics["ExitCode"] = (exit_code, "None")
+    return metrics
+
+
+def script_name_of(detail: Dict[str, Any], default: str) -> str:
+    """Scheduled tasks tell their script apart with `SCRIPT_NAME` in their overrides."""
+    for override in detail.get("overrides", {}).get("containerOverrides", []):
+        for variable in override.get("environment", []):
+            if variable["name"] == "SCRIPT_NAME":
+                return variable["value"]
+    return default
+
+
+def handler(event: Dict[str, Any], context: Any) -> None:
+    """
+    Lambda target of the stopped task rules, with
+    `{"script_name": ..., "detail": ...}`.
+    """
+    detail = event["detail"]
+    metrics = stopped_task_metrics(detail)
+    if metrics:
+        emit_metrics(script_name_of(detail, event["script_name"]), metrics)
+
+
+class _PostImportHooks(importlib.abc.MetaPathFinder):
+    """Call a hook with a module once it has been imported."""
+
+    def __init__(self, hooks: Dict[str, Callable[[Any], None]]) -> None:
+        self._hooks = hooks
+
+    def find_spec(self, name, path, target=None):
+        if name not in self._hooks:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None and spec.loader is not None:
+                break
+        else:
+            return None
+
+        hook = self._hooks.pop(name)
+        exec_module = spec.loader.exec_module
+
+        def exec_and_hook(module):
+            exec_module(module)
+            hook(module)
+
+        spec.loader.exec_module = exec_and_hook
+        return spec
+
+
+def install_hooks() -> None:
+    """Mark when the brownie project is loaded and the first RPC call returns."""
+    if not os.environ.get("TASK_METRICS_MARKERS"):
+        return
+
+    def hook_project(module) -> None:
+        load = module.load
+
+        def timed_load(*args, **kwargs):
+            loaded = load(*args, **kwargs)
+            _mark("project_loaded")
+            return loaded
+
+        module.load = timed_load
+
+    def hook_rpc(module) -> None:
+        make_request = module.HTTPProvider.make_request
+
+        def timed_make_request(self, *args, **kwargs):
+            response = make_request(self, *args, **kwargs)
+            _mark("first_rpc")
+            return response
+
+        module.HTTPProvider.make_request = timed_make_request
+
+    sys.meta_path.insert(
+        0,
+        _PostImportHooks(
+            {"brownie.project.main": hook_project, "web3.providers.rpc": hook_rpc}
+        ),
+    )
+
+
+_marked = set()
+
+
+def _mark(marker: str) -> None:
+    if marker in _marked:
+        return
+    _marked.add(marker)
+    with open(os.environ["TASK_METRICS_MARKERS"], "a") as markers:
+        markers.write(json.dumps({"marker": marker, "at": time.time()}) + "\n")
+
+
+def run(command: List[str], script_name: str) -> int:
+    """Run `command` with the hooks installed, report on it and return its exit code."""
+    started_at = time.time()
+    with tempfile.TemporaryDirectory() as hooks_path:
+        markers_path = Path(hooks_path) / "markers.jsonl"
+        (Path(hooks_path) / "sitecustomize.py").write_text(SITECUSTOMIZE)
+        environment = {
+            **os.environ,
+            "TASK_METRICS": "1",
+            "TASK_METRICS_MARKERS": str(markers_path),
+            "PYTHONPATH": os.pathsep.join(
+                path
+                for path in (
+                    hooks_path,
+                    str(Path(__file__).resolve().parent),
+                    os.environ.get("PYTHONPATH"),
+                )
+                if path
+            ),
+        }
+        process = subprocess.Popen(command, env=environment)
+        # ECS stops the task with a SIGTERM, which the command has to see
+        signal.signal(signal.SIGTERM, lambda signum, frame: process.send_signal(signum))
+        exit_code = process.wait()
+
+        marked_at = {}
+        if markers_path.exists():
+            for line in markers_path.read_text().splitlines():
+                marker = json.loads(line)
+                marked_at.setdefault(marker["marker"], marker["at"])
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    runtime = max(time.time() - started_at, 0.001)
+    metrics = {
+        # Of the largest process the command ran, in KiB on Linux
+        "PeakMemory": (round(usage.ru_maxrss / 1024, 1), "Megabytes"),
+        # In CPU units like Container Insights, 1024 per vCPU
+        "CpuUtilized": (
+            round((usage.ru_utime + usage.ru_stime) / runtime * 1024, 1),
+            "None",
+        ),
+    }
+    if "project_loaded" in marked_at:
+        metrics["ProjectLoad"] = (
+            round(marked_at["project_loaded"] - started_at, 3),
+            "Seconds",
+        )
+    if "first_rpc" in marked_at:
+        metrics["FirstRpc"] = (
+            round(
+                marked_at["first_rpc"] - marked_at.get("project_loaded", started_at), 3
+            ),
+            "Seconds",
+        )
+    emit_metrics(script_name, metrics)
+    return exit_code
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run a command and report its metrics."
+    )
+    parser.add_argument(
+        "--script-name",
+        default=os.environ.get("SCRIPT_NAME", "unknown"),
+        help="Defaults to $SCRIPT_NAME",
+    )
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("pass the command to run after --")
+    return run(command, args.script_name)
+
+
+def _parse(timestamp: str) -> datetime:
+    text = timestamp.replace("Z", "+00:00")
+    # ECS writes milliseconds, `fromisoformat` only reads 3 or 6 digits
+    seconds, dot, rest = text.partition(".")
+    if dot:
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        text = f"{seconds}.{rest[:digits][:6].ljust(6, '0')}{rest[digits:]}"
+    return datetime.fromisoformat(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
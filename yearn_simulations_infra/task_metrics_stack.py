@@ -0,0 +1,215 @@
+from typing import List, Optional
+
+import aws_cdk.aws_cloudwatch as cloudwatch
+import aws_cdk.aws_ecs as ecs
+import aws_cdk.aws_events as events
+import aws_cdk.aws_events_targets as events_targets
+import aws_cdk.aws_lambda as lambda_
+import aws_cdk.aws_logs as logs
+from aws_cdk import core as cdk
+
+from container_image import RUNTIME_DIR
+from task_metrics import CONTAINER_METRICS, EVENT, METRICS_NAMESPACE, SCRIPT_DIMENSION
+from yearn_scheduled_task import INFRA_RUNTIME_PATH
+
+# Threshold of the p95 runtime alarm of scripts without a `timeout`
+DEFAULT_RUNTIME_ALARM = cdk.Duration.minutes(30)
+COLD_START_METRICS = (
+    "Provisioning",
+    "ImagePull",
+    "SecretFetch",
+    "ProjectLoad",
+    "FirstRpc",
+)
+
+
+class TaskMetricsStack(cdk.Stack):
+    """
+    Timing metrics of every task per script, see `task_metrics.py`, with a
+    dashboard of every script. The p95 runtime alarm of a script goes in the
+    stack of its task, which is sized for it.
+    """
+
+    def __init__(
+        self,
+        scope: cdk.Construct,
+        construct_id: str,
+        log_group: logs.LogGroup,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self._function = lambda_.Function(
+            self,
+            "StoppedTaskMetrics",
+            runtime=lambda_.Runtime.PYTHON_3_9,
+            handler="task_metrics.handler",
+            code=lambda_.Code.from_asset(
+                str(RUNTIME_DIR), exclude=["*", "!task_metrics.py"]
+            ),
+            timeout=cdk.Duration.seconds(10),
+        )
+
+        # The containers log to the shared log group, where their metric lines
+        # aren't picked up as embedded metrics on their own
+        for metric_name, unit in CONTAINER_METRICS.items():
+            metric_filter = logs.CfnMetricFilter(
+                self,
+                f"{metric_name}MetricFilter",
+                log_group_name=log_group.log_group_name,
+                filter_pattern=(
+                    f'{{ ($.event = "{EVENT}") && '
+                    f"(($.{metric_name} >= 0) || ($.{metric_name} < 0)) }}"
+                ),
+                metric_transformations=[
+                    logs.CfnMetricFilter.MetricTransformationProperty(
+                        metric_namespace=METRICS_NAMESPACE,
+                        metric_name=metric_name,
+                        metric_value=f"$.{metric_name}",
+                    )
+                ],
+            )
+            # This version of the CDK doesn't know about the unit and
+            # dimensions of metric filters yet
+            metric_filter.add_property_override("MetricTransformations.0.Unit", unit)
+            metric_filter.add_property_override(
+                "MetricTransformations.0.Dimensions",
+                [{"Key": SCRIPT_DIMENSION, "Value": f"$.{SCRIPT_DIMENSION}"}],
+            )
+
+        # A line per script from search expressions, so the dashboard doesn't
+        # grow with the scripts past CloudWatch's 500 widgets
+        dashboard = cloudwatch.Dashboard(
+            self, "TaskMetricsDashboard", dashboard_name="YearnTasks"
+        )
+        dashboard.add_widgets(
+            self._search_widget("Runtime (p95)", "Runtime", "p95"),
+            self._search_widget("Runtime (p50)", "Runtime", "p50"),
+            self._search_widget("Peak memory", "PeakMemory", "Maximum"),
+            self._search_widget("CPU units", "CpuUtilized", "Average"),
+        )
+        dashboard.add_widgets(
+            *(
+                self._search_widget(f"{name} (p50)", name, "p50", width=8)
+                for name in COLD_START_METRICS
+            ),
+            self._search_widget("Exit code", "ExitCode", "Maximum", width=8),
+        )
+
+    def watch(
+        self,
+        scope: cdk.Construct,
+        cluster: ecs.ICluster,
+        task_definitions: List[ecs.TaskDefinition],
+        script_name: str = "unknown",
+    ) -> None:
+        """
+        Report the stopped tasks of `task_definitions`, as `script_name`
+        unless they pass their own `SCRIPT_NAME`. The cluster is shared, so
+        the rule has to tell the tasks apart by their task definition.
+        """
+        events.Rule(
+            scope,
+            "StoppedTaskMetrics",
+            event_pattern=events.EventPattern(
+                source=["aws.ecs"],
+                detail_type=["ECS Task State Change"],
+                detail={
+                    "clusterArn": [cluster.cluster_arn],
+                    "lastStatus": ["STOPPED"],
+                    "taskDefinitionArn": [
+                        {"prefix": _family_arn(task_definition)}
+                        for task_definition in task_definitions
+                    ],
+                },
+            ),
+            targets=[
+                events_targets.LambdaFunction(
+                    self._function,
+                    event=events.RuleTargetInput.from_object(
+                        {
+                            "script_name": script_name,
+                            "detail": events.EventField.from_path("$.detail"),
+                        }
+                    ),
+                )
+            ],
+        )
+
+    def monitor(
+        self,
+        scope: cdk.Construct,
+        script_name: str,
+        runtime_alarm: Optional[cdk.Duration] = None,
+    ) -> cloudwatch.Alarm:
+        """Add a p95 runtime alarm for `script_name` to `scope`."""
+        runtime_alarm = runtime_alarm or DEFAULT_RUNTIME_ALARM
+        return cloudwatch.Alarm(
+            scope,
+            f"{script_name}RuntimeP95Alarm",
+            alarm_description=(
+                f"p95 runtime of {script_name} over a day is above "
+                f"{runtime_alarm.to_human_string()}"
+            ),
+            metric=self.metric(script_name, "Runtime").with_(
+                statistic="p95", period=cdk.Duration.days(1)
+            ),
+            threshold=runtime_alarm.to_seconds(),
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+            evaluation_periods=1,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+
+    @staticmethod
+    def metric(
+        script_name: str, metric_name: str, statistic: str = "Average"
+    ) -> cloudwatch.Metric:
+        return cloudwatch.Metric(
+            namespace=METRICS_NAMESPACE,
+            metric_name=metric_name,
+            dimensions={SCRIPT_DIMENSION: script_name},
+            statistic=statistic,
+            period=cdk.Duration.hours(1),
+        )
+
+    @staticmethod
+    def _search_widget(
+        title: str, metric_name: str, statistic: str, width: int = 6
+    ) -> cloudwatch.GraphWidget:
+        """`metric_name` of every script, labelled with the script."""
+        return cloudwatch.GraphWidget(
+            title=title,
+            left=[
+                cloudwatch.MathExpression(
+                    expression=(
+                        f"SEARCH('{{{METRICS_NAMESPACE},{SCRIPT_DIMENSION}}} "
+                        f"MetricName=\"{metric_name}\"', '{statistic}', 3600)"
+                    ),
+                    using_metrics={},
+                    label=f"${{PROP('Dim.{SCRIPT_DIMENSION}')}}",
+                    period=cdk.Duration.hours(1),
+                )
+            ],
+            width=width,
+        )
+
+    @staticmethod
+    def wrap(command: List[str], script_name: Optional[str] = None) -> List[str]:
+        """`command` run under `task_metrics.py`, as `$SCRIPT_NAME` by default."""
+        options = ["--script-name", script_name] if script_name else []
+        return [
+            "python3",
+            f"{INFRA_RUNTIME_PATH}/task_metrics.py",
+            *options,
+            "--",
+            *command,
+        ]
+
+
+def _family_arn(task_definition: ecs.TaskDefinition) -> str:
+    """Start of the ARN of every revision of `task_definition`."""
+    return cdk.Stack.of(task_definition).format_arn(
+        service="ecs",
+        resource="task-definition",
+        resource_name=f"{task_definition.family}:",
+    )
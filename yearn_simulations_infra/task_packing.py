@@ -0,0 +1,161 @@
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+# CloudFormation refuses templates with more than 500 resources or a body
+# larger than 1 MB. Stay clear of both so a shard can still grow a little
+# between two plans.
+MAX_STACK_RESOURCES = 450
+MAX_STACK_TEMPLATE_BYTES = 800 * 1024
+
+# Before they were packed, every script had a `ScheduledTask<script>` stack
+LEGACY_STACK_PREFIX = "ScheduledTask"
+
+
+class PackingItem:
+    """
+    Something placed in a stack. Items with the same `group` share resources
+    that are only created once per stack, sized by the `group_*` arguments.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        resource_count: int,
+        template_bytes: int,
+        group: Optional[str] = None,
+        group_resource_count: int = 0,
+        group_template_bytes: int = 0,
+    ) -> None:
+        self.name = name
+        self.resource_count = resource_count
+        self.template_bytes = template_bytes
+        self.group = group
+        self.group_resource_count = group_resource_count
+        self.group_template_bytes = group_template_bytes
+
+
+class StackShard:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.items: List[PackingItem] = []
+
+    @property
+    def resource_count(self) -> int:
+        return _resource_count(self.items)
+
+    @property
+    def template_bytes(self) -> int:
+        return _template_bytes(self.items)
+
+    def fits(
+        self, item: PackingItem, max_resources: int, max_template_bytes: int
+    ) -> bool:
+        items = self.items + [item]
+        return (
+            _resource_count(items) <= max_resources
+            and _template_bytes(items) <= max_template_bytes
+        )
+
+
+def plan_shards(
+    items: List[PackingItem],
+    shard_count: int,
+    max_resources: int = MAX_STACK_RESOURCES,
+    max_template_bytes: int = MAX_STACK_TEMPLATE_BYTES,
+) -> List[StackShard]:
+    """
+    Spread `items` over `shard_count` stacks without going over the resource
+    and template size budgets.
+
+    Every item ranks the shards by a hash of its own name and goes to the
+    highest ranked shard that still has room (rendezvous hashing). An item's
+    preferred shard doesn't depend on the other items, so adding or removing
+    one script leaves the others where they were unless a shard fills up.
+    """
+    if shard_count < 1:
+        raise ValueError("At least one stack is needed to hold the scheduled tasks.")
+
+    shards = [StackShard(index) for index in range(shard_count)]
+    # Place items in name order so the plan doesn't depend on discovery order
+    for item in sorted(items, key=lambda item: item.name):
+        for shard in sorted(shards, key=lambda shard: _rank(item.name, shard.index)):
+            if shard.fits(item, max_resources, max_template_bytes):
+                shard.items.append(item)
+                break
+        else:
+            raise ValueError(
+                f"Can not fit `{item.name}` in {shard_count} stacks of at most "
+                f"{max_resources} resources and {max_template_bytes} template bytes. "
+                "Increase the number of scheduled task stacks."
+            )
+
+    return shards
+
+
+def oversized_stacks(assembly: Any) -> List[str]:
+    """
+    A warning for every stack of a synthesized cloud assembly over the
+    resource or template size budget, which the plans only estimate.
+    """
+    warnings = []
+    for stack in assembly.stacks:
+        resource_count = len(stack.template.get("Resources", {}))
+        template_bytes = os.path.getsize(stack.template_full_path)
+        if (
+            resource_count > MAX_STACK_RESOURCES
+            or template_bytes > MAX_STACK_TEMPLATE_BYTES
+        ):
+            warnings.append(
+                f"{stack.display_name} has {resource_count} resources and a "
+                f"{template_bytes // 1024} KiB template, over the budget of "
+                f"{MAX_STACK_RESOURCES} resources and "
+                f"{MAX_STACK_TEMPLATE_BYTES // 1024} KiB."
+            )
+    return warnings
+
+
+def legacy_stack_names(
+    parent_path: List[str], script_names: List[str]
+) -> Dict[str, str]:
+    """
+    CloudFormation names of the `ScheduledTask<script>` stacks of the scripts
+    from before they were packed, keyed by their path under `parent_path`.
+    They are named like the CDK names a stack within another stack: the path
+    without its non-alphanumeric characters, followed by a hash of the path.
+    """
+    names = {}
+    for script_name in script_names:
+        components = [*parent_path, f"{LEGACY_STACK_PREFIX}{script_name}"]
+        human = []
+        for component in components:
+            # The CDK skips a component the previous one ends with
+            if not human or not human[-1].endswith(component):
+                human.append(component)
+        digest = hashlib.md5("/".join(components).encode()).hexdigest()[:8].upper()
+        names["/".join(components)] = (
+            re.sub(r"[^A-Za-z0-9]", "", "".join(human))[:240] + digest
+        )
+    return names
+
+
+def _groups(items: List[PackingItem]) -> List[PackingItem]:
+    # One representative item for every group present
+    return list({item.group: item for item in items if item.group}.values())
+
+
+def _resource_count(items: List[PackingItem]) -> int:
+    return sum(item.resource_count for item in items) + sum(
+        item.group_resource_count for item in _groups(items)
+    )
+
+
+def _template_bytes(items: List[PackingItem]) -> int:
+    return sum(item.template_bytes for item in items) + sum(
+        item.group_template_bytes for item in _groups(items)
+    )
+
+
+def _rank(name: str, index: int) -> str:
+    return hashlib.sha256(f"{name}:{index}".encode()).hexdigest()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Scaling of the simulator workers on their queue backlog, and a local
+stand-in for the queue to try it out.
+
+The simulator stack deploys the step scaling policy described by
+`WorkQueueScaling`, and `simulate` replays requests through the same policy
+against `LocalWorkQueue`, so changes to the policy can be tried here first:
+
+    python yearn_simulations_infra/work_queue.py \
+        --burst 40@0 --burst 20@600 --processing 120
+"""
+
+import argparse
+import itertools
+import math
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class ScalingStep:
+    """Change the worker count by `change` while the metric is in `[lower, upper)`."""
+
+    def __init__(
+        self, change: int, lower: Optional[float] = None, upper: Optional[float] = None
+    ) -> None:
+        self.change = change
+        self.lower = lower
+        self.upper = upper
+
+
+class WorkQueueScaling:
+    """
+    Backlog per worker is the number of queued and in-flight requests over
+    the running workers. Workers are added once it reaches
+    `target_backlog`, more of them the further past it, and removed one at a
+    time once it drops to `scale_in_below`, half the target by default.
+    Without any worker every request counts as a whole target, so the first
+    request starts one.
+    """
+
+    def __init__(
+        self,
+        min_workers: int = 1,
+        max_workers: int = 10,
+        target_backlog: int = 5,
+        cooldown: int = 60,
+        scale_in_below: Optional[float] = None,
+    ) -> None:
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_backlog = target_backlog
+        self.cooldown = cooldown
+        # Removing a worker from below half the target leaves the others
+        # below the target, so scaling in doesn't bring a scale out right back
+        self.scale_in_below = (
+            scale_in_below if scale_in_below is not None else target_backlog / 2
+        )
+
+    def validate(self) -> None:
+        # The simulator bot's poller is the only producer of requests, so
+        # without a running worker nothing would be queued to scale out on
+        if not 1 <= self.min_workers <= self.max_workers:
+            raise ValueError(
+                "The simulator bot queues its own requests and needs "
+                "1 <= min <= max workers, got "
+                f"simulatorMinWorkers={self.min_workers} "
+                f"simulatorMaxWorkers={self.max_workers}."
+            )
+        if self.target_backlog < 1:
+            raise ValueError(
+                "The target backlog per simulator worker must be at least 1, "
+                f"got {self.target_backlog}."
+            )
+        if not 0 < self.scale_in_below < self.target_backlog:
+            raise ValueError(
+                "Simulator workers must be removed below the target backlog, got "
+                f"scale_in_below={self.scale_in_below} target={self.target_backlog}."
+            )
+
+    @property
+    def steps(self) -> List[ScalingStep]:
+        target = self.target_backlog
+        return [
+            ScalingStep(-1, lower=0, upper=self.scale_in_below),
+            ScalingStep(+1, lower=target, upper=2 * target),
+            ScalingStep(+2, lower=2 * target, upper=4 * target),
+            ScalingStep(+4, lower=4 * target),
+        ]
+
+    def backlog_per_worker(self, visible: int, in_flight: int, workers: int) -> float:
+        backlog = visible + in_flight
+        if workers > 0:
+            return backlog / workers
+        return backlog * self.target_backlog
+
+    def adjustment(self, backlog_per_worker: float) -> int:
+        scale_in, *scale_out = self.steps
+        # The scale in alarm fires at or below its threshold, like CloudWatch's
+        # LessThanOrEqualToThreshold
+        if backlog_per_worker <= scale_in.upper:
+            return scale_in.change
+        for step in scale_out:
+            if backlog_per_worker >= step.lower and (
+                step.upper is None or backlog_per_worker < step.upper
+            ):
+                return step.change
+        return 0
+
+    def next_workers(self, workers: int, visible: int, in_flight: int) -> int:
+        change = self.adjustment(self.backlog_per_worker(visible, in_flight, workers))
+        return min(max(workers + change, self.min_workers), self.max_workers)
+
+
+class Message:
+    def __init__(self, message_id: str, body: str, sent_at: float) -> None:
+        self.message_id = message_id
+        self.body = body
+        self.sent_at = sent_at
+        self.visible_at = sent_at
+        self.receive_count = 0
+
+
+class LocalWorkQueue:
+    """In-memory stand-in for the SQS queue, with visibility timeouts."""
+
+    def __init__(
+        self,
+        visibility_timeout: float = 900,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.visibility_timeout = visibility_timeout
+        self._clock = clock
+        self._messages: Dict[str, Message] = {}
+        self._ids = itertools.count()
+
+    def send(self, body: str) -> Message:
+        message = Message(str(next(self._ids)), body, self._clock())
+        self._messages[message.message_id] = message
+        return message
+
+    def receive(self) -> Optional[Message]:
+        now = self._clock()
+        for message in self._messages.values():
+            if message.visible_at <= now:
+                message.visible_at = now + self.visibility_timeout
+                message.receive_count += 1
+                return message
+        return None
+
+    def delete(self, message: Message) -> None:
+        self._messages.pop(message.message_id, None)
+
+    @property
+    def visible(self) -> int:
+        now = self._clock()
+        return sum(message.visible_at <= now for message in self._messages.values())
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._messages) - self.visible
+
+
+class _Worker:
+    def __init__(self, ready_at: float) -> None:
+        self.ready_at = ready_at
+        self.message: Optional[Message] = None
+        self.done_at = 0.0
+
+
+def simulate(
+    arrivals: Dict[int, int],
+    scaling: WorkQueueScaling,
+    processing_seconds: float = 120,
+    duration: int = 3600,
+    worker_start_seconds: float = 60,
+    evaluation_seconds: int = 60,
+    visibility_timeout: float = 900,
+) -> Dict[str, object]:
+    """
+    Replay `arrivals` (requests sent at each second) through the queue and
+    the scaling policy, one second at a time.
+    """
+    now = 0.0
+    queue = LocalWorkQueue(visibility_timeout, clock=lambda: now)
+    workers = [_Worker(0.0) for _ in range(scaling.min_workers)]
+    last_scaled_at = -math.inf
+    timeline = []
+    waits = []
+    worker_seconds = 0
+
+    for second in range(duration):
+        now = float(second)
+        for _ in range(arrivals.get(second, 0)):
+            queue.send(f"simulation-{second}")
+
+        for worker in workers:
+            if worker.message and worker.done_at <= now:
+                waits.append(now - worker.message.sent_at)
+                queue.delete(worker.message)
+                worker.message = None
+            if worker.message is None and worker.ready_at <= now:
+                worker.message = queue.receive()
+                worker.done_at = now + processing_seconds
+        worker_seconds += len(workers)
+
+        if second % evaluation_seconds == 0:
+            running = sum(worker.ready_at <= now for worker in workers)
+            visible, in_flight = queue.visible, queue.in_flight
+            metric = scaling.backlog_per_worker(visible, in_flight, running)
+            desired = len(workers)
+            if now - last_scaled_at >= scaling.cooldown:
+                desired = scaling.next_workers(len(workers), visible, in_flight)
+            if desired != len(workers):
+                last_scaled_at = now
+            while len(workers) < desired:
+                workers.append(_Worker(now + worker_start_seconds))
+            # Stopped workers drop what they were doing, it comes back once
+            # its visibility timeout runs out
+            del workers[desired:]
+            timeline.append(
+                {
+                    "second": second,
+                    "visible": visible,
+                    "in_flight": in_flight,
+                    "backlog_per_worker": round(metric, 2),
+                    "workers": len(workers),
+                }
+            )
+
+    waits.sort()
+    return {
+        "timeline": timeline,
+        "completed": len(waits),
+        "pending": queue.visible + queue.in_flight,
+        "wait_p50": waits[len(waits) // 2] if waits else None,
+        "wait_max": waits[-1] if waits else None,
+        "worker_minutes": round(worker_seconds / 60, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Simulate the simulator worker scaling."
+    )
+    parser.add_argument(
+        "--burst",
+        action="append",
+        default=[],
+        help="COUNT@SECOND requests sent at once, can be repeated",
+    )
+    parser.add_argument("--steady", type=float, default=0, help="Requests per minute")
+    parser.add_argument(
+        "--processing", type=float, default=120, help="Seconds per request"
+    )
+    parser.add_argument("--duration", type=int, default=3600)
+    parser.add_argument(
+        "--worker-start", type=float, default=60, help="Seconds to start a worker"
+    )
+    parser.add_argument("--min-workers", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, default=10)
+    parser.add_argument("--target-backlog", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    arrivals: Dict[int, int] = {}
+    for burst in args.burst:
+        count, _, second = burst.partition("@")
+        arrivals[int(second or 0)] = arrivals.get(int(second or 0), 0) + int(count)
+    if args.steady:
+        interval = 60 / args.steady
+        for index in range(int(args.duration / interval)):
+            second = int(index * interval)
+            arrivals[second] = arrivals.get(second, 0) + 1
+
+    scaling = WorkQueueScaling(args.min_workers, args.max_workers, args.target_backlog)
+    scaling.validate()
+    result = simulate(
+        arrivals,
+        scaling,
+        processing_seconds=args.processing,
+        duration=args.duration,
+        worker_start_seconds=args.worker_start,
+    )
+
+    print(
+        f"{'second':>6} {'visible':>8} {'in flight':>9} {'per worker':>10} "
+        f"{'workers':>7}"
+    )
+    for point in result["timeline"]:
+        print(
+            f"{point['second']:>6} {point['visible']:>8} {point['in_flight']:>9} "
+            f"{point['backlog_per_worker']:>10} {point['workers']:>7}"
+        )
+    print(
+        f"{result['completed']} completed, {result['pending']} pending, wait p50 "
+        f"{result['wait_p50']}s max {result['wait_max']}s, "
+        f"{result['worker_minutes']} worker minutes"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,293 @@
-import aws_cdk.aws_ecr as ecr
+import hashlib
+import json
+
 import aws_cdk.aws_logs as logs
 from aws_cdk import core as cdk
 import aws_cdk.aws_ecs as ecs
 import aws_cdk.aws_ec2 as ec2
-import aws_cdk.aws_ecs_patterns as ecs_patterns
+import aws_cdk.aws_events as events
+import aws_cdk.aws_events_targets as events_targets
 import aws_cdk.aws_applicationautoscaling as app_autoscaling
-import aws_cdk.aws_secretsmanager as secrets
-from typing import Dict
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from fargate_profiles import ON_DEMAND, FargateProfile, apply_capacity
+from run_leases import DEFAULT_LEASE_SECONDS, SKIP
+from task_packing import PackingItem
+
+if TYPE_CHECKING:
+    from cache_volume_stack import CacheVolumeStack
+    from simulation_cache_stack import SimulationCacheStack
+    from task_launcher_stack import TaskLauncherStack
+    from task_metrics_stack import TaskMetricsStack
+
+SCHEDULED_TASK_CONTAINER_NAME = "ScheduledTaskContainer"
+
+# ECS refuses container overrides over 8 KiB when starting a task, which
+# limits how many scripts fit in the environment of one batch
+MAX_BATCH_SIZE = 25
+
+# A stack reporting task metrics also holds the rule watching its tasks, with
+# its permission to invoke the metrics Lambda
+METRICS_RESOURCE_COUNT = 2
+METRICS_TEMPLATE_BYTES = 4 * 1024
+
+# Where the task image keeps the runtime modules of this package, such as
+# `batch_runner.py`
+INFRA_RUNTIME_PATH = "/usr/src/infra"
+
+# Log streams are named after the profile, so every run logs the script it
+# runs first to find a script's runs by
+RUN_START_LINE = "[run] started"
+
+
+def log_run_start(command: List[str]) -> List[str]:
+    """`command` after logging `RUN_START_LINE` with the task's `$SCRIPT_NAME`."""
+    return [
+        "sh",
+        "-c",
+        f'echo "{RUN_START_LINE} $SCRIPT_NAME" && exec "$@"',
+        "sh",
+        *command,
+    ]
+
+
+class ScheduledTask:
+    # What a script adds to its stack, measured on synthesized templates: its
+    # events rule, and the rule's permission to invoke the task launcher
+    RESOURCE_COUNT = 1
+    TEMPLATE_BYTES = 2 * 1024
+    LAUNCHED_RESOURCE_COUNT = 2
+    LAUNCHED_TEMPLATE_BYTES = 3 * 1024
+    # Scripts with the same profile share a task definition with its task and
+    # execution roles, the execution role's policy, the events role and its
+    # policy and a security group. The task launcher's policy replaces the
+    # events role and policy, and the grants of the cache volume and the
+    # simulation cache add a task role policy and grow the task definition.
+    PROFILE_RESOURCE_COUNT = 7
+    PROFILE_TEMPLATE_BYTES = 10 * 1024
+    LAUNCHED_PROFILE_RESOURCE_COUNT = 6
+    GRANTS_RESOURCE_COUNT = 1
+    GRANTS_TEMPLATE_BYTES = 4 * 1024
+    # The p95 runtime alarm of a task whose metrics are reported
+    MONITORED_RESOURCE_COUNT = 1
+    MONITORED_TEMPLATE_BYTES = 1024
+
+    def __init__(
+        self,
+        script_name: str,
+        environment: Dict[str, str],
+        secrets: Dict[str, ecs.Secret],
+        schedule: Optional[app_autoscaling.Schedule],
+        profile: Optional[FargateProfile] = None,
+        overlap: str = SKIP,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        capacity: str = ON_DEMAND,
+        deadline_seconds: Optional[int] = None,
+        after: Optional[List[str]] = None,
+        pipelined: bool = False,
+        timeout_seconds: Optional[int] = None,
+    ) -> None:
+        self.script_name = script_name
+        self.environment = environment
+        self.secrets = secrets
+        self.schedule = schedule
+        self.profile = profile or FargateProfile()
+        # What the task launcher does when a run is due while the previous
+        # one is still going, see `task_launcher.py`
+        self.overlap = overlap
+        self.lease_seconds = lease_seconds
+        # Spot runs are retried on FARGATE when interrupted up to
+        # `deadline_seconds` after they were due, the lease's duration by default
+        self.capacity = capacity
+        self.deadline_seconds = deadline_seconds or lease_seconds
+        # Schedules of the launches whose completion starts the task, in
+        # place of `schedule`. Tasks in a job graph keep their own lease, so
+        # they aren't batched. See `job_graph.py`.
+        self.after = after or []
+        self.pipelined = pipelined
+        # Threshold of the p95 runtime alarm with task metrics
+        self.timeout_seconds = timeout_seconds
+
+    @property
+    def profile_name(self) -> str:
+        """
+        Tasks only differing in their command and environment can run from the
+        same task definition. Secrets can't be overridden when a task is started,
+        so they are part of the profile.
+        """
+        secrets_digest = hashlib.sha256(
+            ",".join(sorted(self.secrets)).encode()
+        ).hexdigest()[:8]
+        return f"{self.profile.name}Secrets{secrets_digest}"
+
+    @property
+    def command(self) -> List[str]:
+        return ["/usr/src/app/run.sh", self.script_name]
+
+    def container_environment(
+        self, shared_environment: Dict[str, str]
+    ) -> Dict[str, str]:
+        """
+        Environment passed when the task is started, on top of
+        `shared_environment`.
+        """
+        # Log streams are named after the profile, so the script name is also
+        # passed in the environment to tell runs apart, see `log_run_start`.
+        return {
+            "SCRIPT_NAME": self.script_name,
+            **{
+                name: value
+                for name, value in self.environment.items()
+                if name not in shared_environment
+            },
+        }
+
+    def packing_item(
+        self, launched: bool = False, granted: bool = False, monitored: bool = False
+    ) -> PackingItem:
+        """
+        Size of the task in its stack, when the task launcher starts it
+        (`launched`), the cache volume or the simulation cache are granted
+        to its profile (`granted`) and its runtime has an alarm (`monitored`).
+        """
+        group_resource_count = (
+            self.LAUNCHED_PROFILE_RESOURCE_COUNT
+            if launched
+            else self.PROFILE_RESOURCE_COUNT
+        )
+        group_template_bytes = self.PROFILE_TEMPLATE_BYTES + 400 * len(self.secrets)
+        if granted:
+            group_resource_count += self.GRANTS_RESOURCE_COUNT
+            group_template_bytes += self.GRANTS_TEMPLATE_BYTES
+        resource_count = (
+            self.LAUNCHED_RESOURCE_COUNT if launched else self.RESOURCE_COUNT
+        )
+        template_bytes = (
+            self.LAUNCHED_TEMPLATE_BYTES if launched else self.TEMPLATE_BYTES
+        ) + 80 * len(self.environment)
+        if monitored:
+            resource_count += self.MONITORED_RESOURCE_COUNT
+            template_bytes += self.MONITORED_TEMPLATE_BYTES
+        return PackingItem(
+            self.script_name,
+            resource_count=resource_count,
+            template_bytes=template_bytes,
+            group=self.profile_name,
+            group_resource_count=group_resource_count,
+            group_template_bytes=group_template_bytes,
+        )
+
+
+class ScheduledBatch(ScheduledTask):
+    """
+    Scheduled tasks sharing a schedule and a profile, started as one task
+    that runs all of their scripts through `batch_runner.py`.
+    """
+
+    def __init__(
+        self, scheduled_tasks: List[ScheduledTask], workers: int, index: int = 0
+    ) -> None:
+        first = scheduled_tasks[0]
+        # Named after what the batch shares rather than its scripts, so it stays
+        # in the same stack as scripts join or leave it. Spot batches are told
+        # apart from the on demand batch of the same schedule and profile.
+        shared = f"{first.schedule.expression_string}:{first.profile_name}"
+        if first.capacity != ON_DEMAND:
+            shared += f":{first.capacity}"
+        batch_digest = hashlib.sha256(shared.encode()).hexdigest()[:8]
+        super().__init__(
+            script_name=f"Batch{batch_digest}{index or ''}",
+            environment={
+                name: value
+                for name, value in first.environment.items()
+                if all(task.environment.get(name) == value for task in scheduled_tasks)
+            },
+            secrets=first.secrets,
+            schedule=first.schedule,
+            profile=first.profile,
+            overlap=first.overlap,
+            lease_seconds=max(task.lease_seconds for task in scheduled_tasks),
+            capacity=first.capacity,
+            deadline_seconds=min(task.deadline_seconds for task in scheduled_tasks),
+            # The batch reports its runtime as a whole
+            timeout_seconds=max(
+                (
+                    task.timeout_seconds
+                    for task in scheduled_tasks
+                    if task.timeout_seconds
+                ),
+                default=None,
+            ),
+        )
+        self.scheduled_tasks = scheduled_tasks
+        self.workers = workers
+
+    @property
+    def command(self) -> List[str]:
+        return ["python3", f"{INFRA_RUNTIME_PATH}/batch_runner.py"]
+
+    def container_environment(
+        self, shared_environment: Dict[str, str]
+    ) -> Dict[str, str]:
+        return {
+            **super().container_environment(shared_environment),
+            "BATCH_WORKERS": str(self.workers),
+            "BATCH_JOBS": json.dumps(
+                [
+                    {
+                        "script": task.script_name,
+                        "environment": {
+                            name: value
+                            for name, value in task.environment.items()
+                            if name not in self.environment
+                        },
+                    }
+                    for task in self.scheduled_tasks
+                ]
+            ),
+        }
+
+    def packing_item(
+        self, launched: bool = False, granted: bool = False, monitored: bool = False
+    ) -> PackingItem:
+        item = super().packing_item(launched, granted, monitored)
+        item.template_bytes += sum(
+            120 + 80 * len(task.environment) for task in self.scheduled_tasks
+        )
+        return item
+
+
+def batch_scheduled_tasks(
+    scheduled_tasks: List[ScheduledTask],
+    workers: int,
+    max_batch_size: int = MAX_BATCH_SIZE,
+) -> List[ScheduledTask]:
+    """
+    Replace tasks sharing a schedule, a profile, an overlap policy and a
+    capacity with batches of them.
+    """
+    groups: Dict[str, List[ScheduledTask]] = {}
+    for scheduled_task in scheduled_tasks:
+        if scheduled_task.pipelined:
+            groups[scheduled_task.script_name] = [scheduled_task]
+            continue
+        key = (
+            f"{scheduled_task.schedule.expression_string}:{scheduled_task.profile_name}"
+            f":{scheduled_task.overlap}:{scheduled_task.capacity}"
+        )
+        groups.setdefault(key, []).append(scheduled_task)
+
+    batched = []
+    for group in groups.values():
+        if len(group) == 1:
+            batched.extend(group)
+            continue
+        group = sorted(group, key=lambda task: task.script_name)
+        for index, start in enumerate(range(0, len(group), max_batch_size)):
+            batched.append(
+                ScheduledBatch(group[start : start + max_batch_size], workers, index)
+            )
+    return batched
 
 
 class YearnScheduledTaskStack(cdk.Stack):
@@ -14,37 +295,136 @@ class YearnScheduledTaskStack(cdk.Stack):
         self,
         scope: cdk.Construct,
         construct_id: str,
-        script_name: str,
-        environment: Dict[str, str],
-        secrets: Dict[str, secrets.Secret],
-        schedule: app_autoscaling.Schedule,
+        scheduled_tasks: List[ScheduledTask],
         log_group: logs.LogGroup,
-        container_repo: ecr.Repository,
-        cluster: ecs.Cluster,
-        cpu=1024,
-        memory_limit=2048,
-        **kwargs
+        container_image: Callable[[str], ecs.ContainerImage],
+        cluster: ecs.ICluster,
+        cache_volume: Optional["CacheVolumeStack"] = None,
+        task_launcher: Optional["TaskLauncherStack"] = None,
+        task_metrics: Optional["TaskMetricsStack"] = None,
+        simulation_cache: Optional["SimulationCacheStack"] = None,
+        **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
-        task_name = f"{script_name}Task"
-        ecs_patterns.ScheduledFargateTask(
-            self,
-            task_name,
-            cluster=cluster,
-            scheduled_fargate_task_image_options=ecs_patterns.ScheduledFargateTaskImageOptions(
-                image=ecs.ContainerImage.from_ecr_repository(container_repo, "latest"),
-                log_driver=ecs.AwsLogDriver(
+
+        tasks_by_profile: Dict[str, List[ScheduledTask]] = {}
+        for scheduled_task in scheduled_tasks:
+            tasks_by_profile.setdefault(scheduled_task.profile_name, []).append(
+                scheduled_task
+            )
+
+        task_definitions = []
+        for profile_name, profile_tasks in tasks_by_profile.items():
+            # Environment shared by every task of the profile goes in the task
+            # definition, the rest is passed when the task is started.
+            shared_environment = {
+                name: value
+                for name, value in profile_tasks[0].environment.items()
+                if all(task.environment.get(name) == value for task in profile_tasks)
+            }
+
+            task_definition = profile_tasks[0].profile.create_task_definition(
+                self, f"{profile_name}TaskDefinition"
+            )
+            container = task_definition.add_container(
+                SCHEDULED_TASK_CONTAINER_NAME,
+                image=container_image(profile_tasks[0].profile.architecture),
+                logging=ecs.AwsLogDriver(
                     log_group=log_group,
-                    stream_prefix=task_name,
+                    stream_prefix=f"{profile_name}Task",
                     mode=ecs.AwsLogDriverMode.NON_BLOCKING,
                 ),
-                environment=environment,
-                secrets=secrets,
-                command=["/usr/src/app/run.sh", script_name],
-                cpu=cpu,
-                memory_limit_mib=memory_limit,
-            ),
-            schedule=schedule,
-            platform_version=ecs.FargatePlatformVersion.LATEST,
-            subnet_selection=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
-        )
+                environment=shared_environment,
+                secrets=profile_tasks[0].secrets,
+            )
+            task_definitions.append(task_definition)
+            if cache_volume:
+                cache_volume.mount(task_definition, container)
+            if task_launcher:
+                task_launcher.grant_launch(cluster, task_definition)
+            if simulation_cache:
+                simulation_cache.grant(task_definition)
+
+            for scheduled_task in profile_tasks:
+                environment = scheduled_task.container_environment(shared_environment)
+                command = scheduled_task.command
+                if cache_volume:
+                    command = cache_volume.wrap(command)
+                if task_metrics:
+                    command = task_metrics.wrap(command)
+                command = log_run_start(command)
+                if task_launcher:
+                    target = task_launcher.target(
+                        scheduled_task.script_name,
+                        cluster,
+                        task_definition,
+                        container_overrides=[
+                            {
+                                "name": SCHEDULED_TASK_CONTAINER_NAME,
+                                "command": command,
+                                "environment": [
+                                    {"name": name, "value": value}
+                                    for name, value in environment.items()
+                                ],
+                            }
+                        ],
+                        overlap=scheduled_task.overlap,
+                        lease_seconds=scheduled_task.lease_seconds,
+                        capacity=scheduled_task.capacity,
+                        deadline_seconds=scheduled_task.deadline_seconds,
+                        after=scheduled_task.after,
+                    )
+                else:
+                    target = events_targets.EcsTask(
+                        cluster=cluster,
+                        task_definition=task_definition,
+                        container_overrides=[
+                            events_targets.ContainerOverride(
+                                container_name=SCHEDULED_TASK_CONTAINER_NAME,
+                                command=command,
+                                environment=[
+                                    events_targets.TaskEnvironmentVariable(
+                                        name=name, value=value
+                                    )
+                                    for name, value in environment.items()
+                                ],
+                            )
+                        ],
+                        platform_version=ecs.FargatePlatformVersion.LATEST,
+                        subnet_selection=ec2.SubnetSelection(
+                            subnet_type=ec2.SubnetType.PUBLIC
+                        ),
+                    )
+                if scheduled_task.after:
+                    rule = task_launcher.completion_rule(
+                        self,
+                        f"{scheduled_task.script_name}AfterUpstream",
+                        cluster,
+                        scheduled_task.after,
+                    )
+                    rule.add_target(target)
+                    continue
+                rule = events.Rule(
+                    self,
+                    f"{scheduled_task.script_name}Schedule",
+                    schedule=events.Schedule.expression(
+                        scheduled_task.schedule.expression_string
+                    ),
+                    targets=[target],
+                )
+                if not task_launcher:
+                    apply_capacity(rule, scheduled_task.capacity)
+
+        # Each task passes its script as `SCRIPT_NAME`
+        if task_metrics and task_definitions:
+            task_metrics.watch(self, cluster, task_definitions)
+            for scheduled_task in scheduled_tasks:
+                task_metrics.monitor(
+                    self,
+                    scheduled_task.script_name,
+                    runtime_alarm=(
+                        cdk.Duration.seconds(scheduled_task.timeout_seconds)
+                        if scheduled_task.timeout_seconds
+                        else None
+                    ),
+                )
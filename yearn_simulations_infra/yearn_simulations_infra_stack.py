@@ -1,17 +1,145 @@
+import hashlib
 import json
-from typing import Any
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
 
 import aws_cdk.aws_applicationautoscaling as app_autoscaling
+import aws_cdk.aws_cloudwatch as cloudwatch
 import aws_cdk.aws_ec2 as ec2
 import aws_cdk.aws_ecr as ecr
+import aws_cdk.aws_ecr_assets as ecr_assets
 import aws_cdk.aws_ecs as ecs
 import aws_cdk.aws_ecs_patterns as ecs_patterns
+import aws_cdk.aws_events as events
+import aws_cdk.aws_events_targets as events_targets
 import aws_cdk.aws_logs as logs
 import aws_cdk.aws_secretsmanager as secrets
+import aws_cdk.aws_servicediscovery as servicediscovery
+import aws_cdk.aws_sqs as sqs
 from aws_cdk import core as cdk
 
 
-from yearn_scheduled_task import YearnScheduledTaskStack
+from arch_benchmark import BENCHMARK_CONTAINER_NAME, BENCHMARK_FAMILIES
+from cache_volume_stack import CacheVolumeStack
+from container_image import IMAGE_PLATFORMS
+from cron import CronSchedule
+from deploy_planner import LEGACY_STACKS_METADATA
+from fargate_profiles import (
+    CAPACITIES,
+    ON_DEMAND,
+    SPOT,
+    X86_64,
+    FargateProfile,
+    InvalidFargateProfile,
+    apply_architecture,
+    apply_capacity,
+)
+from harvest_shards import (
+    HARVEST_BOT_JOB,
+    rule_shards,
+    shard_environment,
+    shard_schedules,
+)
+from job_graph import JobGraph
+from prescaling import (
+    MAX_SCHEDULED_ACTIONS,
+    Prescaling,
+    capacity_timeline,
+    format_timeline,
+    plan_changes,
+    repeats_weekly,
+)
+from run_leases import DEFAULT_LEASE_SECONDS, OVERLAP_POLICIES, SKIP
+from script_discovery import ScheduledScriptSpec
+from schedule_stagger import (
+    FlexibleSchedule,
+    format_histogram,
+    plan_stagger,
+    start_histogram,
+)
+from simulation_cache_stack import SimulationCacheStack
+from task_launcher_stack import TaskLauncherStack
+from task_metrics_stack import TaskMetricsStack
+from task_packing import (
+    MAX_STACK_RESOURCES,
+    MAX_STACK_TEMPLATE_BYTES,
+    legacy_stack_names,
+    plan_shards,
+)
+from work_queue import WorkQueueScaling
+from yearn_scheduled_task import (
+    INFRA_RUNTIME_PATH,
+    METRICS_RESOURCE_COUNT,
+    METRICS_TEMPLATE_BYTES,
+    ScheduledTask,
+    YearnScheduledTaskStack,
+    batch_scheduled_tasks,
+)
+
+HARVEST_BOT_SCHEDULE = {"minute": "20"}
+
+# Scripts passing `run_mode=SERVICE_RUN_MODE` to the scheduler decorator run
+# in the long running scheduler service instead of a task of their own
+TASK_RUN_MODE = "task"
+SERVICE_RUN_MODE = "service"
+
+RPC_PROXY_PORT = 8545
+
+
+def _depends_on(scheduled_script: ScheduledScriptSpec) -> List[str]:
+    depends_on = scheduled_script.options.get("depends_on") or []
+    if isinstance(depends_on, str):
+        return [depends_on]
+    return list(depends_on)
+
+
+def script_schedules(
+    scheduled_scripts: List[ScheduledScriptSpec], stagger_schedules: bool = False
+) -> Dict[str, CronSchedule]:
+    """
+    Cron schedules of the scripts started on one, keyed by script name.
+
+    Scripts declaring a `stagger_window` (in minutes) may start later than
+    their cron minute, which spreads out tasks that would otherwise all start
+    together. The harvest bot can't move but adds to the load. Scripts
+    passing `depends_on` start when their upstream jobs complete instead.
+    """
+    timed_scripts = [
+        scheduled_script
+        for scheduled_script in scheduled_scripts
+        if not _depends_on(scheduled_script)
+    ]
+    schedules = {}
+    for scheduled_script in timed_scripts:
+        try:
+            schedules[scheduled_script.script_name] = CronSchedule(
+                day=scheduled_script.day,
+                hour=scheduled_script.hour,
+                minute=scheduled_script.minute,
+                month=scheduled_script.month,
+                week_day=scheduled_script.week_day,
+                year=scheduled_script.year,
+            )
+        except ValueError as error:
+            raise ValueError(
+                f"Scheduled script `{scheduled_script.script_name}` has an invalid "
+                f"schedule: {error}"
+            ) from error
+    if stagger_schedules:
+        schedules.update(
+            plan_stagger(
+                [
+                    FlexibleSchedule(
+                        scheduled_script.script_name,
+                        schedules[scheduled_script.script_name],
+                        int(scheduled_script.options.get("stagger_window", 0)),
+                    )
+                    for scheduled_script in timed_scripts
+                ],
+                fixed_schedules=[CronSchedule(**HARVEST_BOT_SCHEDULE)],
+            )
+        )
+    return schedules
 
 
 class YearnHarvestBotInfraStack(cdk.Stack):
@@ -19,18 +147,30 @@ class YearnHarvestBotInfraStack(cdk.Stack):
         self,
         scope: cdk.Construct,
         construct_id: str,
-        vpc_id: str,
+        cluster: ecs.ICluster,
         log_group: logs.LogGroup,
+        rpc_proxy: Optional["RpcProxyStack"] = None,
+        shard_count: int = 1,
+        task_launcher: Optional[TaskLauncherStack] = None,
+        overlap: str = SKIP,
+        task_metrics: Optional[TaskMetricsStack] = None,
+        architecture: str = X86_64,
+        capacity: str = ON_DEMAND,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if shard_count < 1:
+            raise ValueError(
+                f"The harvest bot needs at least one shard, got {shard_count}."
+            )
+        if capacity not in CAPACITIES:
+            raise ValueError(
+                f"The harvest bot asks for capacity={capacity}, "
+                f"expected one of {', '.join(CAPACITIES)}."
+            )
+
         # The code that defines your stack goes here
-        self._vpc = ec2.Vpc.from_lookup(
-            self,
-            "VPCResource",
-            vpc_id=vpc_id,
-        )
         self._container_repository = ecr.Repository(self, "YearnHarvestBotRepository")
         self._container_repository.add_lifecycle_rule(
             tag_status=ecr.TagStatus.UNTAGGED, max_image_age=cdk.Duration.days(7)
@@ -73,10 +213,19 @@ class YearnHarvestBotInfraStack(cdk.Stack):
             "MINUTES": "20",
         }
 
+        # The bot reads its node from INFURA_NODE, point it at the proxy instead
+        if rpc_proxy:
+            self.add_dependency(rpc_proxy)
+            del container_secrets["INFURA_NODE"]
+            self._environment["INFURA_NODE"] = rpc_proxy.url
+
+        # Shard 0 runs with the task definition's environment, the other
+        # shards override SHARD_INDEX
+        if shard_count > 1:
+            self._environment.update(shard_environment(0, shard_count))
+
         # General ECS Cluster
-        self._yearn_harvest_bot_ecs_cluster = (
-            self._create_yearn_harvest_bot_ecs_cluster(self._vpc)
-        )
+        self._yearn_harvest_bot_ecs_cluster = cluster
 
         # All scheduled tasks:
         scheduled_tasks = [
@@ -100,12 +249,40 @@ class YearnHarvestBotInfraStack(cdk.Stack):
                     memory_limit_mib=4096,
                 ),
                 schedule=app_autoscaling.Schedule.cron(
-                    minute="20",
+                    **HARVEST_BOT_SCHEDULE
                 ),  # Every day at 4pm
                 platform_version=ecs.FargatePlatformVersion.LATEST,
                 subnet_selection=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+                # The launcher's rules start the bot instead, this one only
+                # keeps its task definition
+                enabled=False if task_launcher else None,
             )
         ]
+        # The bot's image comes from its own repository, `latest` has to be
+        # built for the architecture
+        apply_architecture(scheduled_tasks[0].task_definition, architecture)
+
+        if task_launcher or shard_count > 1:
+            self._schedule_harvest_bot_shards(
+                scheduled_tasks[0], shard_count, task_launcher, overlap, capacity
+            )
+        else:
+            apply_capacity(scheduled_tasks[0].event_rule, capacity)
+        if shard_count > 1:
+            self._report_harvest_bot_shards(scheduled_tasks[0].task_definition)
+
+        # The bot's image has no Python to run `task_metrics.py`, so it only
+        # gets the metrics of its stopped tasks
+        if task_metrics:
+            task_metrics.watch(
+                self,
+                self._yearn_harvest_bot_ecs_cluster,
+                [scheduled_tasks[0].task_definition],
+                "HarvestBot",
+            )
+            task_metrics.monitor(
+                self, "HarvestBot", runtime_alarm=cdk.Duration.minutes(45)
+            )
 
         # Permissions
         for scheduled_task in scheduled_tasks:
@@ -113,13 +290,128 @@ class YearnHarvestBotInfraStack(cdk.Stack):
                 scheduled_task.task_definition.obtain_execution_role()
             )
 
-    def _create_yearn_harvest_bot_ecs_cluster(self, vpc: ec2.IVpc):
-        return ecs.Cluster(
+    def _schedule_harvest_bot_shards(
+        self,
+        scheduled_task: ecs_patterns.ScheduledFargateTask,
+        shard_count: int,
+        task_launcher: Optional[TaskLauncherStack],
+        overlap: str,
+        capacity: str,
+    ) -> None:
+        """
+        Start every shard on the harvest bot's schedule, straight from the
+        rules or through the task launcher.
+        """
+        task_definition = scheduled_task.task_definition
+        container_name = task_definition.default_container.container_name
+        if task_launcher:
+            task_launcher.grant_launch(
+                self._yearn_harvest_bot_ecs_cluster, task_definition
+            )
+        for rule_index, shards in enumerate(rule_shards(shard_count)):
+            # The pattern's own rule already starts shard 0, unless the
+            # launcher starts every shard
+            rule = scheduled_task.event_rule
+            if task_launcher:
+                rule = events.Rule(
+                    self,
+                    f"HarvestBotLaunch{rule_index}Schedule",
+                    schedule=events.Schedule.cron(**HARVEST_BOT_SCHEDULE),
+                )
+            elif rule_index > 0:
+                rule = events.Rule(
+                    self,
+                    f"HarvestBotShards{rule_index}Schedule",
+                    schedule=events.Schedule.cron(**HARVEST_BOT_SCHEDULE),
+                )
+            for shard_index in shards:
+                environment = (
+                    shard_environment(shard_index, shard_count)
+                    if shard_count > 1
+                    else {}
+                )
+                if task_launcher:
+                    rule.add_target(
+                        task_launcher.target(
+                            shard_schedules(shard_count)[shard_index],
+                            self._yearn_harvest_bot_ecs_cluster,
+                            task_definition,
+                            container_overrides=[
+                                {
+                                    "name": container_name,
+                                    "environment": [
+                                        {"name": name, "value": value}
+                                        for name, value in environment.items()
+                                    ],
+                                }
+                            ],
+                            overlap=overlap,
+                            capacity=capacity,
+                        )
+                    )
+                    continue
+                if shard_index == 0:
+                    continue
+                rule.add_target(
+                    events_targets.EcsTask(
+                        cluster=self._yearn_harvest_bot_ecs_cluster,
+                        task_definition=task_definition,
+                        container_overrides=[
+                            events_targets.ContainerOverride(
+                                container_name=container_name,
+                                environment=[
+                                    events_targets.TaskEnvironmentVariable(
+                                        name=name, value=value
+                                    )
+                                    for name, value in environment.items()
+                                ],
+                            )
+                        ],
+                        platform_version=ecs.FargatePlatformVersion.LATEST,
+                        subnet_selection=ec2.SubnetSelection(
+                            subnet_type=ec2.SubnetType.PUBLIC
+                        ),
+                    )
+                )
+            if not task_launcher:
+                apply_capacity(rule, capacity, target_count=len(shards))
+
+    def _report_harvest_bot_shards(self, task_definition: ecs.TaskDefinition) -> None:
+        """Log the stopped event of each shard to report on completion."""
+        completions = logs.LogGroup(
             self,
-            "YearnHarvestBotCluster",
-            enable_fargate_capacity_providers=True,
-            vpc=vpc,
+            "HarvestBotShardCompletions",
+            retention=logs.RetentionDays.ONE_MONTH,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
         )
+        events.Rule(
+            self,
+            "HarvestBotShardStopped",
+            event_pattern=events.EventPattern(
+                source=["aws.ecs"],
+                detail_type=["ECS Task State Change"],
+                detail={
+                    "clusterArn": [self._yearn_harvest_bot_ecs_cluster.cluster_arn],
+                    "group": [f"family:{task_definition.family}"],
+                    "lastStatus": ["STOPPED"],
+                },
+            ),
+            targets=[events_targets.CloudWatchLogGroup(completions)],
+        )
+        for metric_name, pattern in (
+            ("ShardsSucceeded", "{ $.detail.containers[0].exitCode = 0 }"),
+            ("ShardsFailed", "{ $.detail.containers[0].exitCode != 0 }"),
+        ):
+            logs.MetricFilter(
+                self,
+                f"HarvestBot{metric_name}",
+                log_group=completions,
+                filter_pattern=logs.FilterPattern.literal(pattern),
+                metric_namespace="YearnHarvestBot",
+                metric_name=metric_name,
+                metric_value="1",
+                default_value=0,
+            )
 
 
 class SharedStack(cdk.Stack):
@@ -131,39 +423,267 @@ class SharedStack(cdk.Stack):
     def container_repo(self):
         return self._container_repository
 
-    def __init__(self, scope: cdk.Construct, construct_id: str, **kwargs) -> None:
+    @property
+    def vpc(self) -> ec2.IVpc:
+        return self._vpc
+
+    @property
+    def cluster(self) -> ecs.Cluster:
+        """Cluster every bot and scheduled script runs in."""
+        return self._cluster
+
+    @property
+    def builds_image(self) -> bool:
+        return self._image_context is not None
+
+    def container_image(self, architecture: str = X86_64) -> ecs.ContainerImage:
+        """
+        Image of the scheduled scripts and the services for `architecture`.
+        When it is built by the stack, tasks pull it by its content hash tag,
+        which never moves. Only the architectures asked for are built.
+        Otherwise `latest` has to be a multi-arch image.
+        """
+        if not self._image_context:
+            return ecs.ContainerImage.from_ecr_repository(
+                self._container_repository, "latest"
+            )
+        if architecture not in self._image_assets:
+            # Built by `cdk deploy` from a context staged by `container_image.py`
+            self._image_assets[architecture] = ecr_assets.DockerImageAsset(
+                self,
+                "YearnSimulationsImage"
+                + ("" if architecture == X86_64 else architecture.capitalize()),
+                directory=str(self._image_context),
+                build_args=(
+                    {"PLATFORM": IMAGE_PLATFORMS[architecture]}
+                    if architecture != X86_64
+                    else None
+                ),
+            )
+        return ecs.ContainerImage.from_docker_image_asset(
+            self._image_assets[architecture]
+        )
+
+    def __init__(
+        self,
+        scope: cdk.Construct,
+        construct_id: str,
+        vpc_id: str,
+        image_context: Optional[Path] = None,
+        container_insights: bool = False,
+        **kwargs,
+    ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         self._log_group = logs.LogGroup(
             self, "YearnBotsLogGroup", retention=logs.RetentionDays.ONE_MONTH
         )
 
+        # The only lookup of the app, see `lookup_cache.py` to keep it cached
+        self._vpc = ec2.Vpc.from_lookup(
+            self,
+            "VPCResource",
+            vpc_id=vpc_id,
+        )
+        self._cluster = ecs.Cluster(
+            self,
+            "YearnBotsCluster",
+            enable_fargate_capacity_providers=True,
+            # Scaling the simulator on its queue needs the running task count
+            # of the workers
+            container_insights=True if container_insights else None,
+            vpc=self._vpc,
+        )
+
         self._container_repository = ecr.Repository(self, "SimScheduledTasksRepository")
         self._container_repository.add_lifecycle_rule(
             tag_status=ecr.TagStatus.UNTAGGED, max_image_age=cdk.Duration.days(7)
         )
 
+        self._image_context = image_context
+        self._image_assets: Dict[str, ecr_assets.DockerImageAsset] = {}
+
+
+class RpcProxyStack(cdk.Stack):
+    @property
+    def url(self) -> str:
+        """Endpoint of the proxy for containers in the VPC."""
+        host = f"{self._service_name}.{self._namespace.namespace_name}"
+        return f"http://{host}:{RPC_PROXY_PORT}"
 
-class YearnSimScheduledTasksInfraStack(cdk.Stack):
     def __init__(
         self,
         scope: cdk.Construct,
         construct_id: str,
-        vpc_id: str,
+        cluster: ecs.ICluster,
         log_group: logs.LogGroup,
-        container_repo: ecr.Repository,
-        scheduled_scripts: Any,
+        container_image: Callable[[str], ecs.ContainerImage],
+        profile: Optional[FargateProfile] = None,
+        architecture: str = X86_64,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        # The code that defines your stack goes here
-        self._vpc = ec2.Vpc.from_lookup(
+        profile = profile or FargateProfile(
+            cpu=512, memory=1024, architecture=architecture
+        )
+        profile.validate("RpcProxyService")
+
+        self._vpc = cluster.vpc
+
+        self._secrets_manager = secrets.Secret(
             self,
-            "VPCResource",
-            vpc_id=vpc_id,
+            "RpcProxySecrets",
+            generate_secret_string=secrets.SecretStringGenerator(
+                secret_string_template=json.dumps(
+                    {
+                        "WEB3_INFURA_PROJECT_ID": "",
+                    }
+                ),
+                generate_string_key="password",  # Needed just to we can provision secrets manager with a template. Not used.
+            ),
+        )
+
+        # Containers find the proxy by name through Cloud Map
+        self._service_name = "rpc-proxy"
+        self._namespace = servicediscovery.PrivateDnsNamespace(
+            self, "RpcProxyNamespace", name="yearn.internal", vpc=self._vpc
         )
 
+        task_definition = profile.create_task_definition(self, "RpcProxyTaskDefinition")
+        container = task_definition.add_container(
+            "RpcProxyContainer",
+            image=container_image(profile.architecture),
+            logging=ecs.AwsLogDriver(
+                log_group=log_group,
+                stream_prefix="RpcProxy",
+                mode=ecs.AwsLogDriverMode.NON_BLOCKING,
+            ),
+            command=["python3", f"{INFRA_RUNTIME_PATH}/rpc_proxy.py"],
+            environment={
+                "RPC_PROXY_PORT": str(RPC_PROXY_PORT),
+            },
+            secrets={
+                "WEB3_INFURA_PROJECT_ID": ecs.Secret.from_secrets_manager(
+                    self._secrets_manager, "WEB3_INFURA_PROJECT_ID"
+                ),
+            },
+        )
+        container.add_port_mappings(ecs.PortMapping(container_port=RPC_PROXY_PORT))
+
+        security_group = ec2.SecurityGroup(self, "RpcProxySecurityGroup", vpc=self._vpc)
+        security_group.add_ingress_rule(
+            ec2.Peer.ipv4(self._vpc.vpc_cidr_block),
+            ec2.Port.tcp(RPC_PROXY_PORT),
+            "JSON-RPC from the bots in the VPC",
+        )
+
+        ecs.FargateService(
+            self,
+            "RpcProxyService",
+            # Named like its key in the `rightsizing.py` profiles, which
+            # Container Insights reports it under
+            service_name="RpcProxyService",
+            cluster=cluster,
+            task_definition=task_definition,
+            desired_count=1,
+            assign_public_ip=True,
+            security_groups=[security_group],
+            circuit_breaker=ecs.DeploymentCircuitBreaker(rollback=True),
+            # Every bot goes through the proxy, so keep it off spot
+            capacity_provider_strategies=[
+                ecs.CapacityProviderStrategy(capacity_provider="FARGATE", weight=1),
+            ],
+            cloud_map_options=ecs.CloudMapOptions(
+                name=self._service_name,
+                cloud_map_namespace=self._namespace,
+                dns_record_type=servicediscovery.DnsRecordType.A,
+                dns_ttl=cdk.Duration.seconds(10),
+            ),
+        )
+
+
+class YearnSimScheduledTasksInfraStack(cdk.Stack):
+    def __init__(
+        self,
+        scope: cdk.Construct,
+        construct_id: str,
+        cluster: ecs.ICluster,
+        log_group: logs.LogGroup,
+        container_image: Callable[[str], ecs.ContainerImage],
+        scheduled_scripts: List[ScheduledScriptSpec],
+        task_stack_count: int = 4,
+        profile_overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+        stagger_schedules: bool = False,
+        batch_workers: Optional[int] = None,
+        service_concurrency: int = 4,
+        rpc_proxy: Optional[RpcProxyStack] = None,
+        cache_volume: Optional[CacheVolumeStack] = None,
+        task_launcher: Optional[TaskLauncherStack] = None,
+        task_metrics: Optional[TaskMetricsStack] = None,
+        simulation_cache: Optional[SimulationCacheStack] = None,
+        harvest_shard_count: int = 1,
+        architecture: str = X86_64,
+        legacy_task_stacks: bool = False,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # The stacks every script had before they were packed import this
+        # stack's exports and still schedule their script, so they have to be
+        # deleted before this stack is deployed
+        if legacy_task_stacks:
+            stack_names = legacy_stack_names(
+                [scope.node.id for scope in self.node.scopes if scope.node.id],
+                [
+                    scheduled_script.script_name
+                    for scheduled_script in scheduled_scripts
+                ],
+            )
+            # `deploy_planner.py` refuses to plan a deploy while they are named
+            self.node.add_metadata(LEGACY_STACKS_METADATA, list(stack_names.values()))
+            cdk.Annotations.of(self).add_warning(
+                "Delete the ScheduledTask<script> stacks of the old layout that are "
+                "still deployed before deploying, they import exports this stack no "
+                "longer has and would run every script twice. Synth with "
+                "-c legacyTaskStacksDeleted=true once they are gone:\n"
+                + "\n".join(
+                    f"aws cloudformation delete-stack --stack-name {stack_name}"
+                    for stack_name in stack_names.values()
+                )
+            )
+
+        self._cache_volume = cache_volume
+        self._task_metrics = task_metrics
+        self._simulation_cache = simulation_cache
+
+        # Scripts passing `depends_on` start once the jobs they depend on
+        # completed rather than on their cron schedule, see `job_graph.py`
+        job_graph = JobGraph(
+            {
+                scheduled_script.script_name: _depends_on(scheduled_script)
+                for scheduled_script in scheduled_scripts
+            },
+            jobs=[
+                HARVEST_BOT_JOB,
+                *(
+                    scheduled_script.script_name
+                    for scheduled_script in scheduled_scripts
+                    if scheduled_script.options.get("run_mode", TASK_RUN_MODE)
+                    == TASK_RUN_MODE
+                ),
+            ],
+        )
+        job_graph.validate()
+        if job_graph.dependencies and not task_launcher:
+            raise ValueError(
+                "Scripts passing depends_on are started by the task launcher, "
+                "synth with -c runLeases=true: "
+                f"{', '.join(sorted(job_graph.dependencies))}"
+            )
+        pipelined = job_graph.pipelined
+
+        # The code that defines your stack goes here
         self._secrets_manager = secrets.Secret(
             self,
             "YearnSimScheduledTasksSecrets",
@@ -180,13 +700,18 @@ class YearnSimScheduledTasksInfraStack(cdk.Stack):
         )
 
         # General ECS Cluster
-        self._yearn_sim_tasks_ecs_cluster = self._create_yearn_sim_tasks_ecs_cluster(
-            self._vpc
-        )
+        self._yearn_sim_tasks_ecs_cluster = cluster
 
         base_environment = {
             "ENV": "PROD",
         }
+        if rpc_proxy:
+            self.add_dependency(rpc_proxy)
+            base_environment["WEB3_PROVIDER_URI"] = rpc_proxy.url
+        if cache_volume:
+            base_environment.update(cache_volume.cache_environment)
+        if simulation_cache:
+            base_environment.update(simulation_cache.cache_environment)
         base_container_secrets = {
             "INFURA_ID": ecs.Secret.from_secrets_manager(
                 self._secrets_manager, "INFURA_ID"
@@ -199,10 +724,61 @@ class YearnSimScheduledTasksInfraStack(cdk.Stack):
             ),
         }
 
+        schedules = script_schedules(scheduled_scripts, stagger_schedules)
+        cdk.Annotations.of(self).add_info(
+            format_histogram(
+                start_histogram(
+                    [*schedules.values(), CronSchedule(**HARVEST_BOT_SCHEDULE)]
+                )
+            )
+        )
+
         # All scheduled tasks:
         scheduled_tasks = []
+        service_jobs = []
+        service_secrets = base_container_secrets.copy()
+        profile_errors = []
         for scheduled_script in scheduled_scripts:
-            script_name = scheduled_script.script.__module__.split(".")[-1]
+            script_name = scheduled_script.script_name
+            run_mode = scheduled_script.options.get("run_mode", TASK_RUN_MODE)
+            if run_mode not in (TASK_RUN_MODE, SERVICE_RUN_MODE):
+                raise ValueError(
+                    f"Scheduled script `{script_name}` asks for run_mode={run_mode}, "
+                    f"expected {TASK_RUN_MODE} or {SERVICE_RUN_MODE}."
+                )
+            # Only the task launcher keeps runs from overlapping, the
+            # scheduler service always skips a run due while the last one goes
+            overlap = scheduled_script.options.get("overlap", SKIP)
+            if overlap not in OVERLAP_POLICIES:
+                raise ValueError(
+                    f"Scheduled script `{script_name}` asks for overlap={overlap}, "
+                    f"expected one of {', '.join(OVERLAP_POLICIES)}."
+                )
+            # Tasks of scripts passing `capacity="spot"` run on Fargate Spot,
+            # and are retried on FARGATE until `deadline` seconds after they
+            # were due when the launcher started them
+            capacity = scheduled_script.options.get("capacity", ON_DEMAND)
+            if capacity not in CAPACITIES:
+                raise ValueError(
+                    f"Scheduled script `{script_name}` asks for capacity={capacity}, "
+                    f"expected one of {', '.join(CAPACITIES)}."
+                )
+
+            # Scripts can ask for their own cpu, memory, ephemeral storage and
+            # architecture through the scheduler decorator, the architecture
+            # defaults to the stack's. Sizes measured by `rightsizing.py` take
+            # precedence.
+            profile = FargateProfile.from_options(
+                {
+                    **scheduled_script.options,
+                    **(profile_overrides or {}).get(script_name, {}),
+                },
+                default=FargateProfile(architecture=architecture),
+            )
+            try:
+                profile.validate(f"Scheduled script `{script_name}`")
+            except InvalidFargateProfile as error:
+                profile_errors.append(str(error))
 
             # Add any additional environment variables
             environment = base_environment.copy()
@@ -220,39 +796,223 @@ class YearnSimScheduledTasksInfraStack(cdk.Stack):
             }
             container_secrets.update(additional_container_secrets)
 
-            YearnScheduledTaskStack(
-                self,
-                f"ScheduledTask{script_name}",
-                script_name=script_name,
-                environment=environment,
-                secrets=container_secrets,
-                schedule=app_autoscaling.Schedule.cron(
-                    day=scheduled_script.day,
-                    hour=scheduled_script.hour,
-                    minute=scheduled_script.minute,
-                    month=scheduled_script.month,
-                    week_day=scheduled_script.week_day,
-                    year=scheduled_script.year,
+            if run_mode == SERVICE_RUN_MODE:
+                service_jobs.append(
+                    {
+                        "script": script_name,
+                        "cron": schedules[script_name].expression,
+                        "timeout": scheduled_script.options.get("timeout"),
+                        "environment": {
+                            name: value
+                            for name, value in environment.items()
+                            if base_environment.get(name) != value
+                        },
+                    }
+                )
+                service_secrets.update(additional_container_secrets)
+                continue
+
+            scheduled_tasks.append(
+                ScheduledTask(
+                    script_name=script_name,
+                    environment=environment,
+                    secrets=container_secrets,
+                    schedule=(
+                        app_autoscaling.Schedule.expression(
+                            schedules[script_name].expression
+                        )
+                        if script_name in schedules
+                        else None
+                    ),
+                    profile=profile,
+                    overlap=overlap,
+                    lease_seconds=int(
+                        scheduled_script.options.get("timeout") or DEFAULT_LEASE_SECONDS
+                    ),
+                    capacity=capacity,
+                    deadline_seconds=(
+                        int(scheduled_script.options["deadline"])
+                        if scheduled_script.options.get("deadline")
+                        else None
+                    ),
+                    after=[
+                        schedule
+                        for upstream in job_graph.dependencies.get(script_name, [])
+                        for schedule in (
+                            shard_schedules(harvest_shard_count)
+                            if upstream == HARVEST_BOT_JOB
+                            else [upstream]
+                        )
+                    ],
+                    pipelined=script_name in pipelined,
+                    timeout_seconds=(
+                        int(scheduled_script.options["timeout"])
+                        if scheduled_script.options.get("timeout")
+                        else None
+                    ),
+                )
+            )
+
+        # Report every invalid profile at once rather than one per synth
+        if profile_errors:
+            raise InvalidFargateProfile("\n".join(profile_errors))
+
+        spot_scripts = [
+            task.script_name for task in scheduled_tasks if task.capacity == SPOT
+        ]
+        if spot_scripts and not task_launcher:
+            cdk.Annotations.of(self).add_warning(
+                "Interrupted Spot runs are only retried with -c runLeases=true: "
+                + ", ".join(spot_scripts)
+            )
+
+        if service_jobs:
+            service_profile = FargateProfile.from_options(
+                (profile_overrides or {}).get("ScheduledScriptsService", {}),
+                default=FargateProfile(
+                    cpu=2048, memory=4096, architecture=architecture
                 ),
+            )
+            service_profile.validate("ScheduledScriptsService")
+            self._create_scheduled_scripts_service(
+                service_jobs,
+                service_profile,
+                service_concurrency,
+                base_environment,
+                service_secrets,
+                log_group,
+                container_image,
+            )
+
+        # Scripts sharing a schedule and a profile can run in a single task,
+        # which only pays the container start up once for all of them
+        if batch_workers:
+            scheduled_tasks = batch_scheduled_tasks(scheduled_tasks, batch_workers)
+
+        # Pack the tasks into a fixed number of stacks instead of one stack per
+        # script, so deploys don't grow with every new script.
+        tasks_by_name = {task.script_name: task for task in scheduled_tasks}
+        reserved_resources, reserved_bytes = 0, 0
+        if task_metrics:
+            reserved_resources, reserved_bytes = (
+                METRICS_RESOURCE_COUNT,
+                METRICS_TEMPLATE_BYTES,
+            )
+        shards = plan_shards(
+            [
+                task.packing_item(
+                    launched=task_launcher is not None,
+                    granted=bool(cache_volume or simulation_cache),
+                    monitored=task_metrics is not None,
+                )
+                for task in scheduled_tasks
+            ],
+            task_stack_count,
+            max_resources=MAX_STACK_RESOURCES - reserved_resources,
+            max_template_bytes=MAX_STACK_TEMPLATE_BYTES - reserved_bytes,
+        )
+        for shard in shards:
+            if not shard.items:
+                continue
+
+            shard_stack = YearnScheduledTaskStack(
+                self,
+                f"ScheduledTasks{shard.index}",
+                scheduled_tasks=[tasks_by_name[item.name] for item in shard.items],
                 log_group=log_group,
-                container_repo=container_repo,
+                container_image=container_image,
                 cluster=self._yearn_sim_tasks_ecs_cluster,
+                cache_volume=cache_volume,
+                task_launcher=task_launcher,
+                task_metrics=task_metrics,
+                simulation_cache=simulation_cache,
                 **kwargs,
             )
-
-        # Permissions
-        for scheduled_task in scheduled_tasks:
-            container_repo.grant_pull(
-                scheduled_task.task_definition.obtain_execution_role()
+            # The plan is an estimate, the stack knows its actual resources.
+            # `app.py` checks the template sizes once they are synthesized.
+            resource_count = sum(
+                isinstance(construct, cdk.CfnResource)
+                for construct in shard_stack.node.find_all()
             )
+            cdk.Annotations.of(shard_stack).add_info(
+                f"{len(shard.items)} scheduled tasks, {resource_count} resources "
+                f"(~{shard.resource_count + reserved_resources} estimated), "
+                f"~{(shard.template_bytes + reserved_bytes) // 1024} KiB template "
+                "estimated"
+            )
+            if resource_count > MAX_STACK_RESOURCES:
+                cdk.Annotations.of(shard_stack).add_warning(
+                    f"{resource_count} resources is over the budget of "
+                    f"{MAX_STACK_RESOURCES}, increase the number of scheduled task "
+                    "stacks."
+                )
 
-    def _create_yearn_sim_tasks_ecs_cluster(self, vpc: ec2.IVpc):
-        return ecs.Cluster(
+    def _create_scheduled_scripts_service(
+        self,
+        jobs: List[Dict[str, Any]],
+        profile: FargateProfile,
+        concurrency: int,
+        environment: Dict[str, str],
+        container_secrets: Dict[str, ecs.Secret],
+        log_group: logs.LogGroup,
+        container_image: Callable[[str], ecs.ContainerImage],
+    ):
+        # Runs `scheduler_service.py`, which keeps the brownie project loaded
+        # and starts the scripts on their schedule without a cold start each
+        task_definition = profile.create_task_definition(
+            self, "ScheduledScriptsServiceTaskDefinition"
+        )
+        command = ["python3", f"{INFRA_RUNTIME_PATH}/scheduler_service.py"]
+        if self._cache_volume:
+            command = self._cache_volume.wrap(command)
+        if self._task_metrics:
+            command = self._task_metrics.wrap(command, "ScheduledScriptsService")
+        container = task_definition.add_container(
+            "ScheduledScriptsServiceContainer",
+            image=container_image(profile.architecture),
+            logging=ecs.AwsLogDriver(
+                log_group=log_group,
+                stream_prefix="ScheduledScriptsService",
+                mode=ecs.AwsLogDriverMode.NON_BLOCKING,
+            ),
+            command=command,
+            environment={
+                **environment,
+                "SCHEDULED_JOBS": json.dumps(jobs, sort_keys=True),
+                "MAX_CONCURRENT_JOBS": str(concurrency),
+            },
+            secrets=container_secrets,
+        )
+        if self._cache_volume:
+            self._cache_volume.mount(task_definition, container)
+        if self._simulation_cache:
+            self._simulation_cache.grant(task_definition)
+
+        ecs.FargateService(
             self,
-            "YearnSimScheduledTasksCluster",
-            enable_fargate_capacity_providers=True,
-            vpc=vpc,
+            "ScheduledScriptsService",
+            cluster=self._yearn_sim_tasks_ecs_cluster,
+            task_definition=task_definition,
+            desired_count=1,
+            # Two schedulers would start every script twice, so stop the old
+            # task before starting the new one on deploys
+            min_healthy_percent=0,
+            max_healthy_percent=100,
+            assign_public_ip=True,
+            circuit_breaker=ecs.DeploymentCircuitBreaker(rollback=True),
+            # Not on spot, an interruption would skip every script due meanwhile
+            capacity_provider_strategies=[
+                ecs.CapacityProviderStrategy(capacity_provider="FARGATE", weight=1),
+            ],
+            enable_execute_command=True,
         )
+        if self._task_metrics:
+            self._task_metrics.watch(
+                self,
+                self._yearn_sim_tasks_ecs_cluster,
+                [task_definition],
+                "ScheduledScriptsService",
+            )
 
 
 class YearnSimulationsInfraStack(cdk.Stack):
@@ -260,20 +1020,58 @@ class YearnSimulationsInfraStack(cdk.Stack):
         self,
         scope: cdk.Construct,
         construct_id: str,
-        vpc_id: str,
+        cluster: ecs.ICluster,
         log_group: logs.LogGroup,
         container_repo: ecr.Repository,
+        container_image: Optional[Callable[[str], ecs.ContainerImage]] = None,
+        simulator_command: Optional[List[str]] = None,
+        arch_benchmark_command: Optional[List[str]] = None,
+        simulator_profile: Optional[FargateProfile] = None,
+        rpc_proxy: Optional[RpcProxyStack] = None,
+        cache_volume: Optional[CacheVolumeStack] = None,
+        work_queue: Optional[WorkQueueScaling] = None,
+        task_metrics: Optional[TaskMetricsStack] = None,
+        simulation_cache: Optional[SimulationCacheStack] = None,
+        prescaling: Optional[Prescaling] = None,
+        burst_schedules: Optional[List[CronSchedule]] = None,
+        architecture: str = X86_64,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        # The code that defines your stack goes here
-        self._vpc = ec2.Vpc.from_lookup(
-            self,
-            "VPCResource",
-            vpc_id=vpc_id,
+        self._cache_volume = cache_volume
+        self._task_metrics = task_metrics
+        self._simulation_cache = simulation_cache
+        self._work_queue = work_queue
+        self._prescaling = prescaling
+        self._burst_schedules = burst_schedules or []
+        self._container_image = container_image
+        self._simulator_command = simulator_command
+        self._environment = {
+            "ENVIRONMENT": "prod",
+        }
+        if rpc_proxy:
+            self.add_dependency(rpc_proxy)
+            self._environment["WEB3_PROVIDER_URI"] = rpc_proxy.url
+        if cache_volume:
+            self._environment.update(cache_volume.cache_environment)
+        if simulation_cache:
+            self._environment.update(simulation_cache.cache_environment)
+
+        self._simulator_profile = simulator_profile or FargateProfile(
+            cpu=1024, memory=2048, ephemeral_storage=21, architecture=architecture
         )
+        self._simulator_profile.validate("SimulatorBotService")
+
+        self._simulation_queue = None
+        if work_queue:
+            work_queue.validate()
+            self._simulation_queue = self._create_simulation_queue()
+            self._environment["SIMULATION_QUEUE_URL"] = self._simulation_queue.queue_url
+        if prescaling:
+            prescaling.validate()
 
+        # The code that defines your stack goes here
         self._secrets_manager = secrets.Secret(
             self,
             "YearnSimulationsSecrets",
@@ -292,9 +1090,7 @@ class YearnSimulationsInfraStack(cdk.Stack):
         )
 
         # General ECS Cluster
-        self._yearn_simulations_ecs_cluster = (
-            self._create_yearn_simulations_ecs_cluster(self._vpc)
-        )
+        self._yearn_simulations_ecs_cluster = cluster
 
         # Create Services
 
@@ -306,17 +1102,225 @@ class YearnSimulationsInfraStack(cdk.Stack):
             self._secrets_manager,
         )
 
-    def _create_yearn_simulations_ecs_cluster(self, vpc: ec2.IVpc):
-        return ecs.Cluster(
+        if arch_benchmark_command:
+            self._create_arch_benchmark_tasks(
+                self._yearn_simulations_ecs_cluster,
+                container_repo,
+                log_group,
+                self._secrets_manager,
+                arch_benchmark_command,
+            )
+
+    def _create_simulation_queue(self) -> sqs.Queue:
+        # Requests a worker dies on come back after the visibility timeout,
+        # the ones failing every time end up in the dead letter queue
+        dead_letter_queue = sqs.Queue(
             self,
-            "YearnSimulationsCluster",
-            enable_fargate_capacity_providers=True,
-            vpc=vpc,
+            "SimulationRequestsDeadLetterQueue",
+            retention_period=cdk.Duration.days(14),
+        )
+        queue = sqs.Queue(
+            self,
+            "SimulationRequests",
+            visibility_timeout=cdk.Duration.minutes(15),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                queue=dead_letter_queue, max_receive_count=3
+            ),
+        )
+        cdk.CfnOutput(self, "SimulationRequestsQueueUrl", value=queue.queue_url)
+        return queue
+
+    def _scale_on_backlog(
+        self,
+        service: ecs.FargateService,
+        scaling: ecs.ScalableTaskCount,
+        work_queue: WorkQueueScaling,
+    ) -> None:
+        """
+        Step scaling on the queued and in-flight requests per running worker,
+        the same policy `work_queue.simulate` replays locally.
+        """
+        queue = self._simulation_queue
+        period = cdk.Duration.minutes(1)
+        backlog = cloudwatch.MathExpression(
+            expression="FILL(visible, 0) + FILL(in_flight, 0)",
+            using_metrics={
+                "visible": queue.metric_approximate_number_of_messages_visible(
+                    period=period, statistic="Maximum"
+                ),
+                "in_flight": queue.metric_approximate_number_of_messages_not_visible(
+                    period=period, statistic="Maximum"
+                ),
+            },
+            period=period,
+        )
+        running = cloudwatch.Metric(
+            namespace="ECS/ContainerInsights",
+            metric_name="RunningTaskCount",
+            dimensions={
+                "ClusterName": service.cluster.cluster_name,
+                "ServiceName": service.service_name,
+            },
+            period=period,
+            statistic="Average",
+        )
+        # Without a running worker every request counts as a whole target,
+        # so the first one starts a worker
+        backlog_per_worker = cloudwatch.MathExpression(
+            expression=(
+                "IF(FILL(running, 0) > 0, backlog / FILL(running, 0), "
+                f"backlog * {work_queue.target_backlog})"
+            ),
+            using_metrics={"backlog": backlog, "running": running},
+            label="Backlog per worker",
+            period=period,
+        )
+
+        scaling.scale_on_metric(
+            "BacklogPerWorker",
+            metric=backlog_per_worker,
+            scaling_steps=[
+                app_autoscaling.ScalingInterval(
+                    change=step.change, lower=step.lower, upper=step.upper
+                )
+                for step in work_queue.steps
+            ],
+            adjustment_type=app_autoscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            cooldown=cdk.Duration.seconds(work_queue.cooldown),
+        )
+
+    def _prescale(
+        self,
+        scaling: ecs.ScalableTaskCount,
+        base: int,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        """
+        Scheduled actions raising the task count ahead of the minutes the
+        burst schedules start in, see `prescaling.py`. With `max_workers`
+        the backlog policy scales back in after a window, without it the
+        count is pinned for the window and put back to `base` after.
+        """
+        prescaling = self._prescaling
+        if max_workers is not None:
+            # The backlog policy can't go past its own maximum
+            prescaling = Prescaling(
+                prescaling.lead,
+                prescaling.hold,
+                prescaling.starts_per_task,
+                min(prescaling.max_tasks, max_workers),
+            )
+
+        weekly = []
+        for schedule in self._burst_schedules:
+            if repeats_weekly(schedule):
+                weekly.append(schedule)
+            else:
+                cdk.Annotations.of(self).add_warning(
+                    f"The simulator isn't scaled ahead of {schedule.expression}, "
+                    "only schedules repeating every week are planned for."
+                )
+        timeline = capacity_timeline(weekly, prescaling, base)
+        changes = plan_changes(timeline, base)
+        if len(changes) > MAX_SCHEDULED_ACTIONS:
+            raise ValueError(
+                "Scaling the simulator ahead of the scheduled tasks takes "
+                f"{len(changes)} scheduled actions, at most {MAX_SCHEDULED_ACTIONS} "
+                "are allowed. Raise -c simulatorPrescaleHold=... to merge nearby "
+                "windows."
+            )
+        cdk.Annotations.of(self).add_info(format_timeline(timeline, base))
+
+        for change in changes:
+            expression = change.schedule.expression
+            scaling.scale_on_schedule(
+                f"Prescale{change.capacity}Tasks"
+                + hashlib.sha256(expression.encode()).hexdigest()[:8],
+                schedule=app_autoscaling.Schedule.expression(expression),
+                min_capacity=change.capacity,
+                max_capacity=(
+                    max_workers if max_workers is not None else change.capacity
+                ),
+            )
+
+    def _simulator_secrets(
+        self, secrets_manager: secrets.Secret
+    ) -> Dict[str, ecs.Secret]:
+        return {
+            "TELEGRAM_BOT_KEY": ecs.Secret.from_secrets_manager(
+                secrets_manager, "TELEGRAM_BOT_KEY"
+            ),
+            "POLLER_KEY": ecs.Secret.from_secrets_manager(
+                secrets_manager, "POLLER_KEY"
+            ),
+            "TELEGRAM_YFI_HARVEST_SIMULATOR": ecs.Secret.from_secrets_manager(
+                secrets_manager, "TELEGRAM_YFI_HARVEST_SIMULATOR"
+            ),
+            "INFURA_ID": ecs.Secret.from_secrets_manager(secrets_manager, "INFURA_ID"),
+            "WEB3_INFURA_PROJECT_ID": ecs.Secret.from_secrets_manager(
+                secrets_manager, "WEB3_INFURA_PROJECT_ID"
+            ),
+        }
+
+    def _create_arch_benchmark_tasks(
+        self,
+        ecs_cluster: ecs.ICluster,
+        repository: ecr.Repository,
+        log_group: logs.LogGroup,
+        secrets_manager: secrets.Secret,
+        command: List[str],
+    ) -> None:
+        # The same simulation with the simulator's size on every architecture,
+        # started by `arch_benchmark.py`. Cached results would leave nothing
+        # to measure, so the benchmark runs without the simulation cache.
+        environment = dict(self._environment)
+        if self._simulation_cache:
+            for name in self._simulation_cache.cache_environment:
+                del environment[name]
+        for architecture, family in BENCHMARK_FAMILIES.items():
+            profile = FargateProfile(
+                cpu=self._simulator_profile.cpu,
+                memory=self._simulator_profile.memory,
+                ephemeral_storage=self._simulator_profile.ephemeral_storage,
+                architecture=architecture,
+            )
+            task_definition = profile.create_task_definition(
+                self,
+                f"ArchBenchmark{architecture.capitalize()}TaskDefinition",
+                family=family,
+            )
+            task_definition.add_container(
+                BENCHMARK_CONTAINER_NAME,
+                image=(
+                    self._container_image(architecture)
+                    if self._container_image
+                    else ecs.ContainerImage.from_ecr_repository(repository, "latest")
+                ),
+                command=command,
+                logging=ecs.AwsLogDriver(
+                    log_group=log_group,
+                    stream_prefix=f"ArchBenchmark{architecture.capitalize()}",
+                    mode=ecs.AwsLogDriverMode.NON_BLOCKING,
+                ),
+                environment=environment,
+                secrets=self._simulator_secrets(secrets_manager),
+            )
+            repository.grant_pull(task_definition.obtain_execution_role())
+
+        cdk.CfnOutput(self, "ArchBenchmarkCluster", value=ecs_cluster.cluster_name)
+        cdk.CfnOutput(
+            self,
+            "ArchBenchmarkSubnets",
+            value=",".join(
+                ecs_cluster.vpc.select_subnets(
+                    subnet_type=ec2.SubnetType.PUBLIC
+                ).subnet_ids
+            ),
         )
 
     def _create_simulator_bot_fargate_service(
         self,
-        ecs_cluster: ecs.Cluster,
+        ecs_cluster: ecs.ICluster,
         repository: ecr.Repository,
         log_group: logs.LogGroup,
         secrets_manager: secrets.Secret,
@@ -325,52 +1329,48 @@ class YearnSimulationsInfraStack(cdk.Stack):
         # Create a task definition and add a container to it
         # A limited set of values can be provided for `cpu` and `memory_limit`.
         # See documentation here: https://docs.aws.amazon.com/AmazonECS/latest/developerguide/task-cpu-memory-error.html
-        fargate_task_definition = ecs.FargateTaskDefinition(
-            self,
-            "SimulatorBotTaskDefinition",
-            cpu=1024,
-            memory_limit_mib=2048,
-            ephemeral_storage_gib=21,
+        fargate_task_definition = self._simulator_profile.create_task_definition(
+            self, "SimulatorBotTaskDefinition"
         )
+        desired_count = self._work_queue.min_workers if self._work_queue else 1
 
-        # During creation we'll just use the Amazon ECS sample image, but
-        # in practice, we will pull images from our ECR repository
-        fargate_task_definition.add_container(
+        # Until the bot's command is known we'll just use the Amazon ECS sample
+        # image, after that the image built from the workspace
+        image = ecs.ContainerImage.from_registry("amazon/amazon-ecs-sample")
+        command = None
+        if self._container_image and self._simulator_command:
+            image = self._container_image(self._simulator_profile.architecture)
+            command = self._simulator_command
+            if self._cache_volume:
+                command = self._cache_volume.wrap(command)
+            if self._task_metrics:
+                command = self._task_metrics.wrap(command, "SimulatorBot")
+        container = fargate_task_definition.add_container(
             "SimulatorBotContainer",
-            image=ecs.ContainerImage.from_registry("amazon/amazon-ecs-sample"),
+            image=image,
+            command=command,
             logging=ecs.AwsLogDriver(
                 log_group=log_group,
                 stream_prefix="SimulatorContainer",
                 mode=ecs.AwsLogDriverMode.NON_BLOCKING,
             ),
-            environment={
-                "ENVIRONMENT": "prod",
-            },
-            secrets={
-                "TELEGRAM_BOT_KEY": ecs.Secret.from_secrets_manager(
-                    secrets_manager, "TELEGRAM_BOT_KEY"
-                ),
-                "POLLER_KEY": ecs.Secret.from_secrets_manager(
-                    secrets_manager, "POLLER_KEY"
-                ),
-                "TELEGRAM_YFI_HARVEST_SIMULATOR": ecs.Secret.from_secrets_manager(
-                    secrets_manager, "TELEGRAM_YFI_HARVEST_SIMULATOR"
-                ),
-                "INFURA_ID": ecs.Secret.from_secrets_manager(
-                    secrets_manager, "INFURA_ID"
-                ),
-                "WEB3_INFURA_PROJECT_ID": ecs.Secret.from_secrets_manager(
-                    secrets_manager, "WEB3_INFURA_PROJECT_ID"
-                ),
-            },
+            environment=self._environment,
+            secrets=self._simulator_secrets(secrets_manager),
         )
+        if self._cache_volume:
+            self._cache_volume.mount(fargate_task_definition, container)
+        if self._simulation_cache:
+            self._simulation_cache.grant(fargate_task_definition)
 
-        ecs.FargateService(
+        service = ecs.FargateService(
             self,
             "SimulatorBotService",
+            # Named like its key in the `rightsizing.py` profiles, which
+            # Container Insights reports it under
+            service_name="SimulatorBotService",
             cluster=ecs_cluster,
             task_definition=fargate_task_definition,
-            desired_count=1,
+            desired_count=desired_count,
             assign_public_ip=True,
             circuit_breaker=ecs.DeploymentCircuitBreaker(rollback=True),
             capacity_provider_strategies=[
@@ -382,6 +1382,33 @@ class YearnSimulationsInfraStack(cdk.Stack):
             enable_execute_command=True,
         )
 
+        if self._work_queue:
+            self._simulation_queue.grant_consume_messages(
+                fargate_task_definition.task_role
+            )
+            # The bot queues the requests its poller picks up as well
+            self._simulation_queue.grant_send_messages(
+                fargate_task_definition.task_role
+            )
+            scaling = service.auto_scale_task_count(
+                min_capacity=self._work_queue.min_workers,
+                max_capacity=self._work_queue.max_workers,
+            )
+            self._scale_on_backlog(service, scaling, self._work_queue)
+            if self._prescaling:
+                self._prescale(scaling, desired_count, self._work_queue.max_workers)
+        elif self._prescaling:
+            scaling = service.auto_scale_task_count(
+                min_capacity=desired_count, max_capacity=self._prescaling.max_tasks
+            )
+            self._prescale(scaling, desired_count)
+
+        # The bot is a long running service, there is no runtime to alarm on
+        if self._task_metrics:
+            self._task_metrics.watch(
+                self, ecs_cluster, [fargate_task_definition], "SimulatorBot"
+            )
+
         # Permissions
 
         ## Grant pull permission to the task so we don't have to pass credentials around